@@ -3,12 +3,15 @@
 # Économie: /add_money • /remove_money • /crime • /robb • /blanchiment • /leaderboard
 # Inventaire: /add_armes • /remove_armes • /add_horse • /remove_horse • /add_property • /remove_property
 # Permis: /add_permit • /remove_permit
-# Outils: /sync
+# Outils: /sync • /diagnostic
 # Sessions RP: /session (embed + boutons + modale "retard", @everyone auto)
 
-import os, io, asyncio, mimetypes, json, time, random, math, zipfile
+import os, sys, io, re, asyncio, mimetypes, json, time, random, math, zipfile, copy, sqlite3, hashlib, signal, weakref, shutil
+import concurrent.futures, multiprocessing, bisect, tempfile, heapq
+from collections import OrderedDict, deque
+from urllib.parse import urlparse, parse_qs
 from typing import Optional, Dict, List, Tuple
-from datetime import datetime
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 PARIS_TZ = ZoneInfo("Europe/Paris")
@@ -31,9 +34,15 @@ BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
 ASSETS_DIR = os.path.join(BASE_DIR, "assets")
 CARDS_DIR  = os.path.join(BASE_DIR, "cards")
 PROFILES_DIR = os.path.join(BASE_DIR, "profiles")
+CARD_LAYERS_DIR = os.path.join(BASE_DIR, "card_layers")  # couches réutilisables des cartes (recalculables)
+PORTRAITS_DIR = os.path.join(BASE_DIR, "portraits")       # dernière photo de chaque joueur, déjà réduite
+SESSIONS_DIR = os.path.join(BASE_DIR, "sessions")         # état des sessions RP (survit aux redémarrages)
 os.makedirs(ASSETS_DIR, exist_ok=True)
 os.makedirs(CARDS_DIR,  exist_ok=True)
 os.makedirs(PROFILES_DIR, exist_ok=True)
+os.makedirs(CARD_LAYERS_DIR, exist_ok=True)
+os.makedirs(PORTRAITS_DIR, exist_ok=True)
+os.makedirs(SESSIONS_DIR, exist_ok=True)
 
 # ---------- Sauvegardes automatiques ----------
 # Salon #backup-louisiana
@@ -78,7 +87,9 @@ def _start_keepalive_if_needed():
 
     threading.Thread(target=_run, daemon=True).start()
 
-_start_keepalive_if_needed()
+# Uniquement dans le process principal (pas dans les workers du pool de rendu)
+if __name__ == "__main__":
+    _start_keepalive_if_needed()
 
 # ---------- Bot ----------
 intents = discord.Intents.default()
@@ -90,31 +101,391 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 def embed(t: str, d: str=""):
     return discord.Embed(title=t, description=d, color=discord.Color.dark_gold())
 
-# ---------- Tâche de sauvegarde automatique vers Discord ----------
+# ---------- Délestage : threads (E/S disque) & process (Pillow / zip) ----------
+# Tout ce qui bloque (lecture/écriture de fichiers, rendu d'images, compression)
+# part dans un pool pour ne pas figer la boucle d'événements de discord.py.
+IO_WORKERS  = int(os.getenv("IO_WORKERS", "4"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
 
-def build_backup_bytes() -> io.BytesIO:
-    """Crée un ZIP en mémoire avec les cartes + profils."""
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
-        for path in BACKUP_PATHS:
-            if not os.path.exists(path):
-                continue
-            if os.path.isdir(path):
-                for root, dirs, files in os.walk(path):
-                    for fname in files:
-                        full = os.path.join(root, fname)
-                        # on enregistre un chemin relatif propre dans le zip
-                        arcname = os.path.relpath(full, BASE_DIR)
-                        z.write(full, arcname)
+def _timed_call(fn, args: tuple, kwargs: dict):
+    """Exécuté dans le worker : renvoie (début, résultat, exception)."""
+    started_at = time.time()
+    try:
+        return started_at, fn(*args, **kwargs), None
+    except Exception as e:
+        return started_at, None, e
+
+def _cpu_worker_init():
+    # Les workers ignorent Ctrl+C / SIGTERM : c'est le process principal qui les arrête.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Polices des cartes chargées dès le démarrage du worker
+    _prewarm_card_fonts()
+
+class OffloadPool:
+    """
+    Pool borné (threads ou process) avec métriques : tâches en cours, file
+    d'attente estimée et temps d'attente avant exécution.
+    """
+    def __init__(self, name: str, kind: str, max_workers: int, max_pending: int = 256):
+        self.name = name
+        self.kind = kind  # "thread" | "process"
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._executor = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                ctx = multiprocessing.get_context("spawn")
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=ctx, initializer=_cpu_worker_init
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"{self.name}-"
+                )
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_pending)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            submitted_at = time.time()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            executor = self._get_executor()
+            try:
+                started_at, result, error = await loop.run_in_executor(
+                    executor, _timed_call, fn, args, kwargs
+                )
+            except concurrent.futures.BrokenExecutor:
+                # Pool cassé (worker tué...) : on le recrée au prochain appel,
+                # sauf si un autre appel l'a déjà remplacé entre-temps
+                self.failed += 1
+                if self._executor is executor:
+                    self.shutdown(wait=False)
+                raise
+            except Exception:
+                # Erreur propre à cet appel (pickling d'un argument ou du
+                # résultat...) : le pool reste sain et les autres tâches continuent
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+            waited = max(0.0, started_at - submitted_at)
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            self.run_total += max(0.0, time.time() - started_at)
+            if error is not None:
+                self.failed += 1
+                raise error
+            self.completed += 1
+            return result
+
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    def stats(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queued": self.queue_depth(),
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": (self.wait_total / done * 1000) if done else 0.0,
+            "max_wait_ms": self.wait_max * 1000,
+            "avg_run_ms": (self.run_total / done * 1000) if done else 0.0,
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+IO_POOL  = OffloadPool("io", "thread", IO_WORKERS)
+CPU_POOL = OffloadPool("cpu", "process", CPU_WORKERS, max_pending=64)
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _remove_if_exists(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+# ---------- Sauvegardes incrémentales ----------
+# backup_manifest.json garde, pour chaque fichier sauvegardé, [taille, mtime, sha256].
+# Chaque tour n'envoie que les fichiers modifiés et la liste des fichiers supprimés ;
+# une sauvegarde complète (point de reprise) part toutes les BACKUP_FULL_EVERY_HOURS heures.
+# Chaque archive embarque son manifeste (MANIFEST.json) : le dernier point de reprise
+# suivi de ses deltas suffit à reconstituer les dossiers.
+BACKUP_MANIFEST_PATH = os.path.join(BASE_DIR, "backup_manifest.json")
+BACKUP_ARCHIVE_MANIFEST = "MANIFEST.json"
+BACKUP_FULL_EVERY_HOURS = float(os.getenv("BACKUP_FULL_EVERY_HOURS", "24"))
+
+# Archives écrites en flux dans des fichiers temporaires (en mémoire jusqu'à
+# BACKUP_SPOOL_BYTES, sur disque au-delà), découpées en volumes ZIP autonomes
+# qui tiennent sous la limite d'envoi de Discord. Les formats déjà compressés
+# (PNG, WebP, JPEG...) sont stockés tels quels.
+BACKUP_VOLUME_MAX_BYTES = int(os.getenv("BACKUP_VOLUME_MAX_BYTES", str(9_500_000)))
+BACKUP_SPOOL_BYTES = 4 * 1024 * 1024
+BACKUP_STORED_EXTS = {".png", ".webp", ".jpg", ".jpeg", ".gif", ".zip"}
+# Bases SQLite : archivées depuis un instantané (API backup), jamais octet par octet
+# pendant que l'écriture différée peut valider une transaction
+BACKUP_SQLITE_EXTS = {".sqlite3", ".sqlite", ".db"}
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _iter_backup_files():
+    """(chemin relatif à BASE_DIR, chemin complet) de chaque fichier à sauvegarder."""
+    for path in BACKUP_PATHS:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for fname in files:
+                    if ".tmp" in fname or fname.endswith((".bak", ".corrupt")):  # écriture en cours, copies locales
+                        continue
+                    if fname.endswith(("-journal", "-wal", "-shm")):  # l'instantané SQLite suffit
+                        continue
+                    full = os.path.join(root, fname)
+                    yield os.path.relpath(full, BASE_DIR).replace(os.sep, "/"), full
+        elif os.path.exists(path):
+            yield os.path.relpath(path, BASE_DIR).replace(os.sep, "/"), path
+
+def scan_backup_files(previous: Dict[str, list]) -> Dict[str, list]:
+    """Manifeste actuel ; un fichier de même taille et même mtime n'est pas relu."""
+    files = {}
+    for rel, full in _iter_backup_files():
+        try:
+            st = os.stat(full)
+            prev = previous.get(rel)
+            if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+                files[rel] = prev
             else:
-                arcname = os.path.relpath(path, BASE_DIR)
-                z.write(path, arcname)
-    buf.seek(0)
-    return buf
+                files[rel] = [st.st_size, st.st_mtime_ns, _file_sha256(full)]
+        except OSError:
+            continue
+    return files
+
+def load_backup_manifest() -> dict:
+    try:
+        with open(BACKUP_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_backup_manifest(state: dict) -> None:
+    raw = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+    _replace_file(BACKUP_MANIFEST_PATH, lambda tmp: _write_bytes(tmp, raw.encode("utf-8")))
+
+def plan_backup(full: bool = False) -> Optional[dict]:
+    """
+    Compare le disque au dernier manifeste envoyé.
+    Renvoie None si rien n'a changé, sinon le plan de l'archive (complète ou delta).
+    """
+    state = load_backup_manifest()
+    previous = state.get("files") or {}
+    files = scan_backup_files(previous)
+    now = datetime.utcnow()
+    last_full = state.get("last_full")
+    if not last_full or now - datetime.fromisoformat(last_full) >= timedelta(hours=BACKUP_FULL_EVERY_HOURS):
+        full = True
+
+    if full:
+        changed, deleted = sorted(files), []
+    else:
+        changed = sorted(rel for rel, meta in files.items() if (previous.get(rel) or [None] * 3)[2] != meta[2])
+        deleted = sorted(set(previous) - set(files))
+        if not changed and not deleted:
+            # seules des dates ont bougé : on les retient pour ne pas tout rehacher au prochain tour
+            if files != previous:
+                save_backup_manifest({**state, "files": files})
+            return None
+
+    ts = now.strftime("%Y-%m-%d_%H-%M")
+    return {
+        "kind": "full" if full else "delta",
+        "id": ts,
+        "created": now.isoformat(timespec="seconds"),
+        "checkpoint": ts if full else state.get("checkpoint"),
+        "seq": 0 if full else int(state.get("seq", 0)) + 1,
+        "previous": None if full else state.get("last_id"),
+        "changed": changed,
+        "deleted": deleted,
+        "files": files,
+    }
+
+def _zip_entry_overhead(rel: str) -> int:
+    # en-tête local + descripteur de données + entrée du répertoire central
+    return 30 + 16 + 46 + 2 * len(rel.encode("utf-8"))
+
+def _sqlite_snapshot(path: str) -> str:
+    """Copie cohérente d'une base SQLite dans un fichier temporaire (à supprimer par l'appelant)."""
+    fd, tmp = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(fd)
+    try:
+        with _PROFILE_PERSIST_LOCK:
+            src = sqlite3.connect(path)
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+    except BaseException:
+        _remove_if_exists(tmp)
+        raise
+    return tmp
+
+def build_backup_volumes(plan: dict) -> Tuple[list, dict]:
+    """
+    Écrit le plan en volumes ZIP (fichiers temporaires, rembobinés) dans un thread.
+    Les empreintes sont calculées sur les octets réellement archivés (un fichier
+    peut changer entre le scan et l'archive) ; MANIFEST.json termine le dernier volume.
+    """
+    files = plan["files"]
+    volumes = []
+    fp = tempfile.SpooledTemporaryFile(max_size=BACKUP_SPOOL_BYTES)
+    z = zipfile.ZipFile(fp, "w", zipfile.ZIP_DEFLATED)
+    directory = 22
+    written = []
+
+    def _next_volume():
+        nonlocal fp, z, directory
+        z.close()
+        volumes.append(fp)
+        fp = tempfile.SpooledTemporaryFile(max_size=BACKUP_SPOOL_BYTES)
+        z = zipfile.ZipFile(fp, "w", zipfile.ZIP_DEFLATED)
+        directory = 22
+
+    try:
+        for rel in plan["changed"]:
+            full = os.path.join(BASE_DIR, rel)
+            ext = os.path.splitext(rel)[1].lower()
+            snapshot = None
+            try:
+                live = os.stat(full)
+                if ext in BACKUP_SQLITE_EXTS:
+                    snapshot = _sqlite_snapshot(full)
+                src = open(snapshot or full, "rb")
+            except (OSError, sqlite3.Error):
+                if snapshot:
+                    _remove_if_exists(snapshot)
+                files.pop(rel, None)
+                continue
+            try:
+                with src:
+                    st = os.fstat(src.fileno())
+                    if z.namelist() and fp.tell() + directory + st.st_size + _zip_entry_overhead(rel) > BACKUP_VOLUME_MAX_BYTES:
+                        _next_volume()
+                    info = zipfile.ZipInfo.from_file(snapshot or full, rel)
+                    info.compress_type = zipfile.ZIP_STORED if ext in BACKUP_STORED_EXTS else zipfile.ZIP_DEFLATED
+                    h = hashlib.sha256()
+                    with z.open(info, "w") as dst:
+                        for chunk in iter(lambda: src.read(1 << 20), b""):
+                            h.update(chunk)
+                            dst.write(chunk)
+            finally:
+                if snapshot:
+                    _remove_if_exists(snapshot)
+            # taille et date du fichier en service (détection des changements), empreinte de l'archivé
+            files[rel] = [live.st_size, live.st_mtime_ns, h.hexdigest()]
+            directory += 46 + len(rel.encode("utf-8"))
+            written.append(rel)
+
+        plan["changed"] = written
+        raw = json.dumps(plan, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if z.namelist() and fp.tell() + directory + len(raw) + _zip_entry_overhead(BACKUP_ARCHIVE_MANIFEST) > BACKUP_VOLUME_MAX_BYTES:
+            _next_volume()
+        plan["volumes"] = len(volumes) + 1
+        raw = json.dumps(plan, ensure_ascii=False, separators=(",", ":"))
+        z.writestr(BACKUP_ARCHIVE_MANIFEST, raw)
+        z.close()
+        volumes.append(fp)
+    except BaseException:
+        z.close()
+        fp.close()
+        for v in volumes:
+            v.close()
+        raise
+
+    for v in volumes:
+        v.seek(0)
+    return volumes, plan
+
+def commit_backup(plan: dict) -> None:
+    """Retient le plan comme dernière sauvegarde envoyée (appelé après l'envoi)."""
+    state = load_backup_manifest()
+    state.update({
+        "files": plan["files"],
+        "checkpoint": plan["checkpoint"],
+        "seq": plan["seq"],
+        "last_id": plan["id"],
+    })
+    if plan["kind"] == "full":
+        state["last_full"] = plan["created"]
+    save_backup_manifest(state)
+
+BACKUP_STATS = {"full": 0, "delta": 0, "skipped": 0, "volumes": 0, "bytes": 0, "last": None}
+_BACKUP_LOCK = asyncio.Lock()
+
+async def run_backup(channel, header: str, full: bool = False) -> Optional[dict]:
+    """Sauvegarde (complète ou delta) vers `channel`. Renvoie le plan envoyé, None si rien à envoyer."""
+    async with _BACKUP_LOCK:
+        await IO_POOL.run(flush_profiles)
+        plan = await IO_POOL.run(plan_backup, full)
+        if plan is None:
+            BACKUP_STATS["skipped"] += 1
+            return None
+        volumes, plan = await IO_POOL.run(build_backup_volumes, plan)
+        if plan["kind"] == "full":
+            detail = f"complète : {len(plan['changed'])} fichier(s)"
+        else:
+            detail = (f"delta n°{plan['seq']} depuis {plan['checkpoint']} : "
+                      f"{len(plan['changed'])} modifié(s), {len(plan['deleted'])} supprimé(s)")
+        name = f"backup_red_louisiana_{plan['id']}_{plan['kind']}{plan['seq'] or ''}"
+        total = len(volumes)
+        size = 0
+        try:
+            for i, fp in enumerate(volumes, start=1):
+                size += fp.seek(0, os.SEEK_END)
+                fp.seek(0)
+                part = f"_part{i}of{total}" if total > 1 else ""
+                content = f"{header} — {plan['id']} (UTC) • {detail}" if i == 1 else f"↳ {name} — volume {i}/{total}"
+                await channel.send(
+                    content=content,
+                    file=discord.File(fp, filename=f"{name}{part}.zip"),
+                    allowed_mentions=discord.AllowedMentions.none(),
+                )
+        finally:
+            for fp in volumes:
+                fp.close()
+        await IO_POOL.run(commit_backup, plan)
+        BACKUP_STATS[plan["kind"]] += 1
+        BACKUP_STATS["volumes"] += total
+        BACKUP_STATS["bytes"] += size
+        BACKUP_STATS["last"] = plan["id"]
+        return plan
 
 @tasks.loop(minutes=60)  # une sauvegarde toutes les heures
 async def auto_backup():
-    """Envoie régulièrement un ZIP des données dans #backup-louisiana."""
+    """Envoie régulièrement les changements des données dans #backup-louisiana."""
     if BACKUP_CHANNEL_ID == 0:
         return
 
@@ -123,18 +494,157 @@ async def auto_backup():
         # si le cache n'est pas encore prêt, on attend le prochain tour
         return
 
-    buf = build_backup_bytes()
-    ts = datetime.utcnow().strftime("%Y-%m-%d_%H-%M")
-    await channel.send(
-        content=f"Backup automatique Red Louisiana — {ts} (UTC)",
-        file=discord.File(buf, filename=f"backup_red_louisiana_{ts}.zip"),
-        allowed_mentions=discord.AllowedMentions.none(),
-    )
+    await run_backup(channel, "Backup automatique Red Louisiana")
 
 @auto_backup.before_loop
 async def before_auto_backup():
     await bot.wait_until_ready()
 
+# ---------- Logos des embeds : envoyés une seule fois ----------
+# banque.png, Police.png et armoiries.png sont lus en mémoire au démarrage puis
+# envoyés une fois dans le salon ASSET_CACHE_CHANNEL_ID ; les embeds pointent
+# ensuite vers l'URL de cette pièce jointe (plus de fichier joint à chaque message).
+# Les URL du CDN Discord expirent : on les rafraîchit en relisant le message,
+# et on ne renvoie le fichier que si ce message a disparu.
+ASSET_CACHE_CHANNEL_ID = int(os.getenv("ASSET_CACHE_CHANNEL_ID", "0") or 0)
+ASSET_REGISTRY_PATH = os.path.join(BASE_DIR, "asset_registry.json")
+
+# nom -> (fichier dans assets/, nom de la pièce jointe)
+EMBED_ASSETS = {
+    "banque":    ("banque.png", "banque.png"),
+    "police":    ("Police.png", "police.png"),
+    "armoiries": ("armoiries.png", "armoiries.png"),
+}
+
+class AssetRegistry:
+    def __init__(self, files: Dict[str, Tuple[str, str]]):
+        self.files = files
+        self._data: Dict[str, bytes] = {}
+        self._sha: Dict[str, str] = {}
+        self._urls: Dict[str, dict] = {}
+        self.url_hits = 0
+        self.file_fallbacks = 0
+        self.uploads = 0
+        self.refreshes = 0
+
+    def load(self) -> int:
+        """Lit les logos en mémoire et les URL déjà connues. Renvoie le nombre de logos chargés."""
+        for name, (fname, _) in self.files.items():
+            path = os.path.join(ASSETS_DIR, fname)
+            try:
+                with open(path, "rb") as f:
+                    self._data[name] = f.read()
+                self._sha[name] = hashlib.sha256(self._data[name]).hexdigest()
+            except OSError:
+                continue
+        try:
+            with open(ASSET_REGISTRY_PATH, "r", encoding="utf-8") as f:
+                self._urls = json.load(f)
+        except Exception:
+            self._urls = {}
+        return len(self._data)
+
+    def _save(self) -> None:
+        def _write(tmp: str):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._urls, f, indent=2)
+        _replace_file(ASSET_REGISTRY_PATH, _write)
+
+    @staticmethod
+    def _expires_at(url: str) -> float:
+        # Les URL signées portent ?ex=<timestamp hexadécimal>
+        try:
+            return float(int(parse_qs(urlparse(url).query)["ex"][0], 16))
+        except Exception:
+            return float("inf")
+
+    def _url(self, name: str, margin: float = 600) -> Optional[str]:
+        entry = self._urls.get(name)
+        if not entry or entry.get("sha") != self._sha.get(name):
+            return None
+        if self._expires_at(entry["url"]) - time.time() < margin:
+            return None
+        return entry["url"]
+
+    def get_bytes(self, name: str) -> Optional[bytes]:
+        return self._data.get(name)
+
+    def attach(self, name: str, emb: discord.Embed, filename: Optional[str] = None) -> Optional[discord.File]:
+        """
+        Met le logo en miniature de l'embed. Renvoie None si l'URL en cache suffit,
+        sinon le fichier (depuis la mémoire) à joindre au message.
+        """
+        url = self._url(name)
+        if url:
+            emb.set_thumbnail(url=url)
+            self.url_hits += 1
+            return None
+        data = self._data.get(name)
+        if data is None:
+            return None
+        fname = filename or self.files[name][1]
+        emb.set_thumbnail(url=f"attachment://{fname}")
+        self.file_fallbacks += 1
+        return discord.File(io.BytesIO(data), filename=fname)
+
+    async def refresh(self, client: discord.Client) -> None:
+        """Envoie les logos absents du salon de cache et renouvelle les URL bientôt expirées."""
+        if not ASSET_CACHE_CHANNEL_ID:
+            return
+        channel = client.get_channel(ASSET_CACHE_CHANNEL_ID)
+        if channel is None:
+            try:
+                channel = await client.fetch_channel(ASSET_CACHE_CHANNEL_ID)
+            except Exception as e:
+                print("[ASSETS][ERREUR] Salon de cache introuvable :", e)
+                return
+        changed = False
+        for name, data in self._data.items():
+            if self._url(name, margin=2 * 3600):
+                continue
+            entry = self._urls.get(name) or {}
+            msg = None
+            if entry.get("sha") == self._sha[name] and entry.get("message_id"):
+                try:
+                    msg = await channel.fetch_message(entry["message_id"])
+                    self.refreshes += 1
+                except Exception:
+                    msg = None
+            if msg is None or not msg.attachments:
+                try:
+                    msg = await channel.send(
+                        content=f"Logo `{name}` (cache du bot, ne pas supprimer)",
+                        file=discord.File(io.BytesIO(data), filename=self.files[name][1])
+                    )
+                    self.uploads += 1
+                except Exception as e:
+                    print(f"[ASSETS][ERREUR] Envoi de {name} : {e}")
+                    continue
+            self._urls[name] = {"sha": self._sha[name], "url": msg.attachments[0].url, "message_id": msg.id}
+            changed = True
+        if changed:
+            await IO_POOL.run(self._save)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": len(self._data),
+            "cached_urls": sum(1 for n in self._data if self._url(n)),
+            "url_hits": self.url_hits,
+            "file_fallbacks": self.file_fallbacks,
+            "uploads": self.uploads,
+            "refreshes": self.refreshes,
+        }
+
+ASSETS = AssetRegistry(EMBED_ASSETS)
+
+@tasks.loop(hours=1)
+async def asset_refresher():
+    await ASSETS.refresh(bot)
+
+@asset_refresher.before_loop
+async def before_asset_refresher():
+    await bot.wait_until_ready()
+
 # ---------- Paramètres carte ----------
 CANVAS_W, CANVAS_H = 1600, 1000
 THEMES = {
@@ -164,13 +674,29 @@ LAYOUT = {
 }
 
 # ---------- Fonts ----------
-def _font(size: int) -> "ImageFont.FreeTypeFont":
+# Chaque (fichier, taille) n'est lu qu'une fois par process ; les objets police
+# sont réutilisés d'une carte à l'autre.
+_FONT_CACHE: Dict[Tuple[str, int], "ImageFont.FreeTypeFont"] = {}
+
+def _font(size: int, path: str = FONT_PATH) -> "ImageFont.FreeTypeFont":
     if not PIL_AVAILABLE:
         return ImageFont.load_default()
-    try:
-        return ImageFont.truetype(FONT_PATH, size)
-    except Exception:
-        return ImageFont.load_default()
+    key = (path, int(size))
+    font = _FONT_CACHE.get(key)
+    if font is None:
+        try:
+            font = ImageFont.truetype(path, size)
+        except Exception:
+            font = ImageFont.load_default()
+        _FONT_CACHE[key] = font
+    return font
+
+def _prewarm_card_fonts() -> int:
+    """Charge toutes les tailles de police du LAYOUT. Renvoie le nombre de polices en cache."""
+    for key, value in LAYOUT.items():
+        if key.startswith("font_"):
+            _font(value)
+    return len(_FONT_CACHE)
 
 # ---------- Cartes : helpers dessin ----------
 def _draw_parchment(draw: "ImageDraw.ImageDraw", theme: dict, W: int, H: int):
@@ -197,8 +723,91 @@ def _paste_with_opacity(bg: "Image.Image", overlay: "Image.Image", x: int, y: in
         overlay.putalpha(a)
     bg.paste(overlay, (x, y), overlay)
 
-def _compose_id_card(data: dict, style_name: str="classique") -> "Image.Image":
-    theme = THEMES.get(style_name, THEMES["classique"])
+# ---------- Cartes : photo décodée en mémoire ----------
+# Au-delà de ce nombre de pixels, la photo est refusée (lecture de l'en-tête seulement).
+PHOTO_MAX_PIXELS = int(os.getenv("PHOTO_MAX_PIXELS", str(40_000_000)))
+
+class PhotoTooLarge(ValueError):
+    pass
+
+class PhotoInvalid(ValueError):
+    pass
+
+# Erreurs de décodage d'une photo envoyée (UnidentifiedImageError est une OSError)
+PHOTO_DECODE_ERRORS = (OSError, ValueError, SyntaxError, EOFError) + (
+    (Image.DecompressionBombError,) if PIL_AVAILABLE else ()
+)
+
+def _photo_pixels(photo_bytes: bytes) -> Optional[int]:
+    """
+    Nombre de pixels d'après l'en-tête (sans décoder l'image) ; None si illisible.
+    Lève PhotoTooLarge si Pillow refuse déjà l'en-tête (bombe de décompression).
+    """
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        with Image.open(io.BytesIO(photo_bytes)) as im:
+            return im.width * im.height
+    except Image.DecompressionBombError as e:
+        raise PhotoTooLarge() from e
+    except Exception:
+        return None
+
+def _load_photo(photo_bytes: bytes, w: int, h: int) -> "Image.Image":
+    """
+    Décode la photo depuis la mémoire, déjà rapprochée de la taille du cadre (w×h) :
+    mode draft pour les JPEG, puis réduction entière rapide avant le LANCZOS final.
+    """
+    src = Image.open(io.BytesIO(photo_bytes))
+    if src.width * src.height > PHOTO_MAX_PIXELS:
+        raise ValueError("photo trop grande")
+    scale = max(w / src.width, h / src.height)
+    need_w, need_h = int(src.width * scale) + 1, int(src.height * scale) + 1
+    if src.format == "JPEG":
+        src.draft("RGB", (need_w, need_h))
+    elif src.mode not in ("RGB", "RGBA", "L", "LA"):
+        # reduce() refuse les modes P, 1, I;16… : conversion d'abord
+        src = src.convert("RGBA")
+    # Pré-réduction : on garde au moins 2× la taille finale pour la qualité du LANCZOS
+    factor = int(min(src.width / (2 * need_w), src.height / (2 * need_h)))
+    if factor >= 2:
+        src = src.reduce(factor)
+    return src.convert("RGBA")
+
+def prepare_portrait(photo_bytes: bytes) -> bytes:
+    """
+    Réduit la photo à la taille « cover » du cadre photo et la renvoie en PNG (pool CPU).
+    Le rendu de la carte à partir de ce portrait est identique au rendu depuis l'original.
+    """
+    if not PIL_AVAILABLE:
+        raise RuntimeError("Pillow n'est pas installé (pip install Pillow).")
+    _, _, pw, ph = LAYOUT["photo_box"]
+    src = _load_photo(photo_bytes, pw, ph)
+    scale = max(pw / src.width, ph / src.height)
+    src = src.resize((int(src.width * scale), int(src.height * scale)), Image.LANCZOS)
+    bio = io.BytesIO(); src.save(bio, "PNG")
+    return bio.getvalue()
+
+# ---------- Cartes : fond statique (cache par thème) ----------
+# Parchemin, cadres, armoiries, titres et libellés ne changent jamais d'une carte
+# à l'autre : on les compose une fois par (thème, layout) et on repart d'une copie.
+# Le cache est invalidé si armoiries.png ou la police changent sur disque.
+_CARD_BG_CACHE: Dict[Tuple[str, str], Tuple[tuple, "Image.Image"]] = {}
+
+def _card_assets_signature() -> tuple:
+    sig = []
+    for path in (WM_PATH, FONT_PATH):
+        try:
+            sig.append(os.path.getmtime(path))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+def _card_layout_key() -> str:
+    raw = repr((CANVAS_W, CANVAS_H, WM_OPACITY, sorted(LAYOUT.items())))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def _render_card_background(theme: dict) -> "Image.Image":
     W, H = CANVAS_W, CANVAS_H
     from PIL import Image, ImageDraw  # sûreté
     img = Image.new("RGBA", (W, H), theme["parchment"])
@@ -245,36 +854,62 @@ def _compose_id_card(data: dict, style_name: str="classique") -> "Image.Image":
         draw.text((LAYOUT["labels_x"], y), lab, fill=theme["ink"], font=fl)
         y += LAYOUT["row_step"]
 
-    # Valeurs
-    fv = _font(LAYOUT["font_value"])
-    values = [
-        data.get("prenom", "—"),
-        data.get("nom", "—"),
-        data.get("titres", "—"),
-        data.get("genre", "—"),
-        data.get("date_naissance", "—"),
-        data.get("lieu_naissance", "—"),
-        data.get("nationalite", "—"),
-    ]
-    y = LAYOUT["first_row_y"]
-    for val in values:
-        draw.text((LAYOUT["values_x"], y), str(val), fill=theme["ink"], font=fv)
-        y += LAYOUT["row_step"]
+    return img
+
+def _card_background(style_name: str, box: Optional[Tuple[int, int, int, int]] = None) -> "Image.Image":
+    """Copie du fond pré-composé du thème (ou d'une zone `box`), recomposé si le layout ou un asset a changé."""
+    name = style_name if style_name in THEMES else "classique"
+    key = (name, _card_layout_key())
+    sig = _card_assets_signature()
+    cached = _CARD_BG_CACHE.get(key)
+    if cached is None or cached[0] != sig:
+        cached = (sig, _render_card_background(THEMES[name]))
+        _CARD_BG_CACHE[key] = cached
+    return cached[1].crop(box) if box else cached[1].copy()
+
+# ---------- Cartes : couches (portrait, identité, métier) ----------
+# Chaque couche occupe sa propre zone de la carte (zones disjointes) et se dessine
+# sur le fond du thème, découpé à cette zone. Une carte = fond + couches collées :
+# on peut donc ne redessiner qu'une couche et réutiliser les autres.
+CARD_IDENTITY_FIELDS = ("prenom", "nom", "titres", "genre", "date_naissance", "lieu_naissance", "nationalite")
+# Champs imprimés sur la carte (tout le reste du profil n'influence pas le rendu)
+CARD_FIELDS = CARD_IDENTITY_FIELDS + ("metier",)
+CARD_LAYER_NAMES = ("portrait", "identity", "job")
+
+def _card_regions() -> Dict[str, Tuple[int, int, int, int]]:
+    px, py, pw, ph = LAYOUT["photo_box"]
+    s = LAYOUT["sign"]
+    return {
+        "portrait": (px, py, px + pw, py + ph),
+        "identity": (LAYOUT["values_x"] - 10, LAYOUT["first_row_y"] - 20, px - 10, CANVAS_H - LAYOUT["margin"] - 5),
+        "job":      (s["x"], s["y"], s["x"] + s["w"] + 1, s["y"] + s["h"] + 1),
+    }
 
-    # Photo
-    photo_path = data.get("photo_path")
-    if photo_path and os.path.exists(photo_path):
+def _draw_portrait_layer(img: "Image.Image", theme: dict, data: dict, ox: int, oy: int):
+    px, py, pw, ph = LAYOUT["photo_box"]
+    photo_bytes = data.get("photo_bytes")
+    if photo_bytes:
         try:
-            src = Image.open(photo_path).convert("RGBA")
-            _paste_cover(img, src, px, py, pw, ph)
+            src = _load_photo(photo_bytes, pw, ph)
+            _paste_cover(img, src, px - ox, py - oy, pw, ph)
         except Exception:
             pass
 
-    # Métier
+def _draw_identity_layer(img: "Image.Image", theme: dict, data: dict, ox: int, oy: int):
+    draw = ImageDraw.Draw(img)
+    fv = _font(LAYOUT["font_value"])
+    y = LAYOUT["first_row_y"]
+    for key in CARD_IDENTITY_FIELDS:
+        draw.text((LAYOUT["values_x"] - ox, y - oy), str(data.get(key, "—")), fill=theme["ink"], font=fv)
+        y += LAYOUT["row_step"]
+
+def _draw_job_layer(img: "Image.Image", theme: dict, data: dict, ox: int, oy: int):
+    draw = ImageDraw.Draw(img)
+    s = LAYOUT["sign"]
     job_label_font = _font(LAYOUT["font_job_label"])
     job_value_font = _font(LAYOUT["font_job_value"])
     metier = str(data.get("metier", "—"))
-    draw.text((s["x"]+12, s["y"]+8), "Métier", fill=theme["subtitle"], font=job_label_font)
+    draw.text((s["x"]+12 - ox, s["y"]+8 - oy), "Métier", fill=theme["subtitle"], font=job_label_font)
     try:
         jb = draw.textbbox((0,0), metier, font=job_value_font)
         jw, jh = jb[2]-jb[0], jb[3]-jb[1]
@@ -282,37 +917,1086 @@ def _compose_id_card(data: dict, style_name: str="classique") -> "Image.Image":
         jw, jh = draw.textsize(metier, font=job_value_font)
     jx = s["x"] + (s["w"]-jw)//2
     jy = s["y"] + (s["h"]-jh)//2 + 10
-    draw.text((jx, jy), metier, fill=theme["ink"], font=job_value_font)
+    draw.text((jx - ox, jy - oy), metier, fill=theme["ink"], font=job_value_font)
+
+_CARD_LAYER_DRAWERS = {
+    "portrait": _draw_portrait_layer,
+    "identity": _draw_identity_layer,
+    "job":      _draw_job_layer,
+}
 
+def _render_card_layer(name: str, data: dict, style_name: str) -> "Image.Image":
+    box = _card_regions()[name]
+    img = _card_background(style_name, box)
+    theme = THEMES.get(style_name, THEMES["classique"])
+    _CARD_LAYER_DRAWERS[name](img, theme, data, box[0], box[1])
     return img
 
-def generate_png_bytes(data: dict, style_name: str="classique") -> bytes:
+def _compose_card_layers(style_name: str, layers: Dict[str, "Image.Image"]) -> "Image.Image":
+    img = _card_background(style_name)
+    regions = _card_regions()
+    for name in CARD_LAYER_NAMES:
+        img.paste(layers[name], regions[name][:2])
+    return img
+
+def _compose_id_card(data: dict, style_name: str="classique") -> "Image.Image":
+    layers = {name: _render_card_layer(name, data, style_name) for name in CARD_LAYER_NAMES}
+    return _compose_card_layers(style_name, layers)
+
+# ---------- Cartes : format de sortie ----------
+# CARD_FORMAT : "png" (PNG RGBA, transparence conservée), "png8" (PNG palette 256
+# couleurs aplati en RGB, ~3× plus léger) ou "webp" (WebP RGBA sans perte).
+# CARD_PREVIEW_WIDTH > 0 : aperçu JPEG réduit en plus.
+# Le rendu à la volée encode sans optimize (PNG) et en method=4 (WebP) pour garder
+# /generer_carte rapide ; /recompresser_cartes ré-encode ensuite avec optimize=True
+# (method=6 en WebP) : mêmes pixels en png/webp, fichiers plus petits, encodage plus lent.
+CARD_FORMATS = {"png": ".png", "png8": ".png", "webp": ".webp"}
+CARD_FORMAT = os.getenv("CARD_FORMAT", "png").lower()
+if CARD_FORMAT not in CARD_FORMATS:
+    CARD_FORMAT = "png"
+CARD_PREVIEW_WIDTH = int(os.getenv("CARD_PREVIEW_WIDTH", "0"))
+
+def encode_card(img: "Image.Image", optimize: bool = False) -> bytes:
+    """
+    Encode la carte au format CARD_FORMAT. png et webp (sans perte) gardent la
+    transparence du filigrane ; seul png8 (palette, avec perte) aplatit en RGB.
+    """
+    bio = io.BytesIO()
+    if CARD_FORMAT == "png8":
+        img.convert("RGB").quantize(colors=256).save(bio, "PNG", optimize=optimize)
+    elif CARD_FORMAT == "webp":
+        img.convert("RGBA").save(bio, "WEBP", lossless=True, exact=True, method=6 if optimize else 4)
+    else:
+        img.convert("RGBA").save(bio, "PNG", optimize=optimize)
+    return bio.getvalue()
+
+def encode_card_preview(img: "Image.Image") -> Optional[bytes]:
+    if CARD_PREVIEW_WIDTH <= 0:
+        return None
+    w = min(CARD_PREVIEW_WIDTH, img.width)
+    h = round(img.height * w / img.width)
+    bio = io.BytesIO()
+    img.convert("RGB").resize((w, h), Image.LANCZOS).save(bio, "JPEG", quality=85, optimize=True)
+    return bio.getvalue()
+
+def render_card_png(data: dict, style_name: str="classique") -> Tuple[bytes, Dict[str, float]]:
+    """Composition + encodage au format CARD_FORMAT (exécuté dans un worker). Renvoie (octets, durées en ms)."""
     if not PIL_AVAILABLE:
         raise RuntimeError("Pillow n'est pas installé (pip install Pillow).")
-    from io import BytesIO
+    t0 = time.perf_counter()
     card = _compose_id_card(data, style_name=style_name)
-    bio = BytesIO(); card.save(bio, "PNG"); bio.seek(0)
-    return bio.read()
+    t1 = time.perf_counter()
+    out = encode_card(card)
+    t2 = time.perf_counter()
+    return out, {"compose_ms": (t1 - t0) * 1000, "encode_ms": (t2 - t1) * 1000}
+
+def generate_png_bytes(data: dict, style_name: str="classique") -> bytes:
+    return render_card_png(data, style_name=style_name)[0]
+
+# ---------- Cartes : couches enregistrées (rendu incrémental) ----------
+# card_layers/<id>/layers.json indique la clé de chaque couche ; les couches
+# sont des PNG <nom>_<clé>.png. Une couche dont la clé n'a pas changé est relue
+# au lieu d'être redessinée (ex. : changement de métier = seule la zone métier).
+def card_layers_dir_for(user_id: int) -> str:
+    return os.path.join(CARD_LAYERS_DIR, str(user_id))
+
+def card_preview_path_for(user_id: int) -> str:
+    return os.path.join(card_layers_dir_for(user_id), "preview.jpg")
+
+def _card_layer_keys(data: dict, style_name: str) -> Dict[str, str]:
+    base = [style_name if style_name in THEMES else "classique", _card_layout_key(), _card_assets_signature()]
+    def key(*parts) -> str:
+        raw = json.dumps([base, *parts], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+    photo = data.get("photo_bytes") or b""
+    return {
+        "portrait": key("portrait", hashlib.sha256(photo).hexdigest()),
+        "identity": key("identity", [str(data.get(k, "—")) for k in CARD_IDENTITY_FIELDS]),
+        "job":      key("job", str(data.get("metier", "—"))),
+    }
+
+def _replace_file(path: str, write) -> None:
+    """Écrit via un fichier temporaire puis renomme (jamais de fichier à moitié écrit)."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def render_card_layered(user_id: int, data: dict, style_name: str="classique") -> Tuple[bytes, Dict[str, float]]:
+    """Comme render_card_png, en ne redessinant que les couches dont les entrées ont changé."""
+    if not PIL_AVAILABLE:
+        raise RuntimeError("Pillow n'est pas installé (pip install Pillow).")
+    t0 = time.perf_counter()
+    folder = card_layers_dir_for(user_id)
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, "layers.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception:
+        manifest = {}
+
+    keys = _card_layer_keys(data, style_name)
+    layers: Dict[str, "Image.Image"] = {}
+    rendered = 0
+    for name in CARD_LAYER_NAMES:
+        path = os.path.join(folder, f"{name}_{keys[name]}.png")
+        layer = None
+        if manifest.get(name) == keys[name] and os.path.exists(path):
+            try:
+                layer = Image.open(path)
+                layer.load()
+            except Exception:
+                layer = None
+        if layer is None:
+            layer = _render_card_layer(name, data, style_name)
+            _replace_file(path, lambda tmp: layer.save(tmp, "PNG", compress_level=1))
+            rendered += 1
+        layers[name] = layer
+    card = _compose_card_layers(style_name, layers)
+    t1 = time.perf_counter()
+    out = encode_card(card)
+    t2 = time.perf_counter()
+    preview = encode_card_preview(card)
+    if preview:
+        _replace_file(card_preview_path_for(user_id), lambda tmp: _write_bytes(tmp, preview))
+
+    def _write_manifest(tmp: str):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+    _replace_file(manifest_path, _write_manifest)
+    # Couches périmées
+    current = {f"{name}_{keys[name]}.png" for name in CARD_LAYER_NAMES}
+    for fname in os.listdir(folder):
+        if fname.endswith(".png") and fname not in current:
+            try:
+                os.remove(os.path.join(folder, fname))
+            except OSError:
+                pass
+    return out, {
+        "compose_ms": (t1 - t0) * 1000,
+        "encode_ms": (t2 - t1) * 1000,
+        "layers_rendered": rendered,
+    }
+
+def card_render_key(data: dict, style_name: str) -> str:
+    """
+    Empreinte de tout ce qui détermine les pixels de la carte : valeurs d'identité,
+    thème, LAYOUT, assets et octets de la photo. Stockée dans le profil (« carte_hash »).
+    """
+    photo = data.get("photo_bytes") or b""
+    raw = json.dumps({
+        "fields": [str(data.get(k, "—")) for k in CARD_FIELDS],
+        "theme": style_name if style_name in THEMES else "classique",
+        "layout": _card_layout_key(),
+        "assets": _card_assets_signature(),
+        "photo": hashlib.sha256(photo).hexdigest(),
+        "format": CARD_FORMAT,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# ---------- Cartes : service de rendu (process pool) ----------
+# Au plus RENDER_CONCURRENCY cartes en cours de rendu ; au-delà, les demandes
+# attendent dans une file de RENDER_QUEUE_MAX places, puis sont refusées.
+RENDER_CONCURRENCY = max(1, int(os.getenv("RENDER_CONCURRENCY", str(CPU_WORKERS))))
+RENDER_QUEUE_MAX   = max(0, int(os.getenv("RENDER_QUEUE_MAX", "8")))
+
+class RenderQueueFull(RuntimeError):
+    pass
+
+class CardRenderService:
+    def __init__(self, pool: OffloadPool, concurrency: int, max_queue: int):
+        self.pool = pool
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting: List[object] = []
+        self.active = 0
+        self.renders = 0
+        self.failed = 0
+        self.rejected = 0
+        self.queued_total = 0
+        # Dernières mesures (ms) : attente, composition, encodage, total
+        self.timings = deque(maxlen=200)
+
+    async def render(self, data: dict, style_name: str, on_queued=None, user_id: Optional[int] = None) -> bytes:
+        """
+        Rend la carte dans le pool. on_queued(position) est appelé (coroutine)
+        si la demande doit attendre son tour. Lève RenderQueueFull si la file est pleine.
+        Avec user_id, le rendu est incrémental (couches enregistrées du joueur).
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        saturated = self.active >= self.concurrency or bool(self._waiting)
+        if saturated and len(self._waiting) >= self.max_queue:
+            self.rejected += 1
+            raise RenderQueueFull("file de rendu pleine")
+
+        ticket = object()
+        self._waiting.append(ticket)
+        submitted_at = time.perf_counter()
+        try:
+            if saturated:
+                self.queued_total += 1
+                if on_queued is not None:
+                    try:
+                        await on_queued(len(self._waiting))
+                    except Exception:
+                        pass
+            await self._slots.acquire()
+        finally:
+            self._waiting.remove(ticket)
+
+        self.active += 1
+        try:
+            if user_id is not None:
+                png, t = await self.pool.run(render_card_layered, user_id, data, style_name=style_name)
+            else:
+                png, t = await self.pool.run(render_card_png, data, style_name=style_name)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+        t["wait_ms"] = (time.perf_counter() - submitted_at) * 1000 - t["compose_ms"] - t["encode_ms"]
+        t["total_ms"] = (time.perf_counter() - submitted_at) * 1000
+        self.timings.append(t)
+        self.renders += 1
+        couches = f" • couches redessinées {t['layers_rendered']}/{len(CARD_LAYER_NAMES)}" if "layers_rendered" in t else ""
+        print(
+            f"[RENDU] carte en {t['total_ms']:.0f} ms "
+            f"(attente {t['wait_ms']:.0f} • composition {t['compose_ms']:.0f} • encodage {t['encode_ms']:.0f}{couches})"
+        )
+        return png
+
+    def position(self) -> int:
+        return len(self._waiting)
+
+    def stats(self) -> dict:
+        def avg(key: str) -> float:
+            vals = [t[key] for t in self.timings]
+            return sum(vals) / len(vals) if vals else 0.0
+        totals = sorted(t["total_ms"] for t in self.timings)
+        p95 = totals[min(len(totals) - 1, int(len(totals) * 0.95))] if totals else 0.0
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": len(self._waiting),
+            "renders": self.renders,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queued_total": self.queued_total,
+            "avg_wait_ms": avg("wait_ms"),
+            "avg_compose_ms": avg("compose_ms"),
+            "avg_encode_ms": avg("encode_ms"),
+            "avg_total_ms": avg("total_ms"),
+            "p95_total_ms": p95,
+        }
+
+CARD_RENDERER = CardRenderService(CPU_POOL, RENDER_CONCURRENCY, RENDER_QUEUE_MAX)
+
+def _render_queue_notifier(itx: discord.Interaction):
+    """Prévient l'utilisateur (éphémère) que sa carte attend son tour."""
+    async def _notify(position: int):
+        await itx.followup.send(
+            f"⏳ Beaucoup de cartes en cours de génération : votre demande est **en file, position {position}**.",
+            ephemeral=True
+        )
+    return _notify
+
+def card_output_path(user_id: int) -> str:
+    """Chemin de la carte au format de sortie actuel."""
+    return os.path.join(CARDS_DIR, f"{user_id}{CARD_FORMATS[CARD_FORMAT]}")
 
 def card_path_for(user_id: int) -> str:
-    return os.path.join(CARDS_DIR, f"{user_id}.png")
+    """Carte enregistrée, quel que soit son format (sinon : chemin au format actuel)."""
+    preferred = card_output_path(user_id)
+    if os.path.exists(preferred):
+        return preferred
+    for ext in sorted(set(CARD_FORMATS.values())):
+        path = os.path.join(CARDS_DIR, f"{user_id}{ext}")
+        if os.path.exists(path):
+            return path
+    return preferred
+
+def write_card_file(user_id: int, data: bytes) -> str:
+    """Enregistre la carte au format actuel et supprime ses versions dans un autre format."""
+    path = card_output_path(user_id)
+    _replace_file(path, lambda tmp: _write_bytes(tmp, data))
+    for ext in set(CARD_FORMATS.values()):
+        other = os.path.join(CARDS_DIR, f"{user_id}{ext}")
+        if other != path and os.path.exists(other):
+            os.remove(other)
+    return path
+
+def recompress_card_file(path: str) -> Tuple[int, int]:
+    """
+    Ré-encode une carte existante au format actuel (exécuté dans le pool CPU).
+    Renvoie (taille avant, taille après) ; l'original est gardé s'il est déjà plus léger.
+    """
+    before = os.path.getsize(path)
+    user_id = int(os.path.splitext(os.path.basename(path))[0])
+    with Image.open(path) as im:
+        card = im.convert("RGBA")
+    preview = encode_card_preview(card)
+    if preview:
+        os.makedirs(card_layers_dir_for(user_id), exist_ok=True)
+        _replace_file(card_preview_path_for(user_id), lambda tmp: _write_bytes(tmp, preview))
+    data = encode_card(card, optimize=True)
+    if path == card_output_path(user_id) and len(data) >= before:
+        return before, before
+    write_card_file(user_id, data)
+    return before, len(data)
+
+# ---------- Portraits enregistrés ----------
+class PortraitStore:
+    """
+    portraits/<sha256>.png : portraits déjà réduits, un fichier par contenu (dédupliqués).
+    portraits/index.json : user_id -> {"sha", "source": "upload"|"avatar", "avatar_key"}.
+    Un avatar Discord dont la clé (hash) n'a pas changé n'est jamais re-téléchargé.
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.index_path = os.path.join(folder, "index.json")
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, dict]] = None
+
+    def _entries(self) -> Dict[str, dict]:
+        if self._index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except Exception:
+                self._index = {}
+        return self._index
+
+    def _save(self) -> None:
+        def _write(tmp: str):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._index, f)
+        _replace_file(self.index_path, _write)
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.folder, f"{sha}.png")
+
+    def _drop_if_orphan(self, sha: str) -> None:
+        if not any(e.get("sha") == sha for e in self._entries().values()):
+            _remove_if_exists(self._path(sha))
+
+    def get(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries().get(str(user_id))
+            return dict(entry) if entry else None
+
+    def read(self, user_id: int) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries().get(str(user_id))
+            if not entry:
+                return None
+            try:
+                with open(self._path(entry["sha"]), "rb") as f:
+                    return f.read()
+            except OSError:
+                return None
+
+    def put(self, user_id: int, portrait: bytes, source: str, avatar_key: Optional[str] = None) -> str:
+        sha = hashlib.sha256(portrait).hexdigest()
+        with self._lock:
+            entries = self._entries()
+            path = self._path(sha)
+            if not os.path.exists(path):
+                _replace_file(path, lambda tmp: _write_bytes(tmp, portrait))
+            old = entries.get(str(user_id))
+            entries[str(user_id)] = {"sha": sha, "source": source, "avatar_key": avatar_key}
+            if old and old.get("sha") != sha:
+                self._drop_if_orphan(old["sha"])
+            self._save()
+        return sha
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            old = self._entries().pop(str(user_id), None)
+            if old:
+                self._drop_if_orphan(old["sha"])
+                self._save()
+
+    def clear(self) -> None:
+        """Oublie tous les portraits (ils ne correspondent plus aux cartes, p. ex. après une restauration)."""
+        with self._lock:
+            shutil.rmtree(self.folder, ignore_errors=True)
+            os.makedirs(self.folder, exist_ok=True)
+            self._index = {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._entries()
+            shas = {e["sha"] for e in entries.values()}
+            size = sum(os.path.getsize(self._path(h)) for h in shas if os.path.exists(self._path(h)))
+            return {"users": len(entries), "files": len(shas), "bytes": size}
+
+PORTRAITS = PortraitStore(PORTRAITS_DIR)
+
+def _portrait_bytes_for(user_id: int) -> Optional[bytes]:
+    """Portrait actuel du joueur : sa couche enregistrée, sinon la zone photo découpée dans sa carte."""
+    folder = card_layers_dir_for(user_id)
+    try:
+        with open(os.path.join(folder, "layers.json"), "r", encoding="utf-8") as f:
+            key = json.load(f).get("portrait")
+        with open(os.path.join(folder, f"portrait_{key}.png"), "rb") as f:
+            return f.read()
+    except Exception:
+        pass
+    path = card_path_for(user_id)
+    if not os.path.exists(path):
+        return None
+    px, py, pw, ph = LAYOUT["photo_box"]
+    with Image.open(path) as im:
+        crop = im.convert("RGB").crop((px, py, px + pw, py + ph))
+    bio = io.BytesIO(); crop.save(bio, "PNG", compress_level=1)
+    return bio.getvalue()
+
+def rerender_card_file(user_id: int, data: dict, style_name: str, portrait: Optional[bytes] = None) -> Tuple[int, str]:
+    """
+    Re-rend la carte d'un joueur dans le thème donné en gardant son portrait (pool CPU).
+    Renvoie (taille, clé de rendu) : la clé est à reporter dans « carte_hash ».
+    """
+    data = {k: data.get(k, "—") for k in CARD_FIELDS}
+    data["photo_bytes"] = portrait or _portrait_bytes_for(user_id)
+    out, _ = render_card_layered(user_id, data, style_name)
+    write_card_file(user_id, out)
+    return len(out), card_render_key(data, style_name)
 
 def profile_path_for(user_id: int) -> str:
     return os.path.join(PROFILES_DIR, f"{user_id}.json")
 
-def load_profile(user_id: int) -> Optional[dict]:
-    p = profile_path_for(user_id)
-    if os.path.exists(p):
+# ---------- Cache des profils (LRU) ----------
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "512"))
+
+class ProfileCache:
+    """
+    Cache LRU des profils, partagé par tout le process (et les threads d'E/S).
+    Chaque écriture incrémente la version de l'entrée ; les lectures renvoient
+    une copie pour que les commandes puissent muter librement leur profil.
+    Les entrées « sales » (pas encore écrites sur disque) ne sont jamais évincées.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+        self._dirty: set = set()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            prof = self._entries.get(user_id)
+            if prof is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return copy.deepcopy(prof)
+
+    def put(self, user_id: int, prof: dict, bump: bool = False):
+        with self._lock:
+            self._entries[user_id] = copy.deepcopy(prof)
+            self._entries.move_to_end(user_id)
+            if bump:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._trim()
+
+    def fill(self, user_id: int, prof: dict) -> dict:
+        """Insère un profil lu sur disque, sauf si une version plus récente est déjà en cache."""
+        with self._lock:
+            if user_id not in self._entries:
+                self.put(user_id, prof)
+            return copy.deepcopy(self._entries.get(user_id, prof))
+
+    def _trim(self):
+        while len(self._entries) > self.capacity:
+            victim = next((uid for uid in self._entries if uid not in self._dirty), None)
+            if victim is None:
+                break
+            del self._entries[victim]
+            self.evictions += 1
+
+    def peek(self, user_id: int) -> Optional[dict]:
+        """Accès direct à l'entrée (sans copie ni statistiques) ; ne pas muter."""
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def version(self, user_id: int) -> int:
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def mark_dirty(self, user_id: int) -> bool:
+        """Marque l'entrée à écrire ; renvoie False si elle l'était déjà (écriture fusionnée)."""
+        with self._lock:
+            if user_id in self._dirty:
+                return False
+            self._dirty.add(user_id)
+            return True
+
+    def clear_dirty(self, user_id: int, if_version: Optional[int] = None):
+        """Retire la marque « sale » (seulement si l'entrée n'a pas changé depuis if_version)."""
+        with self._lock:
+            if if_version is not None and self._versions.get(user_id, 0) != if_version:
+                return
+            self._dirty.discard(user_id)
+            self._trim()
+
+    def dirty_ids(self) -> List[int]:
+        with self._lock:
+            return list(self._dirty)
+
+    def is_dirty(self, user_id: int) -> bool:
+        with self._lock:
+            return user_id in self._dirty
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._versions.pop(user_id, None)
+            self._dirty.discard(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._dirty.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "dirty": len(self._dirty),
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+PROFILE_CACHE = ProfileCache(PROFILE_CACHE_SIZE)
+
+# ---------- Stockage des profils (un JSON par joueur, ou base SQLite) ----------
+# PROFILE_BACKEND=json   -> profiles/<id>.json (historique)
+# PROFILE_BACKEND=sqlite -> profiles/profiles.sqlite3 (colonnes indexées + blob JSON)
+PROFILE_BACKEND  = os.getenv("PROFILE_BACKEND", "json").strip().lower()
+PROFILES_DB_PATH = os.path.join(PROFILES_DIR, "profiles.sqlite3")
+
+def _safe_int(v) -> int:
+    try:
+        return int(v or 0)
+    except Exception:
+        return 0
+
+# Écritures atomiques : fichier temporaire puis renommage ; la version précédente
+# devient <id>.json.bak (dernière copie valide), relue si le fichier principal est
+# illisible. PROFILE_FSYNC : "always" (fsync à chaque fiche), "batch" (un fsync
+# groupé à la fin de chaque vague d'écritures différées) ou "off".
+PROFILE_FSYNC = os.getenv("PROFILE_FSYNC", "batch").strip().lower()
+
+def _fsync_path(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _read_profile_file(path: str) -> Optional[dict]:
+    """Profil lu, ou None si le fichier est absent ; ValueError s'il est illisible."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+    if not isinstance(data, dict):
+        raise ValueError("le contenu n'est pas un objet JSON")
+    return data
+
+class JsonProfileStore:
+    """Un fichier profiles/<id>.json par joueur (et sa dernière version valide en .bak)."""
+    name = "json"
+
+    def __init__(self):
+        self._unsynced: set = set()
+        self._sync_lock = threading.Lock()
+
+    def read(self, user_id: int) -> Optional[dict]:
+        p = profile_path_for(user_id)
         try:
-            with open(p, "r", encoding="utf-8") as f:
-                return json.load(f)
+            data = _read_profile_file(p)
+            if data is not None or not os.path.exists(p + ".bak"):
+                return data
+            reason = "fichier absent (écriture interrompue)"
+        except ValueError as e:
+            reason = str(e)
+        except OSError:
+            return None
+        return self._recover(user_id, reason)
+
+    def _recover(self, user_id: int, reason: str) -> Optional[dict]:
+        """Remet en place la dernière copie valide ; le fichier abîmé est gardé en .corrupt."""
+        p = profile_path_for(user_id)
+        if os.path.exists(p):
+            os.replace(p, p + ".corrupt")
+        try:
+            data = _read_profile_file(p + ".bak")
+        except (ValueError, OSError):
+            data = None
+        if data is None:
+            PROFILE_WRITE_STATS["lost"] += 1
+            print(f"[PROFILS][ERREUR] Profil {user_id} illisible ({reason}) et aucune copie valide : conservé en .corrupt.")
+            return None
+        raw = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        _replace_file(p, lambda tmp: _write_bytes(tmp, raw))
+        PROFILE_WRITE_STATS["recovered"] += 1
+        print(f"[PROFILS] Profil {user_id} illisible ({reason}) : dernière copie valide restaurée.")
+        return data
+
+    def write(self, user_id: int, data: dict) -> None:
+        p = profile_path_for(user_id)
+        raw = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        tmp = f"{p}.tmp{os.getpid()}"
+        bak_tmp = f"{p}.bak.tmp{os.getpid()}"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(raw)
+                if PROFILE_FSYNC == "always":
+                    f.flush()
+                    os.fsync(f.fileno())
+            if os.path.exists(p):
+                # copie .bak par lien physique (ou copie) : p n'est jamais absent
+                try:
+                    os.link(p, bak_tmp)
+                except OSError:
+                    shutil.copy2(p, bak_tmp)
+                os.replace(bak_tmp, p + ".bak")
+            os.replace(tmp, p)
+        finally:
+            for leftover in (tmp, bak_tmp):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        if PROFILE_FSYNC == "always":
+            _fsync_path(PROFILES_DIR)
+            PROFILE_WRITE_STATS["fsyncs"] += 1
+        elif PROFILE_FSYNC == "batch":
+            with self._sync_lock:
+                self._unsynced.add(p)
+
+    def sync(self) -> int:
+        """fsync groupé des fiches écrites depuis le dernier appel (mode « batch »)."""
+        with self._sync_lock:
+            paths, self._unsynced = self._unsynced, set()
+        for path in paths:
+            try:
+                _fsync_path(path)
+            except OSError:
+                continue
+        if paths:
+            _fsync_path(PROFILES_DIR)
+            PROFILE_WRITE_STATS["fsyncs"] += 1
+        return len(paths)
+
+    def delete(self, user_id: int) -> None:
+        p = profile_path_for(user_id)
+        for path in (p, p + ".bak", p + ".corrupt"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def ids(self) -> List[int]:
+        """IDs des profils présents (y compris ceux dont il ne reste que la copie .bak)."""
+        uids = set()
+        try:
+            names = os.listdir(PROFILES_DIR)
+        except OSError:
+            return []
+        for name in names:
+            for suffix in (".json", ".json.bak"):
+                if name.endswith(suffix) and name[:-len(suffix)].isdigit():
+                    uids.add(int(name[:-len(suffix)]))
+        return sorted(uids)
+
+    def iter_all(self) -> List[Tuple[int, dict]]:
+        # via read() : un fichier abîmé est récupéré depuis sa copie .bak
+        entries: List[Tuple[int, dict]] = []
+        for uid in self.ids():
+            d = self.read(uid)
+            if d is not None:
+                entries.append((uid, d))
+        return entries
+
+    def wealth_ranking(self) -> List[Tuple[int, int]]:
+        ranks: List[Tuple[int, int]] = []
+        for uid, d in self.iter_all():
+            try:
+                ranks.append((uid, _total_wealth(d)))
+            except Exception:
+                continue
+        ranks.sort(key=lambda t: t[1], reverse=True)
+        return ranks
+
+    def bounties(self) -> List[Tuple[int, int]]:
+        entries = [(uid, _total_prime_for_profile(d)) for uid, d in self.iter_all()]
+        entries = [e for e in entries if e[1] > 0]
+        entries.sort(key=lambda t: t[1], reverse=True)
+        return entries
+
+    def timers(self) -> List[Tuple[int, dict, bool]]:
+        """(user_id, cooldowns, rappels activés) des profils qui ont des délais ou des rappels."""
+        return [
+            (uid, d.get("cooldowns") or {}, bool(d.get("rappel_cooldowns")))
+            for uid, d in self.iter_all()
+            if d.get("cooldowns") or d.get("rappel_cooldowns")
+        ]
+
+class SqliteProfileStore:
+    """
+    Une seule base SQLite : les champs numériques chauds sont des colonnes indexées,
+    le reste du profil reste un blob JSON.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    user_id       INTEGER PRIMARY KEY,
+                    cash          INTEGER NOT NULL DEFAULT 0,
+                    bank          INTEGER NOT NULL DEFAULT 0,
+                    dirty         INTEGER NOT NULL DEFAULT 0,
+                    total         INTEGER NOT NULL DEFAULT 0,
+                    prime_total   INTEGER NOT NULL DEFAULT 0,
+                    compte_bloque INTEGER NOT NULL DEFAULT 0,
+                    data          TEXT    NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_profiles_total  ON profiles(total DESC);
+                CREATE INDEX IF NOT EXISTS idx_profiles_prime  ON profiles(prime_total DESC) WHERE prime_total > 0;
+                CREATE INDEX IF NOT EXISTS idx_profiles_bloque ON profiles(compte_bloque) WHERE compte_bloque = 1;
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+
+    def sync(self) -> int:
+        # SQLite garantit déjà la durabilité de chaque transaction
+        return 0
+
+    def reopen(self) -> None:
+        """Rouvre la base (après le remplacement du fichier, p. ex. par /backup_restore)."""
+        with self._lock:
+            self._conn.close()
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+
+    def read(self, user_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
         except Exception:
             return None
-    return None
+
+    @staticmethod
+    def _row_for(user_id: int, data: dict) -> tuple:
+        cash, bank, dirty = _safe_int(data.get("cash")), _safe_int(data.get("bank")), _safe_int(data.get("dirty"))
+        return (
+            user_id,
+            cash,
+            bank,
+            dirty,
+            cash + bank + dirty,
+            _total_prime_for_profile(data),
+            1 if data.get("compte_bloque") else 0,
+            json.dumps(data, ensure_ascii=False, separators=(",", ":")),
+        )
+
+    def write(self, user_id: int, data: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles (user_id, cash, bank, dirty, total, prime_total, compte_bloque, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self._row_for(user_id, data)
+            )
+
+    def delete(self, user_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
+
+    def iter_all(self) -> List[Tuple[int, dict]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM profiles").fetchall()
+        entries: List[Tuple[int, dict]] = []
+        for uid, blob in rows:
+            try:
+                entries.append((int(uid), json.loads(blob)))
+            except Exception:
+                continue
+        return entries
+
+    def wealth_ranking(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, total FROM profiles ORDER BY total DESC").fetchall()
+        return [(int(uid), int(total)) for uid, total in rows]
+
+    def bounties(self) -> List[Tuple[int, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, prime_total FROM profiles WHERE prime_total > 0 ORDER BY prime_total DESC"
+            ).fetchall()
+        return [(int(uid), int(p)) for uid, p in rows]
+
+    def timers(self) -> List[Tuple[int, dict, bool]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, json_extract(data, '$.cooldowns'), json_extract(data, '$.rappel_cooldowns') "
+                "FROM profiles WHERE json_extract(data, '$.cooldowns') IS NOT NULL "
+                "OR json_extract(data, '$.rappel_cooldowns')"
+            ).fetchall()
+        out = []
+        for uid, cds, notify in rows:
+            try:
+                cds = json.loads(cds) if cds else {}
+            except ValueError:
+                cds = {}
+            out.append((int(uid), cds if isinstance(cds, dict) else {}, bool(notify)))
+        return out
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+def migrate_json_profiles_to_sqlite(store: "SqliteProfileStore", force: bool = False) -> int:
+    """
+    Migration one-shot profiles/*.json -> SQLite.
+    Les profils déjà présents en base ne sont pas écrasés ; les fichiers JSON sont conservés.
+    """
+    if not force and store.get_meta("migrated_from_json"):
+        return 0
+    count = errors = 0
+    source = JsonProfileStore()
+    for uid in source.ids():
+        if store.read(uid) is not None:
+            continue
+        data = source.read(uid)
+        if data is None:
+            # illisible et sans copie valide : la migration ne sera pas marquée terminée
+            errors += 1
+            print(f"[MIGRATION][ERREUR] Profil {uid} : fichier illisible.")
+            continue
+        try:
+            store.write(uid, data)
+            count += 1
+        except Exception as e:
+            errors += 1
+            print(f"[MIGRATION][ERREUR] Profil {uid} : {e}")
+    if not errors:
+        store.set_meta("migrated_from_json", datetime.utcnow().isoformat())
+    print(f"[MIGRATION] {count} profil(s) JSON importé(s) dans {store.path}.")
+    return count
+
+def _make_profile_store():
+    if PROFILE_BACKEND == "sqlite":
+        return SqliteProfileStore(PROFILES_DB_PATH)
+    return JsonProfileStore()
+
+PROFILE_STORE = _make_profile_store()
+
+# ---------- Écriture différée (write-behind) des profils ----------
+# Les sauvegardes passent par le cache et sont marquées « sales » ; une tâche
+# les écrit toutes les PROFILE_WRITE_DELAY secondes (une seule écriture par
+# joueur, même après plusieurs /work ou /dep d'affilée). 0 = écriture immédiate.
+PROFILE_WRITE_DELAY = float(os.getenv("PROFILE_WRITE_DELAY", "2"))
+
+# Empreinte du contenu actuellement sur disque, pour sauter les écritures inutiles
+_PROFILE_PERSISTED_DIGEST: Dict[int, str] = {}
+# Une seule écriture à la fois (tâche d'écriture, sauvegardes, threads d'E/S)
+_PROFILE_PERSIST_LOCK = threading.Lock()
+PROFILE_WRITE_STATS = {"saves": 0, "writes": 0, "unchanged": 0, "coalesced": 0, "errors": 0,
+                       "fsyncs": 0, "recovered": 0, "lost": 0}
+
+def _profile_digest(data: dict) -> str:
+    raw = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _persist_profile(user_id: int, data: dict, pending: bool = False) -> bool:
+    """
+    Écrit dans le stockage si le contenu a changé. Renvoie True si une écriture a eu lieu.
+    pending=True : écriture différée, abandonnée si l'entrée n'est plus « sale »
+    (cache vidé entre-temps, p. ex. par une restauration).
+    """
+    digest = _profile_digest(data)
+    with _PROFILE_PERSIST_LOCK:
+        if pending and not PROFILE_CACHE.is_dirty(user_id):
+            return False
+        if _PROFILE_PERSISTED_DIGEST.get(user_id) == digest:
+            PROFILE_WRITE_STATS["unchanged"] += 1
+            return False
+        PROFILE_STORE.write(user_id, data)
+        _PROFILE_PERSISTED_DIGEST[user_id] = digest
+        PROFILE_WRITE_STATS["writes"] += 1
+        return True
+
+def _write_profile(user_id: int, data: dict) -> None:
+    """Enregistre la fiche telle quelle (sans merge) dans le cache, puis sur disque (immédiatement ou en différé)."""
+    PROFILE_WRITE_STATS["saves"] += 1
+    try:
+        WEALTH_INDEX.update(user_id, _total_wealth(data))
+    except (TypeError, ValueError):
+        pass
+    COOLDOWNS.sync(user_id, data)
+    if PROFILE_WRITE_DELAY <= 0:
+        _persist_profile(user_id, data)
+        PROFILE_CACHE.put(user_id, data, bump=True)
+        return
+    # marquer avant d'insérer : une entrée sale n'est jamais évincée
+    if not PROFILE_CACHE.mark_dirty(user_id):
+        PROFILE_WRITE_STATS["coalesced"] += 1
+    PROFILE_CACHE.put(user_id, data, bump=True)
+
+def flush_profiles() -> int:
+    """Écrit toutes les fiches en attente. Renvoie le nombre de fichiers réellement écrits."""
+    written = 0
+    for uid in PROFILE_CACHE.dirty_ids():
+        version = PROFILE_CACHE.version(uid)
+        data = PROFILE_CACHE.peek(uid)
+        if data is None:
+            PROFILE_CACHE.clear_dirty(uid)
+            continue
+        try:
+            if _persist_profile(uid, data, pending=True):
+                written += 1
+            # si la fiche a été re-modifiée pendant l'écriture, elle reste « sale »
+            PROFILE_CACHE.clear_dirty(uid, if_version=version)
+        except Exception as e:
+            PROFILE_WRITE_STATS["errors"] += 1
+            print(f"[PROFILS][ERREUR] Écriture différée de {uid} : {e}")
+    if written:
+        try:
+            PROFILE_STORE.sync()
+        except OSError as e:
+            print(f"[PROFILS][ERREUR] fsync : {e}")
+    return written
+
+def forget_profile(user_id: int) -> None:
+    """Supprime le profil du stockage et oublie toute écriture en attente."""
+    PROFILE_CACHE.invalidate(user_id)
+    _PROFILE_PERSISTED_DIGEST.pop(user_id, None)
+    WEALTH_INDEX.remove(user_id)
+    COOLDOWNS.forget(user_id)
+    PROFILE_STORE.delete(user_id)
+
+# ---------- Index du classement des fortunes ----------
+class WealthIndex:
+    """
+    Classement en mémoire : liste triée de (-total, user_id) + total par joueur.
+    Construit une fois au démarrage, tenu à jour à chaque sauvegarde de profil.
+    Rang en O(log n) (bisect), pages du leaderboard par simple découpage.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[int, int]] = []
+        self._totals: Dict[int, int] = {}
+        self.built = False
+
+    def rebuild(self, ranking: List[Tuple[int, int]]) -> None:
+        with self._lock:
+            self._totals = {int(uid): int(total) for uid, total in ranking}
+            self._keys = sorted((-t, uid) for uid, t in self._totals.items())
+            self.built = True
+
+    def _discard(self, user_id: int) -> None:
+        old = self._totals.pop(user_id, None)
+        if old is not None:
+            i = bisect.bisect_left(self._keys, (-old, user_id))
+            if i < len(self._keys) and self._keys[i] == (-old, user_id):
+                del self._keys[i]
+
+    def update(self, user_id: int, total: int) -> None:
+        with self._lock:
+            if not self.built or self._totals.get(user_id) == total:
+                return
+            self._discard(user_id)
+            self._totals[user_id] = total
+            bisect.insort(self._keys, (-total, user_id))
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            self._discard(user_id)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Rang 1-based ; les ex aequo partagent le même rang."""
+        with self._lock:
+            total = self._totals.get(user_id)
+            if total is None:
+                return None
+            return bisect.bisect_left(self._keys, (-total,)) + 1
+
+    def page(self, start: int, count: int) -> List[Tuple[int, int]]:
+        with self._lock:
+            return [(uid, -neg) for neg, uid in self._keys[start:start + count]]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+WEALTH_INDEX = WealthIndex()
+
+def build_wealth_index() -> int:
+    """(Re)construit l'index depuis le stockage. Renvoie le nombre de profils classés."""
+    flush_profiles()
+    WEALTH_INDEX.rebuild(PROFILE_STORE.wealth_ranking())
+    return len(WEALTH_INDEX)
+
+async def _ensure_wealth_index() -> None:
+    if not WEALTH_INDEX.built:
+        await IO_POOL.run(build_wealth_index)
+
+@tasks.loop(seconds=max(0.5, PROFILE_WRITE_DELAY))
+async def profile_flusher():
+    if PROFILE_CACHE.dirty_ids():
+        await IO_POOL.run(flush_profiles)
+
+def _load_profile_from_store(user_id: int) -> Optional[dict]:
+    prof = PROFILE_STORE.read(user_id)
+    if prof is None:
+        return None
+    _PROFILE_PERSISTED_DIGEST.setdefault(user_id, _profile_digest(prof))
+    return PROFILE_CACHE.fill(user_id, prof)
+
+def load_profile(user_id: int) -> Optional[dict]:
+    cached = PROFILE_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+    return _load_profile_from_store(user_id)
+
+async def load_profile_async(user_id: int) -> Optional[dict]:
+    """Comme load_profile, mais la lecture disque (défaut de cache) se fait dans le pool d'E/S."""
+    cached = PROFILE_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+    return await IO_POOL.run(_load_profile_from_store, user_id)
 
 def save_profile(user_id: int, data: dict) -> None:
     """Enregistre/merge la fiche. Conserve inventaires, propriétés et argent s’ils existent."""
-    p = profile_path_for(user_id)
     existing = load_profile(user_id) or {}
     ex_inv   = existing.get("inventaire", {})
     armes    = ex_inv.get("armes", {}) or {}
@@ -329,15 +2013,32 @@ def save_profile(user_id: int, data: dict) -> None:
     data.setdefault("proprietes", props)
 
     try:
-        with open(p, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _write_profile(user_id, data)
     except Exception:
         pass
 
+async def save_profile_async(user_id: int, data: dict) -> None:
+    """save_profile sans bloquer la boucle : en mémoire si possible, sinon dans le pool d'E/S."""
+    if PROFILE_WRITE_DELAY > 0 and PROFILE_CACHE.peek(user_id) is not None:
+        save_profile(user_id, data)
+    else:
+        await IO_POOL.run(save_profile, user_id, data)
+
+async def _write_profile_async(user_id: int, data: dict) -> None:
+    if PROFILE_WRITE_DELAY > 0:
+        _write_profile(user_id, data)
+    else:
+        await IO_POOL.run(_write_profile, user_id, data)
+
 # ========= HELPERS ÉCONOMIE / PROFIL =========
 
 def _ensure_profile_skeleton(user_id: int) -> dict:
-    prof = load_profile(user_id) or {}
+    return _apply_profile_skeleton(load_profile(user_id) or {})
+
+async def _ensure_profile_skeleton_async(user_id: int) -> dict:
+    return _apply_profile_skeleton(await load_profile_async(user_id) or {})
+
+def _apply_profile_skeleton(prof: dict) -> dict:
     if "inventaire" not in prof:
         prof["inventaire"] = {}
     prof["inventaire"].setdefault("armes", {})
@@ -361,6 +2062,15 @@ def _set_arme_count(armes_dict: Dict[str, int], item: str, new_count: int):
 COOLDOWN_CRIME_SECONDS = 4 * 3600
 COOLDOWN_ROBB_SECONDS  = 4 * 3600
 COOLDOWN_BLCH_SECONDS  = 4 * 3600  # blanchiment
+COOLDOWN_WORK_SECONDS  = 4 * 3600
+
+# clé dans prof["cooldowns"] -> (durée, libellé pour /cooldowns et les rappels)
+COOLDOWN_PERIODS = {
+    "crime":       (COOLDOWN_CRIME_SECONDS, "Braquage (/crime)"),
+    "robb":        (COOLDOWN_ROBB_SECONDS,  "Vol (/robb)"),
+    "blanchiment": (COOLDOWN_BLCH_SECONDS,  "Blanchiment (/blanchiment)"),
+    "work":        (COOLDOWN_WORK_SECONDS,  "Travail (/work)"),
+}
 
 def _ensure_economy_fields(prof: dict) -> dict:
     if prof.get("cash") is None:
@@ -387,6 +2097,228 @@ def _touch_cooldown(prof: dict, key: str):
     cds[key] = int(time.time())
     prof["cooldowns"] = cds
 
+def _cooldown_wait_text(left: int, action: str) -> str:
+    h = left // 3600; m = (left % 3600) // 60; s = left % 60
+    return f"⏳ Vous devrez patienter **{h}h {m}m {s}s** avant {action}."
+
+# ---------- Délais en mémoire ----------
+# Fins de délai de tous les joueurs : dict user_id -> {clé: fin} + tas (min-heap)
+# des fins à venir. Chargé une fois au démarrage, tenu à jour à chaque sauvegarde
+# de profil (prof["cooldowns"] reste la source enregistrée). Un refus
+# « Vous devrez patienter » ne lit donc plus aucune fiche. Le tas sert aussi aux
+# rappels « de nouveau disponible » (prof["rappel_cooldowns"], activés via /cooldowns).
+class CooldownService:
+    def __init__(self, periods: Dict[str, Tuple[int, str]]):
+        self.periods = periods
+        self._ends: Dict[int, Dict[str, int]] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._notify: set = set()
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self.built = False
+        self.fast_rejects = 0
+        self.notified = 0
+
+    def _set(self, user_id: int, cooldowns: dict, now: int) -> None:
+        ends = {}
+        for key, (period, _) in self.periods.items():
+            try:
+                end = int(cooldowns.get(key) or 0) + period
+            except (TypeError, ValueError):
+                continue
+            if end > now:
+                ends[key] = end
+                if self._ends.get(user_id, {}).get(key) != end:
+                    heapq.heappush(self._heap, (end, user_id, key))
+        if ends:
+            self._ends[user_id] = ends
+        else:
+            self._ends.pop(user_id, None)
+
+    def rebuild(self, entries: List[Tuple[int, dict, bool]]) -> None:
+        now = int(time.time())
+        with self._lock:
+            self._ends.clear()
+            self._heap.clear()
+            self._notify = {uid for uid, _, notify in entries if notify}
+            for uid, cds, _ in entries:
+                self._set(uid, cds, now)
+            self.built = True
+        self._poke()
+
+    def sync(self, user_id: int, prof: dict) -> None:
+        """Reprend les délais d'une fiche sauvegardée."""
+        cds = prof.get("cooldowns")
+        with self._lock:
+            self._set(user_id, cds if isinstance(cds, dict) else {}, int(time.time()))
+            if prof.get("rappel_cooldowns"):
+                self._notify.add(user_id)
+            else:
+                self._notify.discard(user_id)
+        self._poke()
+
+    def forget(self, user_id: int) -> None:
+        with self._lock:
+            self._ends.pop(user_id, None)
+            self._notify.discard(user_id)
+
+    def left(self, user_id: int, key: str) -> int:
+        """Secondes restantes (0 si disponible ou si l'index n'est pas encore construit)."""
+        with self._lock:
+            end = self._ends.get(user_id, {}).get(key, 0)
+        return max(0, end - int(time.time()))
+
+    def pending(self, user_id: int) -> Dict[str, int]:
+        """clé -> fin (timestamp) des délais encore actifs du joueur."""
+        now = int(time.time())
+        with self._lock:
+            return {k: end for k, end in self._ends.get(user_id, {}).items() if end > now}
+
+    def _poke(self) -> None:
+        if self._wake is not None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return  # appelé depuis un thread d'E/S : le réveil périodique suffit
+            self._wake.set()
+
+    def _pop_due(self, now: int) -> Tuple[List[Tuple[int, str]], Optional[int]]:
+        """Retire les fins échues du tas. Renvoie (délais terminés à annoncer, prochaine fin)."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                end, uid, key = heapq.heappop(self._heap)
+                ends = self._ends.get(uid)
+                if not ends or ends.get(key) != end:
+                    continue  # entrée périmée (délai relancé ou effacé depuis)
+                del ends[key]
+                if not ends:
+                    del self._ends[uid]
+                if uid in self._notify:
+                    due.append((uid, key))
+            return due, (self._heap[0][0] if self._heap else None)
+
+    async def run(self, client: discord.Client) -> None:
+        """Dort jusqu'à la prochaine fin de délai, libère l'entrée et envoie les rappels."""
+        self._wake = asyncio.Event()
+        while True:
+            due, next_end = self._pop_due(int(time.time()))
+            for uid, key in due:
+                try:
+                    user = client.get_user(uid) or await client.fetch_user(uid)
+                    await user.send(f"✅ {self.periods[key][1]} : de nouveau disponible.")
+                    self.notified += 1
+                except Exception as e:
+                    print(f"[DÉLAIS][ERREUR] Rappel pour {uid} : {e}")
+            self._wake.clear()
+            timeout = 60.0 if next_end is None else min(60.0, max(0.0, next_end - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "players": len(self._ends),
+                "timers": sum(len(v) for v in self._ends.values()),
+                "heap": len(self._heap),
+                "notify": len(self._notify),
+                "fast_rejects": self.fast_rejects,
+                "notified": self.notified,
+            }
+
+COOLDOWNS = CooldownService(COOLDOWN_PERIODS)
+_COOLDOWN_TASK: Optional[asyncio.Task] = None
+
+def build_cooldown_index() -> int:
+    """(Re)charge les délais depuis le stockage. Renvoie le nombre de délais actifs."""
+    flush_profiles()
+    COOLDOWNS.rebuild(PROFILE_STORE.timers())
+    return COOLDOWNS.stats()["timers"]
+
+async def _reject_if_cooling(itx: discord.Interaction, user_id: int, key: str, action: str) -> bool:
+    """Refuse tout de suite (sans lire la fiche) si le délai court encore."""
+    left = COOLDOWNS.left(user_id, key)
+    if left <= 0:
+        return False
+    COOLDOWNS.fast_rejects += 1
+    await itx.response.send_message(_cooldown_wait_text(left, action), ephemeral=True)
+    return True
+
+# ---------- Verrous par joueur & transactions multi-profils ----------
+# Un asyncio.Lock par joueur, libéré de la mémoire dès qu'il n'est plus utilisé.
+# Les lectures seules (/bal, /fiche_personnage…) ne prennent jamais de verrou.
+_PROFILE_LOCKS: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def _profile_lock(user_id: int) -> asyncio.Lock:
+    lock = _PROFILE_LOCKS.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _PROFILE_LOCKS[user_id] = lock
+    return lock
+
+class ProfileTransaction:
+    """
+    Charge plusieurs profils sous verrou, puis les enregistre ensemble à la sortie du bloc.
+
+        async with profile_transaction(payeur.id, beneficiaire.id) as tx:
+            tx[payeur.id]["cash"] -= montant
+            tx[beneficiaire.id]["cash"] += montant
+
+    Les verrous sont pris dans l'ordre croissant des IDs (pas d'interblocage).
+    Seuls les profils réellement modifiés sont enregistrés ; rien n'est écrit si
+    le bloc lève une exception.
+    """
+    def __init__(self, *user_ids: int, economy: bool = True):
+        self.user_ids = sorted(set(user_ids))
+        self.economy = economy
+        self.profiles: Dict[int, dict] = {}
+        self._digests: Dict[int, str] = {}
+        self._locks: List[asyncio.Lock] = []
+
+    def __getitem__(self, user_id: int) -> dict:
+        return self.profiles[user_id]
+
+    async def __aenter__(self) -> "ProfileTransaction":
+        try:
+            for uid in self.user_ids:
+                lock = _profile_lock(uid)
+                await lock.acquire()
+                self._locks.append(lock)
+            for uid in self.user_ids:
+                prof = await _ensure_profile_skeleton_async(uid)
+                if self.economy:
+                    prof = _ensure_economy_fields(prof)
+                self.profiles[uid] = prof
+                self._digests[uid] = _profile_digest(prof)
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    async def commit(self):
+        for uid in self.user_ids:
+            prof = self.profiles[uid]
+            if _profile_digest(prof) != self._digests[uid]:
+                await save_profile_async(uid, prof)
+                self._digests[uid] = _profile_digest(prof)
+
+    def _release(self):
+        while self._locks:
+            self._locks.pop().release()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                await self.commit()
+        finally:
+            self._release()
+        return False
+
+def profile_transaction(*user_ids: int, economy: bool = True) -> ProfileTransaction:
+    return ProfileTransaction(*user_ids, economy=economy)
+
 def _fmt_money(n: int) -> str:
     s = f"{int(n):,}".replace(",", " ")
     return f"{s} ₣"
@@ -405,7 +2337,57 @@ async def style_carte(itx: discord.Interaction, style: str):
         await itx.response.send_message("Styles disponibles : classique, sobre, fonce.")
         return
     CURRENT_THEME["name"] = style
-    await itx.response.send_message(f"Style défini sur **{style}**.")
+    await itx.response.send_message(
+        f"Style défini sur **{style}**.\n"
+        "Les cartes existantes peuvent être mises au nouveau style avec `/rerendre_cartes`."
+    )
+
+# ---------- Photo de la carte ----------
+PORTRAIT_STATS = {"uploads": 0, "reused": 0, "avatar_fetches": 0}
+
+async def _card_portrait(target: discord.abc.User, attachment: Optional[discord.Attachment],
+                         reuse_upload: bool) -> Optional[bytes]:
+    """
+    Portrait (déjà réduit) pour la carte : pièce jointe > portrait enregistré > avatar.
+    Le portrait enregistré est réutilisé s'il vient de l'avatar actuel (même clé) ou,
+    avec reuse_upload, d'une photo envoyée auparavant. Lève PhotoTooLarge ou
+    PhotoInvalid (pièce jointe qui n'est pas une image lisible).
+    """
+    if attachment is not None:
+        try:
+            raw = await attachment.read()
+        except Exception:
+            raw = None
+        if raw is not None:
+            pixels = _photo_pixels(raw)
+            if pixels is None and PIL_AVAILABLE:
+                raise PhotoInvalid()
+            if (pixels or 0) > PHOTO_MAX_PIXELS:
+                raise PhotoTooLarge()
+            try:
+                portrait = await CPU_POOL.run(prepare_portrait, raw)
+            except PHOTO_DECODE_ERRORS as e:
+                raise PhotoInvalid() from e
+            await IO_POOL.run(PORTRAITS.put, target.id, portrait, "upload")
+            PORTRAIT_STATS["uploads"] += 1
+            return portrait
+
+    avatar = target.display_avatar
+    entry = await IO_POOL.run(PORTRAITS.get, target.id)
+    if entry and ((reuse_upload and entry["source"] == "upload") or entry.get("avatar_key") == avatar.key):
+        portrait = await IO_POOL.run(PORTRAITS.read, target.id)
+        if portrait:
+            PORTRAIT_STATS["reused"] += 1
+            return portrait
+
+    try:
+        raw = await avatar.replace(size=512, format="png").read()
+        portrait = await CPU_POOL.run(prepare_portrait, raw)
+    except Exception:
+        return None
+    await IO_POOL.run(PORTRAITS.put, target.id, portrait, "avatar", avatar.key)
+    PORTRAIT_STATS["avatar_fetches"] += 1
+    return portrait
 
 @bot.tree.command(
     name="generer_carte",
@@ -440,38 +2422,28 @@ async def generer_carte(
     await itx.response.defer()
     target = cible or itx.user
 
-    # Pièce jointe -> avatar fallback
-    img_bytes: Optional[bytes] = None
-    ext = ".png"
-
-    if photo is not None:
-        try:
-            img_bytes = await photo.read()
-            ext_att = os.path.splitext(photo.filename)[1].lower()
-            if ext_att in [".png", ".jpg", ".jpeg", ".webp"]:
-                ext = ext_att
-        except Exception:
-            img_bytes = None
+    # Pièce jointe -> avatar (réutilisé s'il n'a pas changé)
+    try:
+        img_bytes = await _card_portrait(target, photo, reuse_upload=False)
+    except PhotoTooLarge:
+        await itx.followup.send(embed=embed(
+            "Photo trop grande",
+            f"L’image dépasse {PHOTO_MAX_PIXELS // 1_000_000} mégapixels. Réduisez-la puis réessayez."
+        ))
+        return
+    except PhotoInvalid:
+        await itx.followup.send(embed=embed(
+            "Image invalide",
+            "La pièce jointe n’est pas une image lisible. Réessayez avec un fichier PNG/JPG/WEBP."
+        ))
+        return
 
     if img_bytes is None:
-        try:
-            asset = target.display_avatar.replace(size=512, format="png")
-            img_bytes = await asset.read()
-            ext = ".png"
-        except Exception:
-            await itx.followup.send(embed=embed(
-                "Photo manquante",
-                "Impossible d’obtenir une image (pièce jointe et avatar ont échoué). "
-                "Réessayez avec une pièce jointe PNG/JPG/WEBP."
-            ))
-            return
-
-    temp_path = os.path.join(ASSETS_DIR, f"photo_{target.id}{ext}")
-    try:
-        with open(temp_path, "wb") as f:
-            f.write(img_bytes)
-    except Exception as e:
-        await itx.followup.send(embed=embed("Erreur", f"Impossible d'écrire l'image temporaire : `{e}`"))
+        await itx.followup.send(embed=embed(
+            "Photo manquante",
+            "Impossible d’obtenir une image (pièce jointe et avatar ont échoué). "
+            "Réessayez avec une pièce jointe PNG/JPG/WEBP."
+        ))
         return
 
     data = {
@@ -483,21 +2455,21 @@ async def generer_carte(
         "lieu_naissance": lieu_naissance,
         "nationalite": nationalite,
         "metier": metier,
-        "photo_path": temp_path
+        "photo_bytes": img_bytes
     }
 
     try:
-        png_bytes = generate_png_bytes(data, style_name=CURRENT_THEME["name"])
+        png_bytes = await CARD_RENDERER.render(
+            data, CURRENT_THEME["name"], on_queued=_render_queue_notifier(itx), user_id=target.id
+        )
+    except RenderQueueFull:
+        await itx.followup.send(embed=embed("Patientez", "Trop de cartes en cours de génération. Réessayez dans un instant."))
+        return
     except Exception as e:
         await itx.followup.send(embed=embed("Erreur", f"Impossible de générer la carte : `{e}`"))
-        try:
-            if os.path.exists(temp_path): os.remove(temp_path)
-        except Exception: pass
         return
 
-    save_path = card_path_for(target.id)
-    with open(save_path, "wb") as f:
-        f.write(png_bytes)
+    save_path = await IO_POOL.run(write_card_file, target.id, png_bytes)
 
     # Sauvegarder la fiche personnage (identité de base)
     profile_data = {
@@ -509,50 +2481,46 @@ async def generer_carte(
         "date_naissance": data["date_naissance"],
         "lieu_naissance": data["lieu_naissance"],
         "nationalite": data["nationalite"],
-        "metier": data["metier"]
+        "metier": data["metier"],
+        "carte_hash": card_render_key(data, CURRENT_THEME["name"]),
     }
-    save_profile(target.id, profile_data)
-
-    # --- RESET COMPLET + ITEMS DE DÉPART ---
-    try:
-        prof = _ensure_profile_skeleton(target.id)
-        prof = _ensure_economy_fields(prof)
+    async with _profile_lock(target.id):
+        await save_profile_async(target.id, profile_data)
 
-        # RESET inventaire
-        prof["inventaire"]["armes"] = {}
-        prof["inventaire"]["chevaux"] = {}
-        prof["inventaire"]["permis"] = {}
+        # --- RESET COMPLET + ITEMS DE DÉPART ---
+        try:
+            prof = await _ensure_profile_skeleton_async(target.id)
+            prof = _ensure_economy_fields(prof)
 
-        # ITEMS DE DÉPART
-        prof["inventaire"]["armes"]["Revolver Cattleman"] = 1
-        prof["inventaire"]["armes"]["Couteau de chasse"] = 1
+            # RESET inventaire
+            prof["inventaire"]["armes"] = {}
+            prof["inventaire"]["chevaux"] = {}
+            prof["inventaire"]["permis"] = {}
 
-        # RESET propriétés
-        prof["proprietes"] = {}
+            # ITEMS DE DÉPART
+            prof["inventaire"]["armes"]["Revolver Cattleman"] = 1
+            prof["inventaire"]["armes"]["Couteau de chasse"] = 1
 
-        # RESET économie
-        prof["cash"] = 0
-        prof["bank"] = 500  # Bonus de départ
-        prof["dirty"] = 0
+            # RESET propriétés
+            prof["proprietes"] = {}
 
-        # RESET cooldowns
-        prof["cooldowns"] = {}
+            # RESET économie
+            prof["cash"] = 0
+            prof["bank"] = 500  # Bonus de départ
+            prof["dirty"] = 0
 
-        save_profile(target.id, prof)
+            # RESET cooldowns
+            prof["cooldowns"] = {}
 
-    except Exception as e:
-        print(f"Erreur reset inventaire de {target.id} : {e}")
+            await save_profile_async(target.id, prof)
 
-    # Nettoyage de la photo temporaire
-    try:
-        if os.path.exists(temp_path): os.remove(temp_path)
-    except Exception:
-        pass
+        except Exception as e:
+            print(f"Erreur reset inventaire de {target.id} : {e}")
 
     await itx.followup.send(embed=embed(
         "Carte enregistrée",
         f"Carte de **{prenom} {nom}** enregistrée.\n"
-        f"_Fichier :_ `cards/{target.id}.png`\n"
+        f"_Fichier :_ `cards/{os.path.basename(save_path)}`\n"
         f"💰 **Bonus de bienvenue : +500 ₣** (compte bancaire)."
     ))
 
@@ -601,7 +2569,7 @@ async def modifier_identite(
     await itx.response.defer()
 
     target = cible or itx.user
-    prof = load_profile(target.id)
+    prof = await load_profile_async(target.id)
     if not prof:
         await itx.followup.send(
             embed=embed("Fiche introuvable", "Aucune fiche trouvée. Utilisez d’abord `/generer_carte`."),
@@ -610,14 +2578,16 @@ async def modifier_identite(
         return
 
     # --- Appliquer les modifications demandées, sans toucher au reste ---
+    changes: Dict[str, str] = {}
     if prenom is not None and prenom.strip() != "":
-        prof["prenom"] = prenom.strip()
+        changes["prenom"] = prenom.strip()
     if nom is not None and nom.strip() != "":
-        prof["nom"] = nom.strip()
+        changes["nom"] = nom.strip()
     if titres is not None and titres.strip() != "":
-        prof["titres"] = titres.strip()
+        changes["titres"] = titres.strip()
     if metier is not None and metier.strip() != "":
-        prof["metier"] = metier.strip()
+        changes["metier"] = metier.strip()
+    prof.update(changes)
 
     # Valeurs d’identité pour la génération d’image
     data_img = {
@@ -631,67 +2601,59 @@ async def modifier_identite(
         "metier":        prof.get("metier", "—"),
     }
 
-    # Préparer une image source : pièce jointe > avatar
-    img_bytes: Optional[bytes] = None
-    ext = ".png"
-    if photo is not None:
-        try:
-            img_bytes = await photo.read()
-            ext_att = os.path.splitext(photo.filename)[1].lower()
-            if ext_att in [".png", ".jpg", ".jpeg", ".webp"]:
-                ext = ext_att
-        except Exception:
-            img_bytes = None
-
-    if img_bytes is None:
-        try:
-            asset = target.display_avatar.replace(size=512, format="png")
-            img_bytes = await asset.read()
-            ext = ".png"
-        except Exception:
-            img_bytes = None  # on générera la carte sans photo si vraiment rien
+    # Image source : pièce jointe > photo déjà enregistrée > avatar
+    # (sans photo du tout, la carte est générée sans portrait)
+    try:
+        data_img["photo_bytes"] = await _card_portrait(target, photo, reuse_upload=True)
+    except PhotoTooLarge:
+        await itx.followup.send(embed=embed(
+            "Photo trop grande",
+            f"L’image dépasse {PHOTO_MAX_PIXELS // 1_000_000} mégapixels. Réduisez-la puis réessayez."
+        ))
+        return
+    except PhotoInvalid:
+        await itx.followup.send(embed=embed(
+            "Image invalide",
+            "La pièce jointe n’est pas une image lisible. Réessayez avec un fichier PNG/JPG/WEBP."
+        ))
+        return
 
-    temp_path = None
-    if img_bytes is not None:
-        try:
-            temp_path = os.path.join(ASSETS_DIR, f"photo_{target.id}{ext}")
-            with open(temp_path, "wb") as f:
-                f.write(img_bytes)
-            data_img["photo_path"] = temp_path
-        except Exception:
-            temp_path = None
+    # Mêmes entrées que la carte déjà enregistrée : on la réutilise telle quelle
+    save_path = card_output_path(target.id)
+    render_key = card_render_key(data_img, CURRENT_THEME["name"])
+    changes["carte_hash"] = render_key
+    reused = prof.get("carte_hash") == render_key and await IO_POOL.run(os.path.exists, save_path)
 
     # Générer la nouvelle carte
     try:
-        png_bytes = generate_png_bytes(data_img, style_name=CURRENT_THEME["name"])
-        save_path = card_path_for(target.id)
-        with open(save_path, "wb") as f:
-            f.write(png_bytes)
+        if not reused:
+            png_bytes = await CARD_RENDERER.render(
+                data_img, CURRENT_THEME["name"], on_queued=_render_queue_notifier(itx), user_id=target.id
+            )
+            await IO_POOL.run(write_card_file, target.id, png_bytes)
     except Exception as e:
-        # Nettoyage éventuel
-        if temp_path and os.path.exists(temp_path):
-            try: os.remove(temp_path)
-            except Exception: pass
+        if isinstance(e, RenderQueueFull):
+            await itx.followup.send(embed=embed("Patientez", "Trop de cartes en cours de génération. Réessayez dans un instant."))
+            return
         await itx.followup.send(embed=embed("Erreur", f"Impossible de régénérer la carte : `{e}`"))
         return
 
-    # Nettoyage de la photo temporaire (si utilisée)
-    if temp_path and os.path.exists(temp_path):
-        try: os.remove(temp_path)
-        except Exception: pass
-
-    # ÉCRITURE SÛRE DU PROFIL : on ne passe pas par save_profile() pour ne rien écraser
+    # ÉCRITURE SÛRE DU PROFIL : on ne passe pas par save_profile() pour ne rien écraser.
+    # Le rendu a pris du temps : on repart de la fiche à jour, sous verrou.
     try:
-        with open(profile_path_for(target.id), "w", encoding="utf-8") as f:
-            json.dump(prof, f, ensure_ascii=False, indent=2)
+        async with _profile_lock(target.id):
+            prof = await load_profile_async(target.id) or prof
+            prof.update(changes)
+            await _write_profile_async(target.id, prof)
     except Exception as e:
         await itx.followup.send(embed=embed("Avertissement", f"Carte régénérée, mais échec de sauvegarde du profil : `{e}`"))
         return
 
+    statut = "Carte déjà à jour (aucun changement visible)" if reused else "Carte régénérée"
     await itx.followup.send(embed=embed(
         "Identité mise à jour",
-        f"Carte régénérée pour **{prof.get('prenom','—')} {prof.get('nom','—')}**.\n"
-        f"_Fichier :_ `cards/{target.id}.png`\n"
+        f"{statut} pour **{prof.get('prenom','—')} {prof.get('nom','—')}**.\n"
+        f"_Fichier :_ `cards/{os.path.basename(save_path)}`\n"
         f"ℹ️ Inventaire, propriétés, économie et cooldowns **inchangés**."
     ))
 
@@ -700,7 +2662,7 @@ async def modifier_identite(
 @app_commands.describe(cible="Membre dont on veut afficher la fiche (laisser vide pour la vôtre).")
 async def fiche_personnage(itx: discord.Interaction, cible: Optional[discord.Member]):
     target = cible or itx.user
-    prof = load_profile(target.id)
+    prof = await load_profile_async(target.id)
     if not prof:
         await itx.response.send_message(
             f"Aucune fiche trouvée pour **{target.display_name}**.\n"
@@ -709,17 +2671,6 @@ async def fiche_personnage(itx: discord.Interaction, cible: Optional[discord.Mem
         )
         return
 
-    # Assure les champs d'économie
-    def _ensure_economy_fields_local(p: dict) -> dict:
-        ch = False
-        if p.get("cash")  is None: p["cash"]  = 0; ch = True
-        if p.get("bank")  is None: p["bank"]  = 0; ch = True
-        if p.get("dirty") is None: p["dirty"] = 0; ch = True
-        if ch: save_profile(target.id, p)
-        return p
-
-    prof = _ensure_economy_fields_local(prof)
-
     # Identité
     nom    = prof.get("nom", "—")
     prenom = prof.get("prenom", "—")
@@ -783,16 +2734,19 @@ async def fiche_personnage(itx: discord.Interaction, cible: Optional[discord.Mem
     emb.add_field(name="🏠 Propriétés", value=fmt_dict_flag(proprietes), inline=False)
 
     # Armoiries en miniature si dispo
-    file_to_send = None
-    if os.path.exists(WM_PATH):
-        try:
-            file_to_send = discord.File(WM_PATH, filename="armoiries.png")
-            emb.set_thumbnail(url="attachment://armoiries.png")
-        except Exception:
-            file_to_send = None
-
-    if file_to_send:
-        await itx.response.send_message(embed=emb, file=file_to_send)
+    files: List[discord.File] = []
+    wm_file = ASSETS.attach("armoiries", emb)
+    if wm_file:
+        files.append(wm_file)
+
+    # Aperçu réduit de la carte (si CARD_PREVIEW_WIDTH est activé)
+    preview_path = card_preview_path_for(target.id)
+    if CARD_PREVIEW_WIDTH > 0 and os.path.exists(preview_path):
+        files.append(discord.File(preview_path, filename="carte.jpg"))
+        emb.set_image(url="attachment://carte.jpg")
+
+    if files:
+        await itx.response.send_message(embed=emb, files=files)
     else:
         await itx.response.send_message(embed=emb)
 
@@ -800,7 +2754,7 @@ async def fiche_personnage(itx: discord.Interaction, cible: Optional[discord.Mem
 @app_commands.describe(cible="Membre dont on veut afficher le solde (laisser vide pour la vôtre).")
 async def bal(itx: discord.Interaction, cible: Optional[discord.Member] = None):
     target = cible or itx.user
-    prof = load_profile(target.id)
+    prof = await load_profile_async(target.id)
     if not prof:
         await itx.response.send_message(
             f"Aucune fiche trouvée pour **{target.display_name}**.\nGénérez d’abord une carte avec `/generer_carte`.",
@@ -808,19 +2762,10 @@ async def bal(itx: discord.Interaction, cible: Optional[discord.Member] = None):
         )
         return
 
-    changed = False
-    if prof.get("cash") is None:
-        prof["cash"] = 0; changed = True
-    if prof.get("bank") is None:
-        prof["bank"] = 0; changed = True
-    if prof.get("dirty") is None:
-        prof["dirty"] = 0; changed = True
-    if changed:
-        save_profile(target.id, prof)
-
-    cash  = int(prof.get("cash", 0))
-    bank  = int(prof.get("bank", 0))
-    dirty = int(prof.get("dirty", 0))
+    # Lecture seule : les champs absents valent 0 (rien n'est réécrit)
+    cash  = int(prof.get("cash", 0) or 0)
+    bank  = int(prof.get("bank", 0) or 0)
+    dirty = int(prof.get("dirty", 0) or 0)
     total = cash + bank + dirty
 
     # Rang (leaderboard)
@@ -833,20 +2778,8 @@ async def bal(itx: discord.Interaction, cible: Optional[discord.Member] = None):
         return f"{n}{suffix}"
 
     try:
-        ranks: List[Tuple[int,int]] = []
-        for fname in os.listdir(PROFILES_DIR):
-            if not fname.endswith(".json"):
-                continue
-            pth = os.path.join(PROFILES_DIR, fname)
-            try:
-                with open(pth, "r", encoding="utf-8") as f:
-                    d = json.load(f)
-            except Exception:
-                continue
-            uid = int(d.get("user_id") or os.path.splitext(fname)[0])
-            ranks.append((uid, int(d.get("cash",0)) + int(d.get("bank",0)) + int(d.get("dirty",0))))
-        ranks.sort(key=lambda t: t[1], reverse=True)
-        rank_pos = next((i+1 for i,(uid,_) in enumerate(ranks) if uid == target.id), None)
+        await _ensure_wealth_index()
+        rank_pos = WEALTH_INDEX.rank(target.id)
         rank_str = f"({ordinal_en(rank_pos)})"
     except Exception:
         rank_str = "(–)"
@@ -878,15 +2811,10 @@ async def bal(itx: discord.Interaction, cible: Optional[discord.Member] = None):
     embed_msg.add_field(name="\u200b", value=f"**Total : {_fmt_money(total)}**", inline=False)
 
     # Logo en haut à droite
-    files = []
-    logo_path = os.path.join(ASSETS_DIR, "banque.png")
-    if os.path.exists(logo_path):
-        files = [discord.File(logo_path, filename="banque.png")]
-        embed_msg.set_thumbnail(url="attachment://banque.png")
-
-    try:
-        await itx.response.send_message(embed=embed_msg, file=files[0] if files else None)
-    except Exception:
+    file_obj = ASSETS.attach("banque", embed_msg)
+    if file_obj:
+        await itx.response.send_message(embed=embed_msg, file=file_obj)
+    else:
         await itx.response.send_message(embed=embed_msg)
 
 
@@ -900,14 +2828,13 @@ async def bal(itx: discord.Interaction, cible: Optional[discord.Member] = None):
 async def compte_cmd(itx: discord.Interaction, cible: Optional[discord.Member] = None):
     target = cible or itx.user
 
-    # On s'assure que le profil existe et est cohérent
-    prof = _ensure_profile_skeleton(target.id)
-    prof = _ensure_economy_fields(prof)
+    # On s'assure que le profil existe et est cohérent (sous verrou, comme les autres commandes)
+    async with profile_transaction(target.id) as tx:
+        prof = tx[target.id]
 
-    # Si jamais la clé n'existe pas encore, par défaut : compte ouvert
-    if "compte_bloque" not in prof:
-        prof["compte_bloque"] = False
-        save_profile(target.id, prof)
+        # Si jamais la clé n'existe pas encore, par défaut : compte ouvert
+        if "compte_bloque" not in prof:
+            prof["compte_bloque"] = False
 
     # Construire l'embed + logo de la banque
     emb, file_obj = _build_compte_embed_for_user(
@@ -945,49 +2872,451 @@ async def backup_now_cmd(itx: discord.Interaction):
         )
         return
 
-    # On fabrique un zip temporaire
-    backup_filename = f"backup_now_{int(time.time())}.zip"
-    zip_path = os.path.join(BASE_DIR, backup_filename)
-
-    import zipfile
-
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
-        # Profils
-        if os.path.isdir(PROFILES_DIR):
-            for root, _, files in os.walk(PROFILES_DIR):
-                for f in files:
-                    full_path = os.path.join(root, f)
-                    relative_path = os.path.relpath(full_path, BASE_DIR)
-                    archive.write(full_path, relative_path)
-
-        # Cartes
-        if os.path.isdir(CARDS_DIR):
-            for root, _, files in os.walk(CARDS_DIR):
-                for f in files:
-                    full_path = os.path.join(root, f)
-                    relative_path = os.path.relpath(full_path, BASE_DIR)
-                    archive.write(full_path, relative_path)
-
-    # Envoi du fichier dans le salon
-    file = discord.File(zip_path, filename=backup_filename)
-
-    await channel.send(
-        f"📦 **Sauvegarde forcée manuellement** demandée par {itx.user.mention}.",
-        file=file
+    # La compression peut prendre du temps : on répond tout de suite
+    await itx.response.defer(ephemeral=True)
+
+    # Point de reprise complet (les sauvegardes horaires suivantes en seront des deltas)
+    await run_backup(
+        channel,
+        f"📦 **Sauvegarde forcée manuellement** demandée par {itx.user.mention}",
+        full=True,
     )
 
-    await itx.response.send_message(
+    await itx.followup.send(
         "✅ Sauvegarde effectuée et envoyée dans le salon de backup.",
         ephemeral=True
     )
 
-    # Supprimer la version locale pour ne pas remplir Render
+# ---------- Restauration des sauvegardes ----------
+# /backup_restore reconstruit cards/ et profiles/ à partir d'archives jointes ou,
+# sans pièce jointe, de la dernière chaîne (point de reprise + deltas) du salon de backup.
+# Tout est vérifié (sha256 du manifeste) et extrait dans un dossier de travail par
+# le pool d'E/S ; les dossiers en service ne sont remplacés (renommage) qu'à la fin.
+BACKUP_NAME_RE = re.compile(
+    r"^(?P<name>backup_red_louisiana_.+?_(?:full|delta\d+))(?:_part(?P<part>\d+)of(?P<parts>\d+))?\.zip$"
+)
+BACKUP_RESTORE_SCAN = int(os.getenv("BACKUP_RESTORE_SCAN", "1000"))
+RESTORE_STAGING_DIR = os.path.join(BASE_DIR, ".restore_staging")
+RESTORE_TRASH_DIR = os.path.join(BASE_DIR, ".restore_old")
+
+class RestoreError(RuntimeError):
+    pass
+
+def _backup_roots() -> List[str]:
+    return [os.path.relpath(p, BASE_DIR).replace(os.sep, "/") for p in BACKUP_PATHS]
+
+def _group_backup_volumes(paths: List[str]) -> List[dict]:
+    """Regroupe les volumes téléchargés par archive et lit leur manifeste (thread IO)."""
+    groups: Dict[str, List[Tuple[int, str]]] = {}
+    for path in paths:
+        m = BACKUP_NAME_RE.match(os.path.basename(path))
+        key = m.group("name") if m else os.path.basename(path)
+        part = int(m.group("part") or 1) if m else 1
+        groups.setdefault(key, []).append((part, path))
+
+    archives = []
+    for key, vols in groups.items():
+        vols.sort()
+        manifest = None
+        for _, path in vols:
+            try:
+                with zipfile.ZipFile(path) as z:
+                    if BACKUP_ARCHIVE_MANIFEST in z.namelist():
+                        manifest = json.loads(z.read(BACKUP_ARCHIVE_MANIFEST))
+            except zipfile.BadZipFile:
+                raise RestoreError(f"{os.path.basename(path)} n'est pas une archive ZIP valide.")
+        if manifest is not None and len(vols) != int(manifest.get("volumes", 1)):
+            raise RestoreError(f"{key} : {len(vols)} volume(s) reçu(s) sur {manifest.get('volumes')}.")
+        archives.append({"name": key, "paths": [p for _, p in vols], "manifest": manifest})
+    return archives
+
+def _restore_chain(archives: List[dict]) -> Tuple[List[dict], List[str]]:
+    """Dernier point de reprise puis ses deltas consécutifs. Renvoie (chaîne, avertissements)."""
+    notes = []
+    fulls = [a for a in archives if a["manifest"] and a["manifest"]["kind"] == "full"]
+    legacy = [a for a in archives if a["manifest"] is None]
+    if not fulls:
+        if len(legacy) == 1:
+            notes.append("Ancienne archive sans manifeste : seuls les CRC du ZIP sont vérifiés.")
+            return legacy, notes
+        raise RestoreError("Aucune sauvegarde complète (point de reprise) parmi les archives.")
+    base = max(fulls, key=lambda a: a["manifest"]["id"])
+    chain = [base]
+    deltas = sorted(
+        (a for a in archives if a["manifest"] and a["manifest"]["kind"] == "delta"
+         and a["manifest"].get("checkpoint") == base["manifest"]["id"]),
+        key=lambda a: a["manifest"]["seq"],
+    )
+    for delta in deltas:
+        prev = chain[-1]["manifest"]
+        if delta["manifest"]["seq"] != prev["seq"] + 1 or delta["manifest"].get("previous") != prev["id"]:
+            notes.append(f"Chaîne interrompue après le delta n°{prev['seq']} : les deltas suivants sont ignorés.")
+            break
+        chain.append(delta)
+    if len(archives) > len(chain):
+        notes.append(f"{len(archives) - len(chain)} archive(s) non utilisée(s).")
+    return chain, notes
+
+def _extract_restore(chain: List[dict], staging: str) -> Dict[str, list]:
+    """Rejoue la chaîne dans `staging` en vérifiant chaque empreinte. Renvoie le manifeste final."""
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    roots = _backup_roots()
+    for root in roots:
+        os.makedirs(os.path.join(staging, root), exist_ok=True)
+
+    final: Dict[str, list] = {}
+    for archive in chain:
+        manifest = archive["manifest"]
+        expected = manifest["files"] if manifest else None
+        seen = set()
+        for path in archive["paths"]:
+            with zipfile.ZipFile(path) as z:
+                for info in z.infolist():
+                    rel = info.filename
+                    if rel == BACKUP_ARCHIVE_MANIFEST or rel.endswith("/"):
+                        continue
+                    norm = os.path.normpath(rel).replace(os.sep, "/")
+                    if norm.startswith("../") or os.path.isabs(norm) or norm.split("/", 1)[0] not in roots:
+                        raise RestoreError(f"Chemin refusé dans {archive['name']} : {rel}")
+                    target = os.path.join(staging, norm)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    h = hashlib.sha256()
+                    size = 0
+                    with z.open(info) as src, open(target, "wb") as dst:
+                        for chunk in iter(lambda: src.read(1 << 20), b""):
+                            h.update(chunk)
+                            dst.write(chunk)
+                            size += len(chunk)
+                    digest = h.hexdigest()
+                    if expected is not None and (expected.get(norm) or [None] * 3)[2] != digest:
+                        raise RestoreError(f"Empreinte invalide pour {norm} dans {archive['name']}.")
+                    final[norm] = [size, 0, digest]
+                    seen.add(norm)
+        if manifest is None:
+            continue
+        missing = set(manifest["changed"]) - seen
+        if missing:
+            raise RestoreError(f"{archive['name']} : {len(missing)} fichier(s) annoncé(s) absent(s) (ex. {sorted(missing)[0]}).")
+        for rel in manifest["deleted"]:
+            _remove_if_exists(os.path.join(staging, rel))
+            final.pop(rel, None)
+
+    # L'état reconstruit doit être exactement celui du dernier manifeste
+    last = chain[-1]["manifest"]
+    if last is not None:
+        if set(final) != set(last["files"]) or any(final[r][2] != last["files"][r][2] for r in final):
+            raise RestoreError("L'état reconstruit ne correspond pas au dernier manifeste de la chaîne.")
+    return final
+
+def _swap_restored(staging: str) -> None:
+    """Remplace les dossiers en service par ceux du dossier de travail (renommages)."""
+    if os.path.exists(RESTORE_TRASH_DIR):
+        shutil.rmtree(RESTORE_TRASH_DIR)
+    os.makedirs(RESTORE_TRASH_DIR)
+    # Aucune écriture de profil pendant l'échange ; les fiches en attente sont abandonnées
+    with _PROFILE_PERSIST_LOCK:
+        PROFILE_CACHE.clear()
+        _PROFILE_PERSISTED_DIGEST.clear()
+        for live in BACKUP_PATHS:
+            rel = os.path.relpath(live, BASE_DIR)
+            if os.path.exists(live):
+                os.replace(live, os.path.join(RESTORE_TRASH_DIR, rel))
+            os.replace(os.path.join(staging, rel), live)
+        if isinstance(PROFILE_STORE, SqliteProfileStore):
+            PROFILE_STORE.reopen()
+    shutil.rmtree(RESTORE_TRASH_DIR, ignore_errors=True)
+    shutil.rmtree(staging, ignore_errors=True)
+
+def _after_restore(files: Dict[str, list]) -> int:
+    """
+    Reconstruit les index en mémoire. Portraits et couches (aperçus compris) sont
+    plus récents que les cartes restaurées : ils sont oubliés et seront recalculés.
+    La prochaine sauvegarde est un nouveau point de reprise : des deltas postérieurs
+    à l'archive restaurée peuvent encore exister dans le salon, on ne prolonge pas sa chaîne.
+    """
+    PROFILE_CACHE.clear()
+    _PROFILE_PERSISTED_DIGEST.clear()
+    count = build_wealth_index()
+    build_cooldown_index()
+    PORTRAITS.clear()
+    shutil.rmtree(CARD_LAYERS_DIR, ignore_errors=True)
+    os.makedirs(CARD_LAYERS_DIR, exist_ok=True)
+    save_backup_manifest({"files": files})
+    return count
+
+async def _download_backup_chain(channel, folder: str) -> List[str]:
+    """Volumes de la dernière chaîne du salon de backup (du plus récent au point de reprise)."""
+    wanted: List[discord.Attachment] = []
+    parts_seen: Dict[str, set] = {}
+    async for message in channel.history(limit=BACKUP_RESTORE_SCAN):
+        done = False
+        for att in message.attachments:
+            m = BACKUP_NAME_RE.match(att.filename)
+            if not m:
+                continue
+            wanted.append(att)
+            name = m.group("name")
+            parts_seen.setdefault(name, set()).add(int(m.group("part") or 1))
+            if name.endswith("_full") and len(parts_seen[name]) == int(m.group("parts") or 1):
+                done = True
+        if done:
+            break
+    else:
+        if not any(n.endswith("_full") for n in parts_seen):
+            raise RestoreError("Aucun point de reprise trouvé dans le salon de backup.")
+    paths = []
+    for att in wanted:
+        path = os.path.join(folder, att.filename)
+        await IO_POOL.run(_write_bytes, path, await att.read())
+        paths.append(path)
+    return paths
+
+@bot.tree.command(
+    name="backup_restore",
+    description="Restaurer profils et cartes depuis des archives jointes ou la dernière chaîne du salon de backup."
+)
+@app_commands.describe(
+    archive="Archive (ou volume) de sauvegarde ; sans pièce jointe, la dernière chaîne du salon est utilisée",
+    archive2="Volume ou delta supplémentaire",
+    archive3="Volume ou delta supplémentaire",
+    archive4="Volume ou delta supplémentaire",
+)
+@app_commands.default_permissions(administrator=True)
+async def backup_restore_cmd(
+    itx: discord.Interaction,
+    archive: Optional[discord.Attachment] = None,
+    archive2: Optional[discord.Attachment] = None,
+    archive3: Optional[discord.Attachment] = None,
+    archive4: Optional[discord.Attachment] = None,
+):
+    await itx.response.defer(ephemeral=True)
+    attachments = [a for a in (archive, archive2, archive3, archive4) if a is not None]
+    download_dir = os.path.join(BASE_DIR, ".restore_download")
+    started = time.perf_counter()
+    async with _BACKUP_LOCK:
+        try:
+            await IO_POOL.run(shutil.rmtree, download_dir, True)
+            await IO_POOL.run(os.makedirs, download_dir)
+            if attachments:
+                paths = []
+                for att in attachments:
+                    path = os.path.join(download_dir, att.filename)
+                    await IO_POOL.run(_write_bytes, path, await att.read())
+                    paths.append(path)
+            else:
+                channel = bot.get_channel(BACKUP_CHANNEL_ID)
+                if channel is None:
+                    raise RestoreError("Salon de backup introuvable.")
+                paths = await _download_backup_chain(channel, download_dir)
+            t_download = time.perf_counter()
+
+            archives = await IO_POOL.run(_group_backup_volumes, paths)
+            chain, notes = _restore_chain(archives)
+            files = await IO_POOL.run(_extract_restore, chain, RESTORE_STAGING_DIR)
+            t_extract = time.perf_counter()
+        except (RestoreError, zipfile.BadZipFile, OSError, KeyError, ValueError, discord.HTTPException) as e:
+            await IO_POOL.run(shutil.rmtree, RESTORE_STAGING_DIR, True)
+            await itx.followup.send(f"❌ Restauration annulée (données en service intactes) : {e}", ephemeral=True)
+            return
+        finally:
+            await IO_POOL.run(shutil.rmtree, download_dir, True)
+
+        # Point de non-retour : tout est vérifié, on échange les dossiers
+        await IO_POOL.run(_swap_restored, RESTORE_STAGING_DIR)
+        t_swap = time.perf_counter()
+        count = await IO_POOL.run(_after_restore, files)
+        t_done = time.perf_counter()
+
+    last = chain[-1]["manifest"]
+    origin = f"{last['checkpoint']} + {last['seq']} delta(s)" if last else chain[0]["name"]
+    lines = [
+        f"✅ Restauration terminée : **{len(files)}** fichier(s) vérifié(s), {count} profil(s) classé(s).",
+        f"Source : {origin} • {sum(len(a['paths']) for a in chain)} volume(s)",
+        f"Durée : **{(t_done - started):.1f} s** (téléchargement {(t_download - started):.1f} s • "
+        f"vérification + extraction {(t_extract - t_download):.1f} s • échange {(t_swap - t_extract) * 1000:.0f} ms • "
+        f"index {(t_done - t_swap) * 1000:.0f} ms)",
+        "La prochaine sauvegarde automatique sera complète (nouveau point de reprise).",
+    ]
+    lines += [f"⚠️ {n}" for n in notes]
+    print(f"[RESTAURATION] {len(files)} fichier(s) depuis {origin} en {(t_done - started):.1f} s.")
+    await itx.followup.send("\n".join(lines), ephemeral=True)
+
+def _list_card_files() -> List[str]:
+    exts = set(CARD_FORMATS.values())
+    return sorted(
+        os.path.join(CARDS_DIR, f) for f in os.listdir(CARDS_DIR)
+        if os.path.splitext(f)[1] in exts and os.path.splitext(f)[0].isdigit()
+    )
+
+@bot.tree.command(
+    name="recompresser_cartes",
+    description="Maintenance : ré-encoder toutes les cartes existantes au format configuré."
+)
+@app_commands.default_permissions(administrator=True)
+async def recompresser_cartes_cmd(itx: discord.Interaction):
+    await itx.response.defer(ephemeral=True)
+    started = time.perf_counter()
+    paths = await IO_POOL.run(_list_card_files)
+
+    # Toutes les cartes sont soumises d'un coup : le pool CPU les traite en parallèle
+    results = await asyncio.gather(
+        *(CPU_POOL.run(recompress_card_file, p) for p in paths),
+        return_exceptions=True
+    )
+    before = after = failed = 0
+    for res in results:
+        if isinstance(res, Exception):
+            failed += 1
+            continue
+        before += res[0]
+        after += res[1]
+
+    mo = lambda n: f"{n / (1024 * 1024):.1f} Mo"
+    delta = ((after - before) / before) if before else 0.0
+    await itx.followup.send(
+        f"🗜️ **{len(paths) - failed}** carte(s) ré-encodée(s) en **{CARD_FORMAT}** "
+        f"en {time.perf_counter() - started:.1f} s.\n"
+        f"Taille : {mo(before)} ➜ **{mo(after)}** ({delta:+.0%})"
+        + (f"\n⚠️ {failed} échec(s)." if failed else ""),
+        ephemeral=True
+    )
+
+
+
+# ========= RE-RENDU DE TOUTES LES CARTES (changement de thème) =========
+# Le travail est décrit dans rerender_job.json (thème, cartes restantes, message
+# de progression) et mis à jour après chaque lot : si le bot redémarre, il reprend
+# là où il s'était arrêté.
+RERENDER_JOB_PATH = os.path.join(BASE_DIR, "rerender_job.json")
+_RERENDER_TASK: Optional[asyncio.Task] = None
+
+def _load_rerender_job() -> Optional[dict]:
     try:
-        os.remove(zip_path)
-    except:
-        pass
+        with open(RERENDER_JOB_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def _save_rerender_job(job: dict) -> None:
+    def _write(tmp: str):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+    _replace_file(RERENDER_JOB_PATH, _write)
+
+def _rerender_progress_text(job: dict, finished: bool = False) -> str:
+    done, total = job["done"], job["total"]
+    bar_len = 20
+    filled = int(bar_len * done / total) if total else bar_len
+    head = "✅ Re-rendu des cartes terminé" if finished else "🖌️ Re-rendu des cartes en cours"
+    txt = (
+        f"{head} — style **{job['theme']}**\n"
+        f"`{'█' * filled}{'░' * (bar_len - filled)}` {done}/{total}"
+    )
+    if job["failed"]:
+        txt += f" • ⚠️ {len(job['failed'])} échec(s)"
+    if finished:
+        txt += f"\nDurée : {time.time() - job['started']:.1f} s"
+    return txt
+
+async def _rerender_progress_message(job: dict) -> Optional[discord.Message]:
+    channel = bot.get_channel(job.get("channel_id") or 0)
+    if channel is None:
+        return None
+    if job.get("message_id"):
+        try:
+            return await channel.fetch_message(job["message_id"])
+        except Exception:
+            pass
+    msg = await channel.send(_rerender_progress_text(job))
+    job["message_id"] = msg.id
+    return msg
+
+async def _run_rerender_job(job: dict):
+    msg = await _rerender_progress_message(job)
+    batch_size = max(1, CPU_POOL.max_workers * 2)
+    last_edit = time.time()
+    while job["pending"]:
+        batch = job["pending"][:batch_size]
+        profiles = [(uid, await load_profile_async(uid)) for uid in batch]
+        portraits = {uid: await IO_POOL.run(PORTRAITS.read, uid) for uid, prof in profiles if prof}
+        results = await asyncio.gather(
+            *(CPU_POOL.run(rerender_card_file, uid, prof, job["theme"], portraits[uid]) for uid, prof in profiles if prof),
+            return_exceptions=True
+        )
+        rendered = [uid for uid, prof in profiles if prof]
+        for uid, res in zip(rendered, results):
+            if isinstance(res, Exception):
+                job["failed"].append(uid)
+                print(f"[RE-RENDU][ERREUR] Carte {uid} : {res}")
+                continue
+            # La carte enregistrée a changé : sa clé de rendu aussi, sinon
+            # /modifier_identite croirait encore à jour la carte de l'ancien thème
+            try:
+                async with profile_transaction(uid, economy=False) as tx:
+                    tx[uid]["carte_hash"] = res[1]
+            except Exception as e:
+                print(f"[RE-RENDU][ERREUR] Profil {uid} : {e}")
+        job["pending"] = job["pending"][len(batch):]
+        job["done"] += len(batch)
+        await IO_POOL.run(_save_rerender_job, job)
+        if msg and time.time() - last_edit >= 2:
+            last_edit = time.time()
+            try:
+                await msg.edit(content=_rerender_progress_text(job))
+            except Exception:
+                pass
+
+    if msg:
+        try:
+            await msg.edit(content=_rerender_progress_text(job, finished=True))
+        except Exception:
+            pass
+    await IO_POOL.run(_remove_if_exists, RERENDER_JOB_PATH)
+    print(f"[RE-RENDU] {job['done']} carte(s) en {time.time() - job['started']:.1f} s ({len(job['failed'])} échec(s)).")
+
+def _start_rerender_job(job: dict) -> None:
+    global _RERENDER_TASK
+    _RERENDER_TASK = asyncio.create_task(_run_rerender_job(job))
 
+def _resume_rerender_job() -> None:
+    if _RERENDER_TASK is not None and not _RERENDER_TASK.done():
+        return
+    job = _load_rerender_job()
+    if job and job.get("pending"):
+        print(f"[RE-RENDU] Reprise : {len(job['pending'])} carte(s) restante(s).")
+        _start_rerender_job(job)
 
+@bot.tree.command(
+    name="rerendre_cartes",
+    description="Maintenance : régénérer toutes les cartes existantes avec le style actuel."
+)
+@app_commands.default_permissions(administrator=True)
+async def rerendre_cartes_cmd(itx: discord.Interaction):
+    if _RERENDER_TASK is not None and not _RERENDER_TASK.done():
+        await itx.response.send_message("Un re-rendu des cartes est déjà en cours.", ephemeral=True)
+        return
+    await itx.response.defer(ephemeral=True)
+
+    paths = await IO_POOL.run(_list_card_files)
+    user_ids = sorted({int(os.path.splitext(os.path.basename(p))[0]) for p in paths})
+    job = {
+        "theme": CURRENT_THEME["name"],
+        "started": time.time(),
+        "total": len(user_ids),
+        "done": 0,
+        "pending": user_ids,
+        "failed": [],
+        "channel_id": itx.channel.id if itx.channel else None,
+        "message_id": None,
+    }
+    await IO_POOL.run(_save_rerender_job, job)
+    _start_rerender_job(job)
+    await itx.followup.send(
+        f"🖌️ Re-rendu de **{len(user_ids)}** carte(s) lancé (style **{job['theme']}**). "
+        "La progression s’affiche dans ce salon.",
+        ephemeral=True
+    )
 
 # ========= COMMANDES ÉCONOMIE =========
 
@@ -1018,10 +3347,9 @@ async def add_money(
         await itx.response.send_message("Poche invalide (bank, cash, dirty).", ephemeral=True)
         return
 
-    prof = _ensure_profile_skeleton(cible.id)
-    prof = _ensure_economy_fields(prof)
-    prof[wallet] = int(prof.get(wallet, 0)) + int(montant)
-    save_profile(cible.id, prof)
+    async with profile_transaction(cible.id) as tx:
+        prof = tx[cible.id]
+        prof[wallet] = int(prof.get(wallet, 0)) + int(montant)
 
     total = int(prof.get("cash", 0)) + int(prof.get("bank", 0)) + int(prof.get("dirty", 0))
     await itx.response.send_message(
@@ -1051,10 +3379,9 @@ async def remove_money(
         await itx.response.send_message("Poche invalide (bank, cash, dirty).", ephemeral=True)
         return
 
-    prof = _ensure_profile_skeleton(cible.id)
-    prof = _ensure_economy_fields(prof)
-    prof[wallet] = int(prof.get(wallet, 0)) - int(montant)  # peut devenir négatif
-    save_profile(cible.id, prof)
+    async with profile_transaction(cible.id) as tx:
+        prof = tx[cible.id]
+        prof[wallet] = int(prof.get(wallet, 0)) - int(montant)  # peut devenir négatif
 
     total = int(prof.get("cash", 0)) + int(prof.get("bank", 0)) + int(prof.get("dirty", 0))
     await itx.response.send_message(
@@ -1096,30 +3423,29 @@ def _parse_amount_input(txt: str, available: int) -> Optional[int]:
 @app_commands.describe(montant='Montant (>0) ou "all"')
 async def with_cmd(itx: discord.Interaction, montant: str):
     user = itx.user
-    prof = _ensure_profile_skeleton(user.id)
-    prof = _ensure_economy_fields(prof)
+    async with profile_transaction(user.id) as tx:
+        prof = tx[user.id]
 
-    # 🔒 Si le compte est bloqué : refus
-    if prof.get("compte_bloque"):
-        await _reply_account_blocked(itx)
-        return
+        # 🔒 Si le compte est bloqué : refus
+        if prof.get("compte_bloque"):
+            await _reply_account_blocked(itx)
+            return
 
 
-    bank = int(prof.get("bank", 0))
-    amt = _parse_amount_input(montant, bank)
-    if amt is None:
-        await itx.response.send_message('Montant invalide. Utilisez un entier > 0 ou "all".', ephemeral=True)
-        return
-    if bank <= 0:
-        await itx.response.send_message("Votre compte bancaire est vide.", ephemeral=True)
-        return
-    if amt > bank:
-        await itx.response.send_message(f"Solde insuffisant : {_fmt_money(bank)} disponibles.", ephemeral=True)
-        return
+        bank = int(prof.get("bank", 0))
+        amt = _parse_amount_input(montant, bank)
+        if amt is None:
+            await itx.response.send_message('Montant invalide. Utilisez un entier > 0 ou "all".', ephemeral=True)
+            return
+        if bank <= 0:
+            await itx.response.send_message("Votre compte bancaire est vide.", ephemeral=True)
+            return
+        if amt > bank:
+            await itx.response.send_message(f"Solde insuffisant : {_fmt_money(bank)} disponibles.", ephemeral=True)
+            return
 
-    prof["bank"] = bank - amt
-    prof["cash"] = int(prof.get("cash", 0)) + amt
-    save_profile(user.id, prof)
+        prof["bank"] = bank - amt
+        prof["cash"] = int(prof.get("cash", 0)) + amt
 
     await itx.response.send_message(
         f"🏦 ➜ 💵 **Retrait** : +{_fmt_money(amt)} en cash\n"
@@ -1130,29 +3456,28 @@ async def with_cmd(itx: discord.Interaction, montant: str):
 @app_commands.describe(montant='Montant (>0) ou "all"')
 async def dep_cmd(itx: discord.Interaction, montant: str):
     user = itx.user
-    prof = _ensure_profile_skeleton(user.id)
-    prof = _ensure_economy_fields(prof)
+    async with profile_transaction(user.id) as tx:
+        prof = tx[user.id]
 
-    # 🔒 Compte bloqué ?
-    if prof.get("compte_bloque"):
-        await _reply_account_blocked(itx)
-        return
+        # 🔒 Compte bloqué ?
+        if prof.get("compte_bloque"):
+            await _reply_account_blocked(itx)
+            return
 
-    cash = int(prof.get("cash", 0))
-    amt = _parse_amount_input(montant, cash)
-    if amt is None:
-        await itx.response.send_message('Montant invalide. Utilisez un entier > 0 ou "all".', ephemeral=True)
-        return
-    if cash <= 0:
-        await itx.response.send_message("Vous n'avez pas de cash à déposer.", ephemeral=True)
-        return
-    if amt > cash:
-        await itx.response.send_message(f"Cash insuffisant : {_fmt_money(cash)} disponibles.", ephemeral=True)
-        return
+        cash = int(prof.get("cash", 0))
+        amt = _parse_amount_input(montant, cash)
+        if amt is None:
+            await itx.response.send_message('Montant invalide. Utilisez un entier > 0 ou "all".', ephemeral=True)
+            return
+        if cash <= 0:
+            await itx.response.send_message("Vous n'avez pas de cash à déposer.", ephemeral=True)
+            return
+        if amt > cash:
+            await itx.response.send_message(f"Cash insuffisant : {_fmt_money(cash)} disponibles.", ephemeral=True)
+            return
 
-    prof["cash"] = cash - amt
-    prof["bank"] = int(prof.get("bank", 0)) + amt
-    save_profile(user.id, prof)
+        prof["cash"] = cash - amt
+        prof["bank"] = int(prof.get("bank", 0)) + amt
 
     await itx.response.send_message(
         f"💵 ➜ 🏦 **Dépôt** : +{_fmt_money(amt)} en banque\n"
@@ -1170,26 +3495,22 @@ async def pay_cmd(itx: discord.Interaction, beneficiaire: discord.Member, montan
         await itx.response.send_message("Montant invalide (entier > 0).", ephemeral=True)
         return
 
-    prof_p = _ensure_profile_skeleton(payeur.id)
-    prof_p = _ensure_economy_fields(prof_p)
+    async with profile_transaction(payeur.id, beneficiaire.id) as tx:
+        prof_p = tx[payeur.id]
+        prof_b = tx[beneficiaire.id]
 
-    # 🔒 Compte bloqué ?
-    if prof.get("compte_bloque"):
-        await _reply_account_blocked(itx)
-        return
-        
-    prof_b = _ensure_profile_skeleton(beneficiaire.id)
-    prof_b = _ensure_economy_fields(prof_b)
+        # 🔒 Compte bloqué ?
+        if prof_p.get("compte_bloque"):
+            await _reply_account_blocked(itx)
+            return
 
-    cash_p = int(prof_p.get("cash", 0))
-    if montant > cash_p:
-        await itx.response.send_message(f"Cash insuffisant. Vous avez {_fmt_money(cash_p)}.", ephemeral=True)
-        return
+        cash_p = int(prof_p.get("cash", 0))
+        if montant > cash_p:
+            await itx.response.send_message(f"Cash insuffisant. Vous avez {_fmt_money(cash_p)}.", ephemeral=True)
+            return
 
-    prof_p["cash"] = cash_p - montant
-    prof_b["cash"] = int(prof_b.get("cash", 0)) + montant
-    save_profile(payeur.id, prof_p)
-    save_profile(beneficiaire.id, prof_b)
+        prof_p["cash"] = cash_p - montant
+        prof_b["cash"] = int(prof_b.get("cash", 0)) + montant
 
     await itx.response.send_message(
         f"🤝 **Paiement envoyé** : {beneficiaire.mention} reçoit {_fmt_money(montant)} (cash).\n"
@@ -1207,20 +3528,17 @@ async def paycrime_cmd(itx: discord.Interaction, beneficiaire: discord.Member, m
         await itx.response.send_message("Montant invalide (entier > 0).", ephemeral=True)
         return
 
-    prof_p = _ensure_profile_skeleton(payeur.id)
-    prof_p = _ensure_economy_fields(prof_p)
-    prof_b = _ensure_profile_skeleton(beneficiaire.id)
-    prof_b = _ensure_economy_fields(prof_b)
+    async with profile_transaction(payeur.id, beneficiaire.id) as tx:
+        prof_p = tx[payeur.id]
+        prof_b = tx[beneficiaire.id]
 
-    dirty_p = int(prof_p.get("dirty", 0))
-    if montant > dirty_p:
-        await itx.response.send_message(f"Argent sale insuffisant. Vous avez {_fmt_money(dirty_p)}.", ephemeral=True)
-        return
+        dirty_p = int(prof_p.get("dirty", 0))
+        if montant > dirty_p:
+            await itx.response.send_message(f"Argent sale insuffisant. Vous avez {_fmt_money(dirty_p)}.", ephemeral=True)
+            return
 
-    prof_p["dirty"] = dirty_p - montant
-    prof_b["dirty"] = int(prof_b.get("dirty", 0)) + montant
-    save_profile(payeur.id, prof_p)
-    save_profile(beneficiaire.id, prof_b)
+        prof_p["dirty"] = dirty_p - montant
+        prof_b["dirty"] = int(prof_b.get("dirty", 0)) + montant
 
     await itx.response.send_message(
         f"🕶️ **Paiement clandestin envoyé** : {beneficiaire.mention} reçoit {_fmt_money(montant)} (argent sale).\n"
@@ -1257,12 +3575,12 @@ async def add_armes(itx: discord.Interaction,
         return
 
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    armes = prof["inventaire"]["armes"]
-    current = int(armes.get(item.value, 0))
-    new_val = current + q
-    _set_arme_count(armes, item.value, new_val)
-    save_profile(target.id, prof)
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        armes = prof["inventaire"]["armes"]
+        current = int(armes.get(item.value, 0))
+        new_val = current + q
+        _set_arme_count(armes, item.value, new_val)
 
     await itx.response.send_message(
         f"✅ **{item.value}** ×{q} ajouté à l’inventaire de **{target.display_name}**. "
@@ -1279,29 +3597,28 @@ async def remove_armes(itx: discord.Interaction,
                        item: app_commands.Choice[str],
                        quantite: str):
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    armes = prof["inventaire"]["armes"]
-    current = int(armes.get(item.value, 0))
-
-    if quantite.strip().lower() == "all":
-        _set_arme_count(armes, item.value, 0)
-        save_profile(target.id, prof)
-        await itx.response.send_message(
-            f"🗑️ **{item.value}** retiré entièrement de l’inventaire de **{target.display_name}**."
-        )
-        return
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        armes = prof["inventaire"]["armes"]
+        current = int(armes.get(item.value, 0))
+
+        if quantite.strip().lower() == "all":
+            _set_arme_count(armes, item.value, 0)
+            await itx.response.send_message(
+                f"🗑️ **{item.value}** retiré entièrement de l’inventaire de **{target.display_name}**."
+            )
+            return
 
-    try:
-        q = int(quantite)
-        if q <= 0:
-            raise ValueError
-    except Exception:
-        await itx.response.send_message("La quantité doit être un entier (>0) ou **all**.", ephemeral=True)
-        return
+        try:
+            q = int(quantite)
+            if q <= 0:
+                raise ValueError
+        except Exception:
+            await itx.response.send_message("La quantité doit être un entier (>0) ou **all**.", ephemeral=True)
+            return
 
-    new_val = max(0, current - q)
-    _set_arme_count(armes, item.value, new_val)
-    save_profile(target.id, prof)
+        new_val = max(0, current - q)
+        _set_arme_count(armes, item.value, new_val)
 
     await itx.response.send_message(
         f"➖ **{item.value}** −{q} pour **{target.display_name}**. "
@@ -1337,12 +3654,12 @@ async def add_horse(itx: discord.Interaction,
         return
 
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    chevaux = prof["inventaire"]["chevaux"]
-    current = int(chevaux.get(item.value, 0))
-    new_val = current + q
-    chevaux[item.value] = new_val
-    save_profile(target.id, prof)
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        chevaux = prof["inventaire"]["chevaux"]
+        current = int(chevaux.get(item.value, 0))
+        new_val = current + q
+        chevaux[item.value] = new_val
 
     await itx.response.send_message(
         f"✅ **{item.value}** ×{q} ajouté à l’inventaire de **{target.display_name}**. "
@@ -1360,33 +3677,31 @@ async def remove_horse(itx: discord.Interaction,
                        quantite: str):
 
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    chevaux = prof["inventaire"]["chevaux"]
-    current = int(chevaux.get(item.value, 0))
-
-    if quantite.strip().lower() == "all":
-        chevaux.pop(item.value, None)
-        save_profile(target.id, prof)
-        await itx.response.send_message(
-            f"🗑️ **{item.value}** retiré entièrement de l’inventaire de **{target.display_name}**."
-        )
-        return
-
-    try:
-        q = int(quantite)
-        if q <= 0:
-            raise ValueError
-    except Exception:
-        await itx.response.send_message("La quantité doit être un entier (>0) ou **all**.", ephemeral=True)
-        return
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        chevaux = prof["inventaire"]["chevaux"]
+        current = int(chevaux.get(item.value, 0))
+
+        if quantite.strip().lower() == "all":
+            chevaux.pop(item.value, None)
+            await itx.response.send_message(
+                f"🗑️ **{item.value}** retiré entièrement de l’inventaire de **{target.display_name}**."
+            )
+            return
 
-    new_val = max(0, current - q)
-    if new_val == 0:
-        chevaux.pop(item.value, None)
-    else:
-        chevaux[item.value] = new_val
+        try:
+            q = int(quantite)
+            if q <= 0:
+                raise ValueError
+        except Exception:
+            await itx.response.send_message("La quantité doit être un entier (>0) ou **all**.", ephemeral=True)
+            return
 
-    save_profile(target.id, prof)
+        new_val = max(0, current - q)
+        if new_val == 0:
+            chevaux.pop(item.value, None)
+        else:
+            chevaux[item.value] = new_val
 
     await itx.response.send_message(
         f"➖ **{item.value}** −{q} pour **{target.display_name}**. "
@@ -1410,11 +3725,11 @@ async def add_property(itx: discord.Interaction,
                        cible: Optional[discord.Member],
                        item: app_commands.Choice[str]):
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    props = prof.get("proprietes", {})
-    props[item.value] = "acquise"
-    prof["proprietes"] = props
-    save_profile(target.id, prof)
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        props = prof.get("proprietes", {})
+        props[item.value] = "acquise"
+        prof["proprietes"] = props
 
     await itx.response.send_message(
         f"🏠 **{item.value}** ajoutée aux propriétés de **{target.display_name}**."
@@ -1428,11 +3743,11 @@ async def remove_property(itx: discord.Interaction,
                           cible: Optional[discord.Member],
                           item: app_commands.Choice[str]):
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    props = prof.get("proprietes", {})
-    existed = props.pop(item.value, None)
-    prof["proprietes"] = props
-    save_profile(target.id, prof)
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        props = prof.get("proprietes", {})
+        existed = props.pop(item.value, None)
+        prof["proprietes"] = props
 
     if existed is not None:
         msg = f"🗑️ **{item.value}** retirée des propriétés de **{target.display_name}**."
@@ -1457,11 +3772,11 @@ async def add_permit(itx: discord.Interaction,
                      cible: Optional[discord.Member],
                      item: app_commands.Choice[str]):
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    per = prof["inventaire"].get("permis", {})
-    per[item.value] = "valide"
-    prof["inventaire"]["permis"] = per
-    save_profile(target.id, prof)
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        per = prof["inventaire"].get("permis", {})
+        per[item.value] = "valide"
+        prof["inventaire"]["permis"] = per
 
     await itx.response.send_message(
         f"📜 **{item.value}** ajouté (valide) pour **{target.display_name}**."
@@ -1475,11 +3790,11 @@ async def remove_permit(itx: discord.Interaction,
                         cible: Optional[discord.Member],
                         item: app_commands.Choice[str]):
     target = cible or itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    per = prof["inventaire"].get("permis", {})
-    existed = per.pop(item.value, None)
-    prof["inventaire"]["permis"] = per
-    save_profile(target.id, prof)
+    async with profile_transaction(target.id, economy=False) as tx:
+        prof = tx[target.id]
+        per = prof["inventaire"].get("permis", {})
+        existed = per.pop(item.value, None)
+        prof["inventaire"]["permis"] = per
 
     if existed is not None:
         msg = f"🗑️ **{item.value}** retiré des permis de **{target.display_name}**."
@@ -1542,105 +3857,97 @@ async def give_item_cmd(
 
     cat = categorie.value  # 'armes' | 'chevaux' | 'permis' | 'proprietes'
 
-    prof_d = _ensure_profile_skeleton(donneur.id)
-    prof_b = _ensure_profile_skeleton(beneficiaire.id)
-
-    inv_d = prof_d.get("inventaire", {}) or {}
-    inv_b = prof_b.get("inventaire", {}) or {}
-
-    # Normalise structures
-    inv_d.setdefault("armes", {}); inv_b.setdefault("armes", {})
-    inv_d.setdefault("chevaux", {}); inv_b.setdefault("chevaux", {})
-    inv_d.setdefault("permis", {}); inv_b.setdefault("permis", {})
-    prof_d["inventaire"] = inv_d; prof_b["inventaire"] = inv_b
-    prof_d.setdefault("proprietes", {}); prof_b.setdefault("proprietes", {})
-
-    # ----- Armes / Chevaux : transfert avec quantités -----
-    if cat in ("armes", "chevaux"):
-        source = inv_d[cat]
-        if item not in source:
-            await itx.response.send_message(f"L’item **{item}** n’est pas dans vos {cat}.", ephemeral=True)
-            return
+    async with profile_transaction(donneur.id, beneficiaire.id, economy=False) as tx:
+        prof_d = tx[donneur.id]
+        prof_b = tx[beneficiaire.id]
+
+        inv_d = prof_d.get("inventaire", {}) or {}
+        inv_b = prof_b.get("inventaire", {}) or {}
+
+        # Normalise structures
+        inv_d.setdefault("armes", {}); inv_b.setdefault("armes", {})
+        inv_d.setdefault("chevaux", {}); inv_b.setdefault("chevaux", {})
+        inv_d.setdefault("permis", {}); inv_b.setdefault("permis", {})
+        prof_d["inventaire"] = inv_d; prof_b["inventaire"] = inv_b
+        prof_d.setdefault("proprietes", {}); prof_b.setdefault("proprietes", {})
+
+        # ----- Armes / Chevaux : transfert avec quantités -----
+        if cat in ("armes", "chevaux"):
+            source = inv_d[cat]
+            if item not in source:
+                await itx.response.send_message(f"L’item **{item}** n’est pas dans vos {cat}.", ephemeral=True)
+                return
+
+            dispo = int(source.get(item, 0))
+            if dispo <= 0:
+                await itx.response.send_message(f"Vous ne possédez plus de **{item}**.", ephemeral=True)
+                return
+
+            qty = _parse_qty_for_transfer(quantite, available=dispo, default_if_missing=1)
+            if qty is None or qty <= 0:
+                await itx.response.send_message("Quantité invalide (entier > 0 ou 'all').", ephemeral=True)
+                return
+            qty = min(qty, dispo)
+
+            # Décrémente donneur
+            reste = dispo - qty
+            if reste <= 0:
+                source.pop(item, None)
+            else:
+                source[item] = reste
 
-        dispo = int(source.get(item, 0))
-        if dispo <= 0:
-            await itx.response.send_message(f"Vous ne possédez plus de **{item}**.", ephemeral=True)
-            return
+            # Incrémente bénéficiaire
+            inv_b[cat][item] = int(inv_b[cat].get(item, 0)) + qty
 
-        qty = _parse_qty_for_transfer(quantite, available=dispo, default_if_missing=1)
-        if qty is None or qty <= 0:
-            await itx.response.send_message("Quantité invalide (entier > 0 ou 'all').", ephemeral=True)
+            await itx.response.send_message(
+                f"🎁 **Transfert** — {donneur.mention} ➜ {beneficiaire.mention}\n"
+                f"• {cat[:-1].capitalize()} : **{item}** × {qty}\n"
+                f"• Votre restant : {int(inv_d[cat].get(item, 0)) if item in inv_d[cat] else 0}"
+            )
             return
-        qty = min(qty, dispo)
-
-        # Décrémente donneur
-        reste = dispo - qty
-        if reste <= 0:
-            source.pop(item, None)
-        else:
-            source[item] = reste
-
-        # Incrémente bénéficiaire
-        inv_b[cat][item] = int(inv_b[cat].get(item, 0)) + qty
-
-        save_profile(donneur.id, prof_d)
-        save_profile(beneficiaire.id, prof_b)
-
-        await itx.response.send_message(
-            f"🎁 **Transfert** — {donneur.mention} ➜ {beneficiaire.mention}\n"
-            f"• {cat[:-1].capitalize()} : **{item}** × {qty}\n"
-            f"• Votre restant : {int(inv_d[cat].get(item, 0)) if item in inv_d[cat] else 0}"
-        )
-        return
 
-    # ----- Permis : présence/absence (pas de quantité) -----
-    if cat == "permis":
-        if item not in inv_d["permis"]:
-            await itx.response.send_message(f"Vous n’avez pas le permis **{item}**.", ephemeral=True)
-            return
-        if item in inv_b["permis"]:
-            await itx.response.send_message(f"{beneficiaire.display_name} possède déjà le permis **{item}**.", ephemeral=True)
+        # ----- Permis : présence/absence (pas de quantité) -----
+        if cat == "permis":
+            if item not in inv_d["permis"]:
+                await itx.response.send_message(f"Vous n’avez pas le permis **{item}**.", ephemeral=True)
+                return
+            if item in inv_b["permis"]:
+                await itx.response.send_message(f"{beneficiaire.display_name} possède déjà le permis **{item}**.", ephemeral=True)
+                return
+
+            inv_b["permis"][item] = "valide"
+            inv_d["permis"].pop(item, None)
+
+            await itx.response.send_message(
+                f"🎁 **Transfert de permis** — {donneur.mention} ➜ {beneficiaire.mention}\n"
+                f"• Permis : **{item}** (désormais *valide* pour le bénéficiaire)"
+            )
             return
 
-        inv_b["permis"][item] = "valide"
-        inv_d["permis"].pop(item, None)
-
-        save_profile(donneur.id, prof_d)
-        save_profile(beneficiaire.id, prof_b)
-
-        await itx.response.send_message(
-            f"🎁 **Transfert de permis** — {donneur.mention} ➜ {beneficiaire.mention}\n"
-            f"• Permis : **{item}** (désormais *valide* pour le bénéficiaire)"
-        )
-        return
-
-    # ----- Propriétés : présence/absence (pas de quantité) -----
-    if cat == "proprietes":
-        props_d = prof_d["proprietes"]
-        props_b = prof_b["proprietes"]
-
-        if item not in props_d:
-            await itx.response.send_message(f"Vous ne possédez pas la propriété **{item}**.", ephemeral=True)
-            return
-        if item in props_b:
-            await itx.response.send_message(f"{beneficiaire.display_name} possède déjà la propriété **{item}**.", ephemeral=True)
+        # ----- Propriétés : présence/absence (pas de quantité) -----
+        if cat == "proprietes":
+            props_d = prof_d["proprietes"]
+            props_b = prof_b["proprietes"]
+
+            if item not in props_d:
+                await itx.response.send_message(f"Vous ne possédez pas la propriété **{item}**.", ephemeral=True)
+                return
+            if item in props_b:
+                await itx.response.send_message(f"{beneficiaire.display_name} possède déjà la propriété **{item}**.", ephemeral=True)
+                return
+
+            # Transfert : on conserve l’étiquette si elle existe, sinon 'acquise'
+            label = props_d.get(item, "acquise")
+            props_b[item] = label
+            props_d.pop(item, None)
+
+            await itx.response.send_message(
+                f"🎁 **Transfert de propriété** — {donneur.mention} ➜ {beneficiaire.mention}\n"
+                f"• Propriété : **{item}**"
+            )
             return
 
-        # Transfert : on conserve l’étiquette si elle existe, sinon 'acquise'
-        label = props_d.get(item, "acquise")
-        props_b[item] = label
-        props_d.pop(item, None)
-
-        save_profile(donneur.id, prof_d)
-        save_profile(beneficiaire.id, prof_b)
-
-        await itx.response.send_message(
-            f"🎁 **Transfert de propriété** — {donneur.mention} ➜ {beneficiaire.mention}\n"
-            f"• Propriété : **{item}**"
-        )
-        return
-
-    await itx.response.send_message("Catégorie inconnue.", ephemeral=True)
+        await itx.response.send_message("Catégorie inconnue.", ephemeral=True)
 
 # --- Autocomplete des items possédés par le donneur ---
 @give_item_cmd.autocomplete("item")
@@ -1653,7 +3960,7 @@ async def give_item_item_autocomplete(interaction: discord.Interaction, current:
     if cat not in ("armes", "chevaux", "permis", "proprietes"):
         return []
 
-    prof = load_profile(interaction.user.id) or {}
+    prof = await load_profile_async(interaction.user.id) or {}
     inv  = (prof.get("inventaire") or {})
     inv.setdefault("armes", {}); inv.setdefault("chevaux", {}); inv.setdefault("permis", {})
     props = prof.get("proprietes", {}) or {}
@@ -1717,11 +4024,7 @@ def _build_compte_embed_for_user(
     emb.set_footer(text=footer_text)
 
     # Logo de la banque
-    file_obj = None
-    logo_path = os.path.join(ASSETS_DIR, "banque.png")
-    if os.path.exists(logo_path):
-        file_obj = discord.File(logo_path, filename="banque.png")
-        emb.set_thumbnail(url="attachment://banque.png")
+    file_obj = ASSETS.attach("banque", emb)
 
     return emb, file_obj
 class CompteView(discord.ui.View):
@@ -1743,18 +4046,16 @@ class CompteView(discord.ui.View):
 
     @discord.ui.button(label="🔒 Bloquer le compte", style=discord.ButtonStyle.danger)
     async def toggle_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        prof = _ensure_profile_skeleton(self.target_id)
-        prof = _ensure_economy_fields(prof)
-
-        current = bool(prof.get("compte_bloque", False))
-        new_state = not current
-        prof["compte_bloque"] = new_state
+        async with profile_transaction(self.target_id) as tx:
+            prof = tx[self.target_id]
 
-        now = datetime.now(PARIS_TZ)
-        prof["compte_last_editor_id"] = interaction.user.id
-        prof["compte_last_updated"] = now.isoformat()
+            current = bool(prof.get("compte_bloque", False))
+            new_state = not current
+            prof["compte_bloque"] = new_state
 
-        save_profile(self.target_id, prof)
+            now = datetime.now(PARIS_TZ)
+            prof["compte_last_editor_id"] = interaction.user.id
+            prof["compte_last_updated"] = now.isoformat()
 
         emb, file_obj = _build_compte_embed_for_user(
             self.target_id,
@@ -1785,28 +4086,25 @@ CRIME_CHOICES = [
 @app_commands.choices(cible=CRIME_CHOICES)
 async def crime_cmd(itx: discord.Interaction, cible: app_commands.Choice[str]):
     target = itx.user
-    prof = _ensure_profile_skeleton(target.id)
-    prof = _ensure_economy_fields(prof)
-
-    left = _cooldown_left(prof, "crime", COOLDOWN_CRIME_SECONDS)
-    if left > 0:
-        h = left // 3600; m = (left % 3600) // 60; s = left % 60
-        await itx.response.send_message(
-            f"⏳ Vous devrez patienter **{h}h {m}m {s}s** avant un nouveau braquage.",
-            ephemeral=True
-        )
+    if await _reject_if_cooling(itx, target.id, "crime", "un nouveau braquage"):
         return
+    async with profile_transaction(target.id) as tx:
+        prof = tx[target.id]
+
+        left = _cooldown_left(prof, "crime", COOLDOWN_CRIME_SECONDS)
+        if left > 0:
+            await itx.response.send_message(_cooldown_wait_text(left, "un nouveau braquage"), ephemeral=True)
+            return
 
-    MAX_BY_TARGET = {"caleche": 300, "commerce": 500, "train": 600, "banque": 700}
-    typ = cible.value
-    max_amt = MAX_BY_TARGET[typ]
+        MAX_BY_TARGET = {"caleche": 300, "commerce": 500, "train": 600, "banque": 700}
+        typ = cible.value
+        max_amt = MAX_BY_TARGET[typ]
 
-    forced_negative = (random.randint(1, 4) == 1)  # 1/4 perte
-    amount = -random.randint(0, max_amt) if forced_negative else random.randint(0, max_amt)
+        forced_negative = (random.randint(1, 4) == 1)  # 1/4 perte
+        amount = -random.randint(0, max_amt) if forced_negative else random.randint(0, max_amt)
 
-    prof["dirty"] = int(prof.get("dirty", 0)) + int(amount)
-    _touch_cooldown(prof, "crime")
-    save_profile(target.id, prof)
+        prof["dirty"] = int(prof.get("dirty", 0)) + int(amount)
+        _touch_cooldown(prof, "crime")
 
     signe = "+" if amount >= 0 else "−"
     abs_amt = abs(amount)
@@ -1826,51 +4124,45 @@ async def robb_cmd(itx: discord.Interaction, victime: discord.Member):
     if victime.id == voleur.id:
         await itx.response.send_message("On ne se vole pas soi-même…", ephemeral=True)
         return
+    if await _reject_if_cooling(itx, voleur.id, "robb", "un nouveau vol"):
+        return
 
-    prof_v = _ensure_profile_skeleton(victime.id)
-    prof_v = _ensure_economy_fields(prof_v)
-    prof_x = _ensure_profile_skeleton(voleur.id)
-    prof_x = _ensure_economy_fields(prof_x)
+    async with profile_transaction(victime.id, voleur.id) as tx:
+        prof_v = tx[victime.id]
+        prof_x = tx[voleur.id]
 
-    left = _cooldown_left(prof_x, "robb", COOLDOWN_ROBB_SECONDS)
-    if left > 0:
-        h = left // 3600; m = (left % 3600) // 60; s = left % 60
-        await itx.response.send_message(
-            f"⏳ Vous devrez patienter **{h}h {m}m {s}s** avant un nouveau vol.",
-            ephemeral=True
-        )
-        return
+        left = _cooldown_left(prof_x, "robb", COOLDOWN_ROBB_SECONDS)
+        if left > 0:
+            await itx.response.send_message(_cooldown_wait_text(left, "un nouveau vol"), ephemeral=True)
+            return
 
-    cash_v = int(prof_v.get("cash", 0))
-    if cash_v <= 0:
-        _touch_cooldown(prof_x, "robb")
-        save_profile(voleur.id, prof_x)
-        await itx.response.send_message(f"💁 {victime.display_name} n’a pas de cash à voler.")
-        return
+        cash_v = int(prof_v.get("cash", 0))
+        if cash_v <= 0:
+            _touch_cooldown(prof_x, "robb")
+            await itx.response.send_message(f"💁 {victime.display_name} n’a pas de cash à voler.")
+            return
 
-    pct = random.randint(0, 70)  # %
-    montant = math.floor(cash_v * pct / 100)
+        pct = random.randint(0, 70)  # %
+        montant = math.floor(cash_v * pct / 100)
 
-    # 1/3 le voleur perd au lieu de gagner (va dans dirty négatif)
-    backfire = (random.randint(1, 3) == 1)
+        # 1/3 le voleur perd au lieu de gagner (va dans dirty négatif)
+        backfire = (random.randint(1, 3) == 1)
 
-    if montant > 0:
-        if backfire:
-            prof_x["dirty"] = int(prof_x["dirty"]) - montant
-            result_text = f"💥 Mauvais coup ! Vous perdez **{_fmt_money(montant)}** en argent sale."
+        if montant > 0:
+            if backfire:
+                prof_x["dirty"] = int(prof_x["dirty"]) - montant
+                result_text = f"💥 Mauvais coup ! Vous perdez **{_fmt_money(montant)}** en argent sale."
+            else:
+                prof_v["cash"]  = cash_v - montant
+                prof_x["dirty"] = int(prof_x["dirty"]) + montant
+                result_text = (
+                    f"🕵️ Vous dérobez **{_fmt_money(montant)}** à {victime.mention}.\n"
+                    f"→ Ajouté à votre **argent sale**."
+                )
         else:
-            prof_v["cash"]  = cash_v - montant
-            prof_x["dirty"] = int(prof_x["dirty"]) + montant
-            result_text = (
-                f"🕵️ Vous dérobez **{_fmt_money(montant)}** à {victime.mention}.\n"
-                f"→ Ajouté à votre **argent sale**."
-            )
-    else:
-        result_text = "😶 Rien volé cette fois (0%)."
+            result_text = "😶 Rien volé cette fois (0%)."
 
-    _touch_cooldown(prof_x, "robb")
-    save_profile(victime.id, prof_v)
-    save_profile(voleur.id,  prof_x)
+        _touch_cooldown(prof_x, "robb")
 
     await itx.response.send_message(
         f"**Vol sur {victime.mention}** — {pct}% du cash visé.\n{result_text}\n\n"
@@ -1879,73 +4171,64 @@ async def robb_cmd(itx: discord.Interaction, victime: discord.Member):
 
 @bot.tree.command(name="blanchiment", description="Blanchir 50% à 100% d'argent sale en cash (1/3 risque de tout perdre). Cooldown 4h.")
 async def blanchiment_cmd(itx: discord.Interaction):
-    user = itx.user
-    prof = _ensure_profile_skeleton(user.id)
-    prof = _ensure_economy_fields(prof)
-
-    left = _cooldown_left(prof, "blanchiment", COOLDOWN_BLCH_SECONDS)
-    if left > 0:
-        h = left // 3600; m = (left % 3600) // 60; s = left % 60
-        await itx.response.send_message(
-            f"⏳ Vous devrez patienter **{h}h {m}m {s}s** avant un nouveau blanchiment.",
-            ephemeral=True
-        )
-        return
-
-    dirty = int(prof.get("dirty", 0))
-    if dirty <= 0:
-        await itx.response.send_message("Rien à blanchir : votre argent sale est nul ou négatif.", ephemeral=True)
-        return
-
-    busted = (random.randint(1, 3) == 1)  # 1/3 tout perdu
-    if busted:
-        prof["dirty"] = 0
-        _touch_cooldown(prof, "blanchiment")
-        save_profile(user.id, prof)
-        await itx.response.send_message(
-            f"🚨 Coup de filet ! Vous perdez **tout** votre argent sale.\n"
-            f"Argent sale maintenant : **{_fmt_money(0)}**"
-        )
+    user = itx.user
+    if await _reject_if_cooling(itx, user.id, "blanchiment", "un nouveau blanchiment"):
         return
+    async with profile_transaction(user.id) as tx:
+        prof = tx[user.id]
+
+        left = _cooldown_left(prof, "blanchiment", COOLDOWN_BLCH_SECONDS)
+        if left > 0:
+            await itx.response.send_message(_cooldown_wait_text(left, "un nouveau blanchiment"), ephemeral=True)
+            return
+
+        dirty = int(prof.get("dirty", 0))
+        if dirty <= 0:
+            await itx.response.send_message("Rien à blanchir : votre argent sale est nul ou négatif.", ephemeral=True)
+            return
+
+        busted = (random.randint(1, 3) == 1)  # 1/3 tout perdu
+        if busted:
+            prof["dirty"] = 0
+            _touch_cooldown(prof, "blanchiment")
+            await itx.response.send_message(
+                f"🚨 Coup de filet ! Vous perdez **tout** votre argent sale.\n"
+                f"Argent sale maintenant : **{_fmt_money(0)}**"
+            )
+            return
 
-    rate = random.randint(50, 100)  # %
-    gain = math.floor(dirty * rate / 100)
-    prof["dirty"] = dirty - gain
-    prof["cash"]  = int(prof.get("cash", 0)) + gain
+        rate = random.randint(50, 100)  # %
+        gain = math.floor(dirty * rate / 100)
+        prof["dirty"] = dirty - gain
+        prof["cash"]  = int(prof.get("cash", 0)) + gain
 
-    _touch_cooldown(prof, "blanchiment")
-    save_profile(user.id, prof)
+        _touch_cooldown(prof, "blanchiment")
 
     await itx.response.send_message(
         f"🧼 Blanchiment à **{rate}%** : +{_fmt_money(gain)} en cash.\n"
         f"Argent sale restant : **{_fmt_money(int(prof['dirty']))}** • Cash : **{_fmt_money(int(prof['cash']))}**"
     )
 
-COOLDOWN_WORK_SECONDS = 4 * 3600
-
 @bot.tree.command(name="work", description="Simuler une vente / un travail (100 à 500 ₣). Cooldown 4h.")
 async def work_cmd(itx: discord.Interaction):
     user = itx.user
-    prof = _ensure_profile_skeleton(user.id)
-    prof = _ensure_economy_fields(prof)
-
-    # Vérif cooldown
-    left = _cooldown_left(prof, "work", COOLDOWN_WORK_SECONDS)
-    if left > 0:
-        h = left // 3600; m = (left % 3600) // 60; s = left % 60
-        await itx.response.send_message(
-            f"⏳ Vous devrez patienter **{h}h {m}m {s}s** avant un nouveau travail.",
-            ephemeral=True
-        )
+    if await _reject_if_cooling(itx, user.id, "work", "un nouveau travail"):
         return
+    async with profile_transaction(user.id) as tx:
+        prof = tx[user.id]
+
+        # Vérif cooldown
+        left = _cooldown_left(prof, "work", COOLDOWN_WORK_SECONDS)
+        if left > 0:
+            await itx.response.send_message(_cooldown_wait_text(left, "un nouveau travail"), ephemeral=True)
+            return
 
-    # Gain aléatoire
-    gain = random.randint(100, 500)
-    prof["bank"] = int(prof.get("bank", 0)) + gain
+        # Gain aléatoire
+        gain = random.randint(100, 500)
+        prof["bank"] = int(prof.get("bank", 0)) + gain
 
-    # Active cooldown
-    _touch_cooldown(prof, "work")
-    save_profile(user.id, prof)
+        # Active cooldown
+        _touch_cooldown(prof, "work")
 
     await itx.response.send_message(
         f"🪙 Travail accompli !\n"
@@ -1953,6 +4236,26 @@ async def work_cmd(itx: discord.Interaction):
         f"Nouveau solde banque : **{_fmt_money(prof['bank'])}**"
     )
 
+@bot.tree.command(name="cooldowns", description="Voir tous vos délais en cours (et activer les rappels en MP).")
+@app_commands.describe(rappels="Recevoir un MP quand une action redevient disponible")
+async def cooldowns_cmd(itx: discord.Interaction, rappels: Optional[bool] = None):
+    user = itx.user
+    note = ""
+    if rappels is not None:
+        async with profile_transaction(user.id, economy=False) as tx:
+            tx[user.id]["rappel_cooldowns"] = bool(rappels)
+        note = "\n\n🔔 Rappels en MP **activés**." if rappels else "\n\n🔕 Rappels en MP **désactivés**."
+
+    ends = COOLDOWNS.pending(user.id)
+    lines = []
+    for key, (_, label) in COOLDOWN_PERIODS.items():
+        end = ends.get(key)
+        if end:
+            lines.append(f"⏳ **{label}** — disponible <t:{end}:R> (<t:{end}:t>)")
+        else:
+            lines.append(f"✅ **{label}** — disponible")
+    await itx.response.send_message(embed=embed("Délais en cours", "\n".join(lines) + note), ephemeral=True)
+
 
 @bot.tree.command(name="impot", description="Calculer et prélever l'impôt (ou verser le RSA Royal) sur un revenu déclaré.")
 @app_commands.describe(
@@ -1974,50 +4277,44 @@ async def impot_cmd(
         return
 
     # Récupération / initialisation des profils
-    prof_c = _ensure_profile_skeleton(contribuable.id)
-    prof_c = _ensure_economy_fields(prof_c)
-
-    prof_p = _ensure_profile_skeleton(percepteur.id)
-    prof_p = _ensure_economy_fields(prof_p)
+    async with profile_transaction(contribuable.id, percepteur.id) as tx:
+        prof_c = tx[contribuable.id]
+        prof_p = tx[percepteur.id]
 
-    # Préparation des valeurs de base
-    bank_c_before = int(prof_c.get("bank", 0))
-    bank_p_before = int(prof_p.get("bank", 0))
+        # Préparation des valeurs de base
+        bank_c_before = int(prof_c.get("bank", 0))
+        bank_p_before = int(prof_p.get("bank", 0))
 
-    # Détermination de la tranche et du taux
-    rsa_mode = False
-    taux_pct = 0
-    impot = 0  # montant d'impôt ou d'aide (positif en valeur absolue)
-
-    if salaire < 400:
-        # RSA ROYAL
-        rsa_mode = True
+        # Détermination de la tranche et du taux
+        rsa_mode = False
         taux_pct = 0
-        impot = 100  # aide fixe
-        # Contribuable gagne 100, percepteur perd 100
-        prof_c["bank"] = bank_c_before + impot
-        prof_p["bank"] = bank_p_before - impot
-    else:
-        # Barème d'impôt classique
-        if salaire < 500:
-            taux_pct = 5
-        elif salaire < 1200:
-            taux_pct = 15
-        elif salaire < 2000:
-            taux_pct = 20
+        impot = 0  # montant d'impôt ou d'aide (positif en valeur absolue)
+
+        if salaire < 400:
+            # RSA ROYAL
+            rsa_mode = True
+            taux_pct = 0
+            impot = 100  # aide fixe
+            # Contribuable gagne 100, percepteur perd 100
+            prof_c["bank"] = bank_c_before + impot
+            prof_p["bank"] = bank_p_before - impot
         else:
-            taux_pct = 30
-
-        # Calcul de l'impôt dû
-        impot = math.floor(salaire * taux_pct / 100)
+            # Barème d'impôt classique
+            if salaire < 500:
+                taux_pct = 5
+            elif salaire < 1200:
+                taux_pct = 15
+            elif salaire < 2000:
+                taux_pct = 20
+            else:
+                taux_pct = 30
 
-        # Débits / crédits (solde négatif autorisé)
-        prof_c["bank"] = bank_c_before - impot
-        prof_p["bank"] = bank_p_before + impot
+            # Calcul de l'impôt dû
+            impot = math.floor(salaire * taux_pct / 100)
 
-    # Sauvegarde des profils
-    save_profile(contribuable.id, prof_c)
-    save_profile(percepteur.id, prof_p)
+            # Débits / crédits (solde négatif autorisé)
+            prof_c["bank"] = bank_c_before - impot
+            prof_p["bank"] = bank_p_before + impot
 
     bank_c_after = int(prof_c.get("bank", 0))
     bank_p_after = int(prof_p.get("bank", 0))
@@ -2090,14 +4387,7 @@ async def impot_cmd(
     )
 
     # Logo Banque Royale en haut à droite si disponible
-    file_obj = None
-    logo_path = os.path.join(ASSETS_DIR, "banque.png")
-    if os.path.exists(logo_path):
-        try:
-            file_obj = discord.File(logo_path, filename="banque.png")
-            emb.set_thumbnail(url="attachment://banque.png")
-        except Exception:
-            file_obj = None
+    file_obj = ASSETS.attach("banque", emb)
 
     if file_obj:
         await itx.response.send_message(embed=emb, file=file_obj)
@@ -2107,27 +4397,6 @@ async def impot_cmd(
 
 # ========= LEADERBOARD =========
 
-def _iter_all_profiles() -> List[Tuple[int, dict]]:
-    entries: List[Tuple[int, dict]] = []
-    try:
-        for name in os.listdir(PROFILES_DIR):
-            if not name.endswith(".json"):
-                continue
-            try:
-                uid = int(os.path.splitext(name)[0])
-            except Exception:
-                continue
-            pth = os.path.join(PROFILES_DIR, name)
-            try:
-                with open(pth, "r", encoding="utf-8") as f:
-                    d = json.load(f)
-                entries.append((uid, d))
-            except Exception:
-                continue
-    except Exception:
-        pass
-    return entries
-
 def _total_wealth(p: dict) -> int:
     cash  = int(p.get("cash", 0) or 0)
     bank  = int(p.get("bank", 0) or 0)
@@ -2135,22 +4404,20 @@ def _total_wealth(p: dict) -> int:
     return cash + bank + dirty
 
 class LeaderboardView(discord.ui.View):
-    def __init__(self, entries: List[Tuple[int, dict]], page_size: int = 10, start_page: int = 0):
+    def __init__(self, index: WealthIndex, page_size: int = 10, start_page: int = 0):
         super().__init__(timeout=120)
-        self.entries = entries
+        self.index = index
         self.page_size = page_size
         self.page = start_page
 
     def _render_page(self) -> str:
         start = self.page * self.page_size
-        end   = start + self.page_size
-        slice_entries = self.entries[start:end]
+        slice_entries = self.index.page(start, self.page_size)
 
         lines = []
         rank_offset = start
-        for i, (uid, prof) in enumerate(slice_entries, start=1):
+        for i, (uid, total) in enumerate(slice_entries, start=1):
             rank = rank_offset + i
-            total = _total_wealth(prof)
             tag = f"<@{uid}>"
             lines.append(f"{rank:>2}. {tag} — {_fmt_money(total)}")
         if not lines:
@@ -2169,16 +4436,15 @@ class LeaderboardView(discord.ui.View):
 
     @discord.ui.button(label="Suivant ▶", style=discord.ButtonStyle.secondary)
     async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
-        max_page = max(0, (len(self.entries) - 1) // self.page_size)
+        max_page = max(0, (len(self.index) - 1) // self.page_size)
         if self.page < max_page:
             self.page += 1
         await self.update_msg(interaction)
 
 @bot.tree.command(name="leaderboard", description="Classement des fortunes (Total = cash + banque + argent sale).")
 async def leaderboard_cmd(itx: discord.Interaction):
-    entries = _iter_all_profiles()
-    entries.sort(key=lambda t: _total_wealth(t[1]), reverse=True)
-    view = LeaderboardView(entries, page_size=10, start_page=0)
+    await _ensure_wealth_index()
+    view = LeaderboardView(WEALTH_INDEX, page_size=10, start_page=0)
     await itx.response.send_message(view._render_page(), view=view)
 
 # ========= /COMA =========
@@ -2204,7 +4470,187 @@ async def coma_cmd(itx: discord.Interaction):
 # État en mémoire vive : message_id -> dict de participants
 SESSIONS: Dict[int, dict] = {}
 
-def _session_build_embed(state: dict, guild_logo_bytes: Optional[bytes]) -> Tuple[discord.Embed, Optional[discord.File]]:
+# ---------- Sessions enregistrées sur disque ----------
+# sessions/<message_id>.json (JSON compact). Au redémarrage rien n'est relu :
+# l'état d'une session est chargé au premier clic sur son message.
+def _session_to_json(state: dict) -> dict:
+    data = dict(state)
+    data["created_at"] = state["created_at"].isoformat()
+    for key in ("present", "maybe", "absent"):
+        data[key] = sorted(state.get(key, set()))
+    data["late"] = {str(uid): mins for uid, mins in state.get("late", {}).items()}
+    return data
+
+def _session_from_json(data: dict) -> dict:
+    state = dict(data)
+    state["created_at"] = datetime.fromisoformat(data["created_at"])
+    for key in ("present", "maybe", "absent"):
+        state[key] = set(int(uid) for uid in data.get(key, []))
+    state["late"] = {int(uid): mins for uid, mins in (data.get("late") or {}).items()}
+    return state
+
+class SessionStore:
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def _path(self, message_id: int) -> str:
+        return os.path.join(self.folder, f"{message_id}.json")
+
+    def write(self, message_id: int, data: dict) -> None:
+        raw = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        _replace_file(self._path(message_id), lambda tmp: _write_bytes(tmp, raw.encode("utf-8")))
+
+    def read(self, message_id: int) -> Optional[dict]:
+        try:
+            with open(self._path(message_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def delete(self, message_id: int) -> None:
+        _remove_if_exists(self._path(message_id))
+
+    def ids(self) -> List[int]:
+        return [int(f[:-5]) for f in os.listdir(self.folder) if f.endswith(".json") and f[:-5].isdigit()]
+
+    def archive(self, summaries: List[dict], keep: int) -> int:
+        """Ajoute des résumés à sessions/archive.json (seuls les `keep` plus récents sont gardés)."""
+        path = os.path.join(self.folder, "archive.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception:
+            entries = []
+        entries = (entries + summaries)[-keep:]
+        raw = json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+        _replace_file(path, lambda tmp: _write_bytes(tmp, raw.encode("utf-8")))
+        return len(entries)
+
+SESSION_STORE = SessionStore(SESSIONS_DIR)
+
+async def _persist_session(state: dict) -> None:
+    # Sérialisé ici (boucle principale) : les threads ne voient jamais l'état en cours de modification
+    await IO_POOL.run(SESSION_STORE.write, state["message_id"], _session_to_json(state))
+
+async def _get_session(message_id: int) -> Optional[dict]:
+    """État de la session (chargé depuis le disque au premier accès après un redémarrage)."""
+    state = SESSIONS.get(message_id)
+    if state is None:
+        data = await IO_POOL.run(SESSION_STORE.read, message_id)
+        if data is not None:
+            state = SESSIONS.setdefault(message_id, _session_from_json(data))
+    return state
+
+# Icône de la guilde : guild_id -> (clé de l'icône, octets), vidé par on_guild_update
+_GUILD_ICON_CACHE: Dict[int, Tuple[str, bytes]] = {}
+GUILD_ICON_STATS = {"downloads": 0, "hits": 0, "reused_attachments": 0}
+
+async def _guild_icon_bytes(guild: Optional[discord.Guild]) -> Optional[bytes]:
+    if guild is None or guild.icon is None:
+        return None
+    cached = _GUILD_ICON_CACHE.get(guild.id)
+    if cached and cached[0] == guild.icon.key:
+        GUILD_ICON_STATS["hits"] += 1
+        return cached[1]
+    try:
+        data = await guild.icon.read()
+    except Exception:
+        return None
+    _GUILD_ICON_CACHE[guild.id] = (guild.icon.key, data)
+    GUILD_ICON_STATS["downloads"] += 1
+    return data
+
+async def _session_edit_kwargs(state: dict, message: Optional[discord.Message],
+                               guild: Optional[discord.Guild]) -> dict:
+    """
+    Arguments d'édition du message de session. Si le message porte déjà la miniature
+    (guild_icon.png), on la réutilise : ni téléchargement de l'icône, ni nouvel envoi.
+    """
+    if message is not None and any(a.filename == "guild_icon.png" for a in message.attachments):
+        GUILD_ICON_STATS["reused_attachments"] += 1
+        emb, _ = _session_build_embed(state, None, reuse_thumbnail=True)
+        return {"embed": emb}
+    emb, file_obj = _session_build_embed(state, await _guild_icon_bytes(guild))
+    return {"embed": emb, "attachments": [file_obj] if file_obj else []}
+
+# ---------- Éditions groupées des messages de session ----------
+# Chaque clic est acquitté tout de suite (defer) ; les changements s'accumulent
+# et le message n'est édité qu'une fois par fenêtre de SESSION_EDIT_WINDOW secondes.
+SESSION_EDIT_WINDOW = float(os.getenv("SESSION_EDIT_WINDOW", "1.5"))
+
+class SessionUpdateCoalescer:
+    def __init__(self, window: float):
+        self.window = window
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._dirty: set = set()
+        self._targets: Dict[int, tuple] = {}
+        self._last_edit: Dict[int, float] = {}
+        self.requests = 0
+        self.edits = 0
+        self.errors = 0
+
+    def request(self, message: discord.Message, guild: Optional[discord.Guild]) -> None:
+        mid = message.id
+        self.requests += 1
+        if mid not in self._targets:
+            self._targets[mid] = (message, guild)
+        self._dirty.add(mid)
+        task = self._tasks.get(mid)
+        if task is None or task.done():
+            self._tasks[mid] = asyncio.create_task(self._run(mid))
+
+    async def _run(self, mid: int):
+        try:
+            while mid in self._dirty:
+                wait = self._last_edit.get(mid, 0.0) + self.window - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._dirty.discard(mid)
+                state = SESSIONS.get(mid)
+                if state is None:
+                    break
+                message, guild = self._targets[mid]
+                try:
+                    await _persist_session(state)
+                except Exception as e:
+                    print(f"[SESSION][ERREUR] Enregistrement de {mid} : {e}")
+                try:
+                    # Sans view= : les boutons déjà publiés restent en place
+                    kwargs = await _session_edit_kwargs(state, message, guild)
+                    message = await message.edit(**kwargs) or message
+                    self._targets[mid] = (message, guild)
+                    self.edits += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[SESSION][ERREUR] Édition du message {mid} : {e}")
+                self._last_edit[mid] = time.monotonic()
+        finally:
+            self._tasks.pop(mid, None)
+            self._targets.pop(mid, None)
+            self._dirty.discard(mid)
+
+    def forget(self, mid: int) -> None:
+        """Oublie une session terminée (aucune édition ne doit plus partir)."""
+        task = self._tasks.pop(mid, None)
+        if task is not None and not task.done():
+            task.cancel()
+        self._dirty.discard(mid)
+        self._targets.pop(mid, None)
+        self._last_edit.pop(mid, None)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "edits": self.edits,
+            "saved": max(0, self.requests - self.edits - self.errors - len(self._dirty)),
+            "pending": len(self._tasks),
+            "errors": self.errors,
+        }
+
+SESSION_UPDATES = SessionUpdateCoalescer(SESSION_EDIT_WINDOW)
+
+def _session_build_embed(state: dict, guild_logo_bytes: Optional[bytes],
+                         reuse_thumbnail: bool = False) -> Tuple[discord.Embed, Optional[discord.File]]:
     """
     state = {
         "titre": str|None,
@@ -2280,96 +4726,92 @@ def _session_build_embed(state: dict, guild_logo_bytes: Optional[bytes]) -> Tupl
 
     # Miniature : logo guilde si dispo, sinon fallback assets/banque.png
     file_obj = None
-    if guild_logo_bytes:
+    if reuse_thumbnail:
+        # pièce jointe déjà présente sur le message
+        emb.set_thumbnail(url="attachment://guild_icon.png")
+    elif guild_logo_bytes:
         file_obj = discord.File(io.BytesIO(guild_logo_bytes), filename="guild_icon.png")
         emb.set_thumbnail(url="attachment://guild_icon.png")
     else:
-        fallback = os.path.join(ASSETS_DIR, "banque.png")
-        if os.path.exists(fallback):
-            file_obj = discord.File(fallback, filename="guild_icon.png")
-            emb.set_thumbnail(url="attachment://guild_icon.png")
+        file_obj = ASSETS.attach("banque", emb, filename="guild_icon.png")
 
     return emb, file_obj
 
 
 
 class SessionView(discord.ui.View):
-    def __init__(self, message_id: Optional[int], channel_id: int):
+    """
+    Vue persistante (custom_id fixes, sans délai d'expiration) : une seule instance,
+    enregistrée dans setup_hook, reçoit les clics de tous les messages de session, y
+    compris ceux publiés avant un redémarrage. La session est retrouvée par l'ID du
+    message. Les messages, eux, sont publiés avec une copie (_session_message_view).
+    """
+    def __init__(self):
         super().__init__(timeout=None)
-        self.message_id = message_id
-        self.channel_id = channel_id
+
+    async def _vote(self, interaction: discord.Interaction, bucket: str):
+        state = await _get_session(interaction.message.id)
+        if not state:
+            return await interaction.response.send_message("Session expirée.", ephemeral=True)
+        uid = interaction.user.id
+        for other in ("present", "maybe", "absent"):
+            if other != bucket:
+                state[other].discard(uid)
+        state["late"].pop(uid, None)
+        state[bucket].add(uid)
+        await self.refresh(interaction)
 
     async def refresh(self, interaction: discord.Interaction):
-        state = SESSIONS.get(self.message_id)
+        state = SESSIONS.get(interaction.message.id)
         if not state:
-            for child in self.children:
-                child.disabled = True
+            # Copie désactivée : l'instance partagée sert encore aux sessions actives
             try:
-                await interaction.response.edit_message(view=self)
+                await interaction.response.edit_message(view=_session_message_view(disabled=True))
             except Exception:
                 pass
             return
 
-        logo_bytes = None
-        try:
-            if interaction.guild and interaction.guild.icon:
-                logo_bytes = await interaction.guild.icon.read()
-        except Exception:
-            logo_bytes = None
-
-        emb, file_obj = _session_build_embed(state, logo_bytes)
-        if interaction.response.is_done():
-            try:
-                await interaction.message.edit(embed=emb, attachments=[file_obj] if file_obj else [], view=self)
-            except Exception:
-                await interaction.followup.edit_message(interaction.message.id, embed=emb, attachments=[file_obj] if file_obj else [], view=self)
-        else:
-            await interaction.response.edit_message(embed=emb, attachments=[file_obj] if file_obj else [], view=self)
+        # Acquittement immédiat ; l'édition du message est groupée avec les autres clics
+        if not interaction.response.is_done():
+            await interaction.response.defer()
+        SESSION_UPDATES.request(interaction.message, interaction.guild)
 
-    @discord.ui.button(label="🟩 Présent", style=discord.ButtonStyle.success)
+    @discord.ui.button(label="🟩 Présent", style=discord.ButtonStyle.success, custom_id="session:present")
     async def present_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        state = SESSIONS.get(self.message_id)
-        if not state:
-            return await interaction.response.send_message("Session expirée.", ephemeral=True)
-        uid = interaction.user.id
-        state["maybe"].discard(uid)
-        state["absent"].discard(uid)
-        state["late"].pop(uid, None)
-        state["present"].add(uid)
-        await self.refresh(interaction)
+        await self._vote(interaction, "present")
 
-    @discord.ui.button(label="🟨 En retard", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="🟨 En retard", style=discord.ButtonStyle.secondary, custom_id="session:late")
     async def late_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.send_modal(RetardModal(self))
+        await interaction.response.send_modal(RetardModal(self, interaction.message.id))
 
-    @discord.ui.button(label="🟪 Peut-être", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="🟪 Peut-être", style=discord.ButtonStyle.primary, custom_id="session:maybe")
     async def maybe_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        state = SESSIONS.get(self.message_id)
-        if not state:
-            return await interaction.response.send_message("Session expirée.", ephemeral=True)
-        uid = interaction.user.id
-        state["present"].discard(uid)
-        state["absent"].discard(uid)
-        state["late"].pop(uid, None)
-        state["maybe"].add(uid)
-        await self.refresh(interaction)
+        await self._vote(interaction, "maybe")
 
-    @discord.ui.button(label="🟥 Absent", style=discord.ButtonStyle.danger)
+    @discord.ui.button(label="🟥 Absent", style=discord.ButtonStyle.danger, custom_id="session:absent")
     async def absent_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
-        state = SESSIONS.get(self.message_id)
-        if not state:
-            return await interaction.response.send_message("Session expirée.", ephemeral=True)
-        uid = interaction.user.id
-        state["present"].discard(uid)
-        state["maybe"].discard(uid)
-        state["late"].pop(uid, None)
-        state["absent"].add(uid)
-        await self.refresh(interaction)
+        await self._vote(interaction, "absent")
+
+# Instance unique, créée dans setup_hook (une View a besoin de la boucle asyncio)
+SESSION_VIEW: Optional[SessionView] = None
+
+def _session_message_view(disabled: bool = False) -> SessionView:
+    """
+    Boutons à joindre à un message de session : toujours une nouvelle instance,
+    arrêtée pour que discord.py ne la suive pas message par message. Un MESSAGE_UPDATE
+    ne peut donc jamais recopier des boutons désactivés dans SESSION_VIEW.
+    """
+    view = SessionView()
+    for child in view.children:
+        child.disabled = disabled
+    view.stop()
+    return view
 
 class RetardModal(discord.ui.Modal, title="Indiquer votre retard (≈ minutes)"):
-    def __init__(self, parent_view: SessionView):
+    def __init__(self, parent_view: SessionView, message_id: int):
         super().__init__(timeout=None)
         self.parent_view = parent_view
+        self.message_id = message_id
         self.minutes = discord.ui.TextInput(
             label="Environ combien de minutes de retard ?",
             placeholder="Ex : 10",
@@ -2379,7 +4821,7 @@ class RetardModal(discord.ui.Modal, title="Indiquer votre retard (≈ minutes)")
         self.add_item(self.minutes)
 
     async def on_submit(self, interaction: discord.Interaction):
-        state = SESSIONS.get(self.parent_view.message_id)
+        state = await _get_session(self.message_id)
         if not state:
             await interaction.response.send_message("Session expirée.", ephemeral=True)
             return
@@ -2429,16 +4871,11 @@ async def session_cmd(
         "channel_id": itx.channel.id,
     }
 
-    # Logo de la guilde
-    logo_bytes = None
-    try:
-        if itx.guild and itx.guild.icon:
-            logo_bytes = await itx.guild.icon.read()
-    except Exception:
-        logo_bytes = None
+    # Logo de la guilde (en cache tant que l'icône ne change pas)
+    logo_bytes = await _guild_icon_bytes(itx.guild)
 
     emb, file_obj = _session_build_embed(state, logo_bytes)
-    view = SessionView(message_id=None, channel_id=itx.channel.id)
+    view = _session_message_view()
 
     # Ping @everyone
     allowed = discord.AllowedMentions(everyone=True, users=True, roles=True)
@@ -2464,21 +4901,184 @@ async def session_cmd(
     # On récupère le message créé par Discord
     msg = await itx.original_response()
 
-    # On enregistre l'ID de session
+    # On enregistre l'ID de session (en mémoire et sur disque)
     state["message_id"] = msg.id
     SESSIONS[msg.id] = state
-    view.message_id = msg.id
+    await _persist_session(state)
 
     # On réédite juste pour afficher l'ID dans le footer (facultatif)
-    emb2, file_obj2 = _session_build_embed(state, logo_bytes)
     try:
-        if file_obj2:
-            await msg.edit(embed=emb2, attachments=[file_obj2], view=view)
-        else:
-            await msg.edit(embed=emb2, view=view)
+        await msg.edit(**await _session_edit_kwargs(state, msg, itx.guild))
     except Exception:
         pass
 
+# ---------- Fin de vie des sessions ----------
+# Une session expire SESSION_TTL_HOURS heures après son heure de lancement :
+# ses boutons sont désactivés, son état quitte la mémoire et le disque,
+# et il n'en reste qu'un résumé dans sessions/archive.json.
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "6"))
+SESSION_ARCHIVE_MAX = int(os.getenv("SESSION_ARCHIVE_MAX", "200"))
+
+def _session_start(state: dict) -> datetime:
+    """
+    Heure de lancement saisie (JJ/MM[/AAAA] et HH:MM, 21h30, « vers 21h »…).
+    JJ/MM sans année : la prochaine occurrence à partir de la création.
+    Heure illisible : fin de la journée ; date illisible : la création.
+    """
+    created = state["created_at"]
+    date_txt = (state.get("date_str") or "").strip()
+    day = None
+    for fmt in ("%d/%m/%Y", "%d/%m/%y"):
+        try:
+            day = datetime.strptime(date_txt, fmt)
+            break
+        except ValueError:
+            continue
+    if day is None:
+        # année insérée avant l'analyse (sinon 29/02 échoue : 1900 n'est pas bissextile)
+        for year in range(created.year, created.year + 5):  # 29/02 : jusqu'à la prochaine année bissextile
+            try:
+                candidate = datetime.strptime(f"{date_txt}/{year}", "%d/%m/%Y")
+            except ValueError:
+                continue
+            if candidate.date() >= created.date():
+                day = candidate
+                break
+    if day is None:
+        return created
+
+    m = re.search(r"(\d{1,2})\s*(?:[:hH]\s*(\d{2})?)?", state.get("heure_str") or "")
+    hour, minute = (int(m.group(1)), int(m.group(2) or 0)) if m else (24, 0)
+    if hour > 23 or minute > 59:
+        hour, minute = 23, 59
+    return day.replace(hour=hour, minute=minute, tzinfo=PARIS_TZ)
+
+def _session_expired(state: dict, now: datetime) -> bool:
+    return now >= _session_start(state) + timedelta(hours=SESSION_TTL_HOURS)
+
+def _session_summary(state: dict) -> dict:
+    return {
+        "message_id": state.get("message_id"),
+        "channel_id": state.get("channel_id"),
+        "titre": state.get("titre"),
+        "date_str": state.get("date_str"),
+        "heure_str": state.get("heure_str"),
+        "organizer_id": state.get("organizer_id"),
+        "present": len(state["present"]),
+        "late": len(state["late"]),
+        "maybe": len(state["maybe"]),
+        "absent": len(state["absent"]),
+    }
+
+def _approx_size(obj, seen: Optional[set] = None) -> int:
+    """Taille mémoire approximative (sys.getsizeof récursif sur dict/list/set)."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_approx_size(k, seen) + _approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_approx_size(v, seen) for v in obj)
+    return size
+
+def _load_stored_sessions(skip: set) -> List[dict]:
+    """Sessions enregistrées qui ne sont pas en mémoire (thread IO)."""
+    out = []
+    for mid in SESSION_STORE.ids():
+        if mid in skip:
+            continue
+        data = SESSION_STORE.read(mid)
+        if data is not None:
+            try:
+                out.append(_session_from_json(data))
+            except Exception:
+                continue
+    return out
+
+def _drop_sessions(mids: List[int], summaries: List[dict]) -> int:
+    for mid in mids:
+        SESSION_STORE.delete(mid)
+    return SESSION_STORE.archive(summaries, SESSION_ARCHIVE_MAX) if summaries else -1
+
+class SessionLifecycle:
+    def __init__(self):
+        self.expired = 0
+        self.disabled = 0
+        self.errors = 0
+        self.stored = 0
+        self.archived = 0
+        self.last_run: Optional[datetime] = None
+
+    async def sweep(self, client: discord.Client) -> int:
+        """Un passage : toutes les sessions échues sont closes d'un coup."""
+        now = datetime.now(PARIS_TZ)
+        stored = await IO_POOL.run(_load_stored_sessions, set(SESSIONS))
+        candidates = list(SESSIONS.values()) + stored
+        self.stored = len(stored)
+        expired = [st for st in candidates if st.get("message_id") and _session_expired(st, now)]
+        self.last_run = now
+        if not expired:
+            return 0
+
+        # Une seule vue désactivée pour tous les messages ; arrêtée, elle n'est
+        # enregistrée pour aucun d'eux
+        closed = _session_message_view(disabled=True)
+
+        for st in expired:
+            mid = st["message_id"]
+            SESSION_UPDATES.forget(mid)
+            # Aucun suivi par message ne doit survivre à la session côté discord.py
+            client._connection.prevent_view_updates_for(mid)
+            channel = client.get_channel(st.get("channel_id") or 0)
+            if channel is None:
+                continue
+            try:
+                await channel.get_partial_message(mid).edit(view=closed)
+                self.disabled += 1
+            except discord.NotFound:
+                pass
+            except Exception as e:
+                self.errors += 1
+                print(f"[SESSION][ERREUR] Désactivation de {mid} : {e}")
+
+        mids = [st["message_id"] for st in expired]
+        for mid in mids:
+            SESSIONS.pop(mid, None)
+        archived = await IO_POOL.run(_drop_sessions, mids, [_session_summary(st) for st in expired])
+        if archived >= 0:
+            self.archived = archived
+        self.stored = sum(1 for st in stored if st["message_id"] not in set(mids))
+        self.expired += len(expired)
+        print(f"[SESSION] {len(expired)} session(s) expirée(s) et archivée(s).")
+        return len(expired)
+
+    def stats(self) -> dict:
+        return {
+            "live": len(SESSIONS),
+            "stored_idle": self.stored,
+            "memory_bytes": _approx_size(SESSIONS),
+            "expired": self.expired,
+            "disabled": self.disabled,
+            "errors": self.errors,
+            "archived": self.archived,
+            "last_run": self.last_run,
+        }
+
+SESSION_LIFECYCLE = SessionLifecycle()
+
+@tasks.loop(minutes=15)
+async def session_reaper():
+    try:
+        await SESSION_LIFECYCLE.sweep(bot)
+    except Exception as e:
+        print(f"[SESSION][ERREUR] Passage d'expiration : {e}")
+
+@session_reaper.before_loop
+async def before_session_reaper():
+    await bot.wait_until_ready()
+
 # ========= CASIER JUDICIAIRE & PRIMES =========
 
 def _ensure_casier_list(prof: dict) -> List[dict]:
@@ -2525,28 +5125,28 @@ async def casier_ajouter_cmd(
     Ajoute une infraction au casier de la cible, avec une prime associée (0 possible).
     """
     # On part du profil complet existant
-    prof = _ensure_profile_skeleton(cible.id)
-    casier = _ensure_casier_list(prof)
+    async with profile_transaction(cible.id, economy=False) as tx:
+        prof = tx[cible.id]
+        casier = _ensure_casier_list(prof)
 
-    # Nettoyage des champs
-    date_rp = date_rp.strip()
-    infraction = infraction.strip()
-    try:
-        prime_val = int(prime)
-        if prime_val < 0:
+        # Nettoyage des champs
+        date_rp = date_rp.strip()
+        infraction = infraction.strip()
+        try:
+            prime_val = int(prime)
+            if prime_val < 0:
+                prime_val = 0
+        except Exception:
             prime_val = 0
-    except Exception:
-        prime_val = 0
 
-    entry = {
-        "date": date_rp,
-        "infraction": infraction,
-        "prime": prime_val,
-        "auteur": itx.user.id,  # celui qui a ajouté l'entrée
-    }
-    casier.append(entry)
-    prof["casier"] = casier
-    save_profile(cible.id, prof)
+        entry = {
+            "date": date_rp,
+            "infraction": infraction,
+            "prime": prime_val,
+            "auteur": itx.user.id,  # celui qui a ajouté l'entrée
+        }
+        casier.append(entry)
+        prof["casier"] = casier
 
     await itx.response.send_message(
         f"✅ Entrée ajoutée au casier de {cible.mention} :\n"
@@ -2569,7 +5169,7 @@ async def casier_cmd(
     cible: Optional[discord.Member] = None
 ):
     target = cible or itx.user
-    prof = load_profile(target.id)
+    prof = await load_profile_async(target.id)
     if not prof:
         await itx.response.send_message(
             f"Aucune fiche trouvée pour **{target.display_name}**.\n"
@@ -2629,16 +5229,15 @@ async def casier_effacer_cmd(
     itx: discord.Interaction,
     cible: discord.Member
 ):
-    prof = load_profile(cible.id)
-    if not prof:
+    if not await load_profile_async(cible.id):
         await itx.response.send_message(
             f"Aucune fiche trouvée pour **{cible.display_name}**.",
             ephemeral=True
         )
         return
 
-    prof["casier"] = []
-    save_profile(cible.id, prof)
+    async with profile_transaction(cible.id, economy=False) as tx:
+        tx[cible.id]["casier"] = []
 
     await itx.response.send_message(
         f"🧾 Casier judiciaire de {cible.mention} **entièrement effacé** "
@@ -2670,55 +5269,49 @@ async def paye_prime_cmd(
     chasseur: discord.Member,
     etat: app_commands.Choice[str]
 ):
-    # Profil de la cible
-    prof_cible = _ensure_profile_skeleton(cible.id)
-    casier = _ensure_casier_list(prof_cible)
-    total_prime = _total_prime_for_profile(prof_cible)
-
-    if total_prime <= 0:
-        await itx.response.send_message(
-            f"{cible.mention} n'a **aucune prime active** dans son casier.",
-            ephemeral=True
-        )
-        return
-
-    # Profils économiques
-    prof_payeur = _ensure_profile_skeleton(payeur.id)
-    prof_payeur = _ensure_economy_fields(prof_payeur)
-
-    prof_chasseur = _ensure_profile_skeleton(chasseur.id)
-    prof_chasseur = _ensure_economy_fields(prof_chasseur)
-
-    # Montant selon l'état de la cible
-    if etat.value == "vivant":
-        montant = total_prime                   # prime complète vivant
-    else:  # mort
-        montant = total_prime // 2             # moitié si ramené mort
-
-    if montant <= 0:
-        await itx.response.send_message(
-            "Le montant calculé de la prime est nul, opération annulée.",
-            ephemeral=True
-        )
-        return
-
-    # Ajuste les soldes (sur le compte bancaire)
-    prof_payeur["bank"] = int(prof_payeur.get("bank", 0)) - montant
-    prof_chasseur["bank"] = int(prof_chasseur.get("bank", 0)) + montant
+    async with profile_transaction(payeur.id, cible.id, chasseur.id) as tx:
+        # Profil de la cible
+        prof_cible = tx[cible.id]
+        total_prime = _total_prime_for_profile(prof_cible)
+
+        if total_prime <= 0:
+            await itx.response.send_message(
+                f"{cible.mention} n'a **aucune prime active** dans son casier.",
+                ephemeral=True
+            )
+            return
+        casier = _ensure_casier_list(prof_cible)
+
+        # Profils économiques
+        prof_payeur = tx[payeur.id]
+        prof_chasseur = tx[chasseur.id]
+
+        # Montant selon l'état de la cible
+        if etat.value == "vivant":
+            montant = total_prime                   # prime complète vivant
+        else:  # mort
+            montant = total_prime // 2             # moitié si ramené mort
+
+        if montant <= 0:
+            await itx.response.send_message(
+                "Le montant calculé de la prime est nul, opération annulée.",
+                ephemeral=True
+            )
+            return
 
-    # Met toutes les primes à 0 dans le casier de la cible
-    for entry in casier:
-        try:
-            p = int(entry.get("prime", 0) or 0)
-        except Exception:
-            p = 0
-        if p > 0:
-            entry["prime"] = 0
-    prof_cible["casier"] = casier
+        # Ajuste les soldes (sur le compte bancaire)
+        prof_payeur["bank"] = int(prof_payeur.get("bank", 0)) - montant
+        prof_chasseur["bank"] = int(prof_chasseur.get("bank", 0)) + montant
 
-    save_profile(payeur.id, prof_payeur)
-    save_profile(chasseur.id, prof_chasseur)
-    save_profile(cible.id, prof_cible)
+        # Met toutes les primes à 0 dans le casier de la cible
+        for entry in casier:
+            try:
+                p = int(entry.get("prime", 0) or 0)
+            except Exception:
+                p = 0
+            if p > 0:
+                entry["prime"] = 0
+        prof_cible["casier"] = casier
 
     etat_label = "ramené **vivant**" if etat.value == "vivant" else "ramené **mort**"
     await itx.response.send_message(
@@ -2735,15 +5328,9 @@ async def paye_prime_cmd(
     description="Afficher le tableau des primes en cours (par montant décroissant)."
 )
 async def tableau_primes_cmd(itx: discord.Interaction):
-    entries: List[Tuple[int, dict, int]] = []
-    all_prof = _iter_all_profiles()
-    for uid, prof in all_prof:
-        total_p = _total_prime_for_profile(prof)
-        if total_p > 0:
-            entries.append((uid, prof, total_p))
-
-    # Tri décroissant par montant de prime total
-    entries.sort(key=lambda t: t[2], reverse=True)
+    # Primes actives, triées par montant décroissant
+    await IO_POOL.run(flush_profiles)
+    entries: List[Tuple[int, int]] = await IO_POOL.run(PROFILE_STORE.bounties)
 
     emb = discord.Embed(
         title="Tableau des primes",
@@ -2764,7 +5351,7 @@ async def tableau_primes_cmd(itx: discord.Interaction):
         )
     else:
         lignes = []
-        for rang, (uid, prof, total_p) in enumerate(entries, start=1):
+        for rang, (uid, total_p) in enumerate(entries, start=1):
             lignes.append(f"{rang}. <@{uid}> — {_fmt_money(total_p)}")
         texte = "\n".join(lignes[:30])  # on limite à 30 lignes pour rester lisible
         emb.add_field(
@@ -2774,11 +5361,7 @@ async def tableau_primes_cmd(itx: discord.Interaction):
         )
 
     # Logo de la police en haut à droite (assets/Police.png)
-    police_logo_path = os.path.join(ASSETS_DIR, "Police.png")
-    file_obj = None
-    if os.path.exists(police_logo_path):
-        file_obj = discord.File(police_logo_path, filename="police.png")
-        emb.set_thumbnail(url="attachment://police.png")
+    file_obj = ASSETS.attach("police", emb)
 
     if file_obj:
         await itx.response.send_message(embed=emb, file=file_obj)
@@ -2801,8 +5384,168 @@ async def sync_cmd(itx: discord.Interaction):
     except Exception as e:
         await itx.response.send_message(f"❌ Erreur de sync : `{e}`", ephemeral=True)
 
+@bot.tree.command(name="diagnostic", description="Statistiques internes du bot (cache des profils…).")
+async def diagnostic_cmd(itx: discord.Interaction):
+    emb = discord.Embed(title="Diagnostic du bot", color=discord.Color.dark_gold())
+
+    cs = PROFILE_CACHE.stats()
+    emb.add_field(
+        name="Cache des profils",
+        value=(
+            f"Entrées : **{cs['size']}** / {cs['capacity']}\n"
+            f"Hits : **{cs['hits']}** • Misses : **{cs['misses']}** ({cs['hit_rate']:.0%})\n"
+            f"Évictions : {cs['evictions']}"
+        ),
+        inline=False
+    )
+
+    ws = PROFILE_WRITE_STATS
+    emb.add_field(
+        name="Écritures des profils",
+        value=(
+            f"Sauvegardes demandées : **{ws['saves']}**\n"
+            f"Écritures disque : **{ws['writes']}** • Inchangées : {ws['unchanged']} • Fusionnées : {ws['coalesced']}\n"
+            f"En attente : {cs['dirty']} • Erreurs : {ws['errors']} • fsync ({PROFILE_FSYNC}) : {ws['fsyncs']}\n"
+            f"Récupérés depuis la dernière copie : {ws['recovered']} • Irrécupérables : {ws['lost']}"
+        ),
+        inline=False
+    )
+
+    rs = CARD_RENDERER.stats()
+    emb.add_field(
+        name="Rendu des cartes",
+        value=(
+            f"En cours : **{rs['active']}** / {rs['concurrency']} • En file : {rs['queued']} / {rs['max_queue']}\n"
+            f"Rendues : **{rs['renders']}** • Mises en file : {rs['queued_total']} • Refusées : {rs['rejected']} • Échecs : {rs['failed']}\n"
+            f"Moy. : attente {rs['avg_wait_ms']:.0f} ms • composition {rs['avg_compose_ms']:.0f} ms • encodage {rs['avg_encode_ms']:.0f} ms\n"
+            f"Total moy. / p95 : {rs['avg_total_ms']:.0f} / {rs['p95_total_ms']:.0f} ms"
+        ),
+        inline=False
+    )
+
+    su = SESSION_UPDATES.stats()
+    emb.add_field(
+        name="Messages de session",
+        value=(
+            f"Clics : **{su['requests']}** • Éditions : **{su['edits']}** • Économisées : {su['saved']}\n"
+            f"En attente : {su['pending']} • Erreurs : {su['errors']} • Fenêtre : {SESSION_EDIT_WINDOW:g} s"
+        ),
+        inline=False
+    )
+
+    cd = COOLDOWNS.stats()
+    emb.add_field(
+        name="Délais (cooldowns)",
+        value=(
+            f"Actifs : **{cd['timers']}** ({cd['players']} joueur(s)) • Tas : {cd['heap']}\n"
+            f"Refus sans lecture de fiche : **{cd['fast_rejects']}** • Rappels : {cd['notified']} envoyé(s), {cd['notify']} abonné(s)"
+        ),
+        inline=False
+    )
+
+    bk = BACKUP_STATS
+    emb.add_field(
+        name="Sauvegardes",
+        value=(
+            f"Complètes : **{bk['full']}** • Deltas : **{bk['delta']}** • Sans changement : {bk['skipped']}\n"
+            f"Envoyé : {bk['bytes'] / 1024:.0f} Ko en {bk['volumes']} volume(s) • Dernière : {bk['last'] or '—'} • "
+            f"Point de reprise toutes les {BACKUP_FULL_EVERY_HOURS:g} h"
+        ),
+        inline=False
+    )
+
+    sl = SESSION_LIFECYCLE.stats()
+    last_sweep = sl["last_run"].strftime("%H:%M") if sl["last_run"] else "—"
+    emb.add_field(
+        name="Sessions",
+        value=(
+            f"En mémoire : **{sl['live']}** (≈ {sl['memory_bytes'] / 1024:.1f} Ko) • Sur disque seulement : {sl['stored_idle']}\n"
+            f"Expirées : **{sl['expired']}** • Boutons désactivés : {sl['disabled']} • Erreurs : {sl['errors']}\n"
+            f"Archive : {sl['archived']} résumé(s) • Durée de vie : {SESSION_TTL_HOURS:g} h après le lancement • Dernier passage : {last_sweep}"
+        ),
+        inline=False
+    )
+
+    gi = GUILD_ICON_STATS
+    emb.add_field(
+        name="Icône de la guilde (sessions)",
+        value=(
+            f"Téléchargements : **{gi['downloads']}** • Depuis le cache : {gi['hits']} "
+            f"• Pièce jointe réutilisée : {gi['reused_attachments']}"
+        ),
+        inline=False
+    )
+
+    as_ = ASSETS.stats()
+    emb.add_field(
+        name="Logos des embeds",
+        value=(
+            f"En mémoire : **{as_['loaded']}** • URL en cache valides : {as_['cached_urls']}\n"
+            f"Via URL : **{as_['url_hits']}** • Fichier joint : {as_['file_fallbacks']} "
+            f"• Envois : {as_['uploads']} • Rafraîchissements : {as_['refreshes']}"
+        ),
+        inline=False
+    )
+
+    ps = await IO_POOL.run(PORTRAITS.stats)
+    emb.add_field(
+        name="Portraits enregistrés",
+        value=(
+            f"Joueurs : **{ps['users']}** • Fichiers : {ps['files']} ({ps['bytes'] / (1024 * 1024):.1f} Mo)\n"
+            f"Réutilisés : **{PORTRAIT_STATS['reused']}** • Avatars téléchargés : {PORTRAIT_STATS['avatar_fetches']} "
+            f"• Photos envoyées : {PORTRAIT_STATS['uploads']}"
+        ),
+        inline=False
+    )
+
+    for pool in (IO_POOL, CPU_POOL):
+        ps = pool.stats()
+        emb.add_field(
+            name=f"Délestage {pool.name} ({pool.kind})",
+            value=(
+                f"Workers : **{ps['workers']}** • En cours : {ps['in_flight']} • En file : {ps['queued']} (pic {ps['peak_in_flight']})\n"
+                f"Terminées : **{ps['completed']}** • Échecs : {ps['failed']}\n"
+                f"Attente moy./max : {ps['avg_wait_ms']:.1f} / {ps['max_wait_ms']:.1f} ms • Exécution moy. : {ps['avg_run_ms']:.1f} ms"
+            ),
+            inline=False
+        )
+
+    await itx.response.send_message(embed=emb, ephemeral=True)
+
 @bot.event
 async def setup_hook():
+    # Première mise en route du backend SQLite : import des anciens profils JSON
+    if isinstance(PROFILE_STORE, SqliteProfileStore):
+        migrate_json_profiles_to_sqlite(PROFILE_STORE)
+
+    # Premier worker de rendu démarré (et ses polices chargées) avant la première carte
+    if PIL_AVAILABLE:
+        try:
+            await CPU_POOL.run(_prewarm_card_fonts)
+        except Exception as e:
+            print("[RENDU][ERREUR] Préchauffage des polices :", e)
+
+    # Boutons des sessions : vue persistante, valable aussi pour les messages
+    # publiés avant le redémarrage (l'état est relu au premier clic)
+    global SESSION_VIEW
+    SESSION_VIEW = SessionView()
+    bot.add_view(SESSION_VIEW)
+
+    # Logos des embeds en mémoire
+    await IO_POOL.run(ASSETS.load)
+
+    # Classement des fortunes en mémoire (une lecture complète, une seule fois)
+    n = await IO_POOL.run(build_wealth_index)
+    print(f"[CLASSEMENT] {n} profil(s) indexé(s).")
+
+    # Délais de /crime, /robb, /blanchiment et /work en mémoire
+    n = await IO_POOL.run(build_cooldown_index)
+    print(f"[DÉLAIS] {n} délai(s) en cours.")
+
+    # Écriture différée des profils
+    if PROFILE_WRITE_DELAY > 0 and not profile_flusher.is_running():
+        profile_flusher.start()
+
     try:
         if GUILD_ID:
             guild = discord.Object(id=int(GUILD_ID))
@@ -2816,43 +5559,87 @@ async def setup_hook():
         print("[SYNC][ERREUR]", e)
 
 # ========= PURGE DES DONNÉES À LA SORTIE DU SERVEUR =========
-@bot.event
-async def on_member_remove(member: discord.Member):
-    try:
-        # 1) Supprimer le profil JSON (le retire de facto du leaderboard)
-        prof_path = profile_path_for(member.id)
-        if os.path.exists(prof_path):
-            os.remove(prof_path)
-
-        # 2) Supprimer la carte PNG
-        carte_path = card_path_for(member.id)
+def _purge_member_files(user_id: int) -> None:
+    """Supprime profil, carte et photos temporaires (exécuté dans IO_POOL)."""
+    # 1) Supprimer le profil JSON (le retire de facto du leaderboard)
+    forget_profile(user_id)
+
+    # 2) Supprimer la carte (tous formats)
+    for ext in set(CARD_FORMATS.values()):
+        carte_path = os.path.join(CARDS_DIR, f"{user_id}{ext}")
         if os.path.exists(carte_path):
             os.remove(carte_path)
 
-        # 3) Nettoyer d'éventuelles photos temporaires
-        for ext in (".png", ".jpg", ".jpeg", ".webp"):
-            temp_photo = os.path.join(ASSETS_DIR, f"photo_{member.id}{ext}")
-            if os.path.exists(temp_photo):
-                try:
-                    os.remove(temp_photo)
-                except Exception:
-                    pass
+    # 3) Supprimer les couches de rendu de la carte et le portrait enregistré
+    shutil.rmtree(card_layers_dir_for(user_id), ignore_errors=True)
+    PORTRAITS.remove(user_id)
+
+    # 4) Nettoyer d'éventuelles photos temporaires (anciennes versions du bot)
+    for ext in (".png", ".jpg", ".jpeg", ".webp"):
+        temp_photo = os.path.join(ASSETS_DIR, f"photo_{user_id}{ext}")
+        if os.path.exists(temp_photo):
+            try:
+                os.remove(temp_photo)
+            except Exception:
+                pass
 
+@bot.event
+async def on_member_remove(member: discord.Member):
+    try:
+        await IO_POOL.run(_purge_member_files, member.id)
         print(f"[CLEANUP] Données purgées pour l’ex-membre {member} (ID {member.id}).")
     except Exception as e:
         print(f"[CLEANUP][ERREUR] Impossible de purger {member.id} : {e}")
 
+@bot.event
+async def on_guild_update(before: discord.Guild, after: discord.Guild):
+    # Nouvelle icône : la prochaine session la re-téléchargera
+    if before.icon != after.icon:
+        _GUILD_ICON_CACHE.pop(after.id, None)
+
 @bot.event
 async def on_ready():
     print(f"Connecté en tant que {bot.user} (ID: {bot.user.id})")
     # Démarre la sauvegarde automatique si ce n'est pas déjà le cas
     if not auto_backup.is_running():
         auto_backup.start()
+    # Logos envoyés une fois dans le salon de cache, URL renouvelées toutes les heures
+    if not asset_refresher.is_running():
+        asset_refresher.start()
+    # Expiration des sessions passées (boutons désactivés, mémoire libérée)
+    if not session_reaper.is_running():
+        session_reaper.start()
+    # Fins de délai : libération de la mémoire et rappels en MP
+    global _COOLDOWN_TASK
+    if _COOLDOWN_TASK is None or _COOLDOWN_TASK.done():
+        _COOLDOWN_TASK = asyncio.create_task(COOLDOWNS.run(bot))
+    # Reprend un re-rendu des cartes interrompu par un redémarrage
+    _resume_rerender_job()
 
 if __name__ == "__main__":
+    if "--migrate-profiles" in sys.argv:
+        # Migration manuelle : python bot.py --migrate-profiles
+        migrate_json_profiles_to_sqlite(
+            PROFILE_STORE if isinstance(PROFILE_STORE, SqliteProfileStore) else SqliteProfileStore(PROFILES_DB_PATH),
+            force=True
+        )
+        sys.exit(0)
     if not TOKEN:
         raise RuntimeError("TOKEN manquant dans .env (UTF-8)")
-    bot.run(TOKEN)
+
+    # Render arrête le service par SIGTERM : on le traite comme un Ctrl+C
+    # pour que bot.run() ferme proprement, puis on vide les écritures en attente.
+    def _on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    try:
+        bot.run(TOKEN)
+    finally:
+        n = flush_profiles()
+        print(f"[ARRÊT] {n} profil(s) écrit(s) avant extinction.")
+        IO_POOL.shutdown()
+        CPU_POOL.shutdown()
 
 
 